@@ -9,13 +9,149 @@ Date: 23/01/2025
 """
 
 import json
+import os
+import yaml
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+try:
+    from .kg_model import RELATION_GROUPS, as_graph
+except ImportError:
+    from kg_model import RELATION_GROUPS, as_graph
+
+# Top-level JSON keys explicitly mapped to the structure they must have
+REQUIRED_KEYS = {
+    'pollutants': dict,
+    'pollution_sources': dict,
+    'mitigation_measures': dict,
+    'meteorological_factors': list,
+    'street_canyons': list,
+    'pollutant_source_relations': list,
+    'source_mitigation_relations': list,
+    'meteorological_dispersion_relations': list,
+    'street_canyon_dispersion_relations': list,
+}
+
+# Categorised entity groups explicitly mapped to the ontology class whose enum lists their categories
+CATEGORY_CLASSES = {
+    'pollutants': 'Pollutant',
+    'pollution_sources': 'PollutionSource',
+    'mitigation_measures': 'MitigationMeasure',
+}
+
+# Entity groups and relation categories explicitly mapped to the names used in messages
+ENTITY_KINDS = {
+    'pollutants': 'pollutant',
+    'pollution_sources': 'source',
+    'mitigation_measures': 'mitigation measure',
+    'meteorological_factors': 'meteorological factor',
+    'street_canyons': 'street canyon factor',
+}
+RELATION_NAMES = {
+    'pollutant_source_relations': 'pollutant-source',
+    'source_mitigation_relations': 'source-mitigation',
+    'meteorological_dispersion_relations': 'meteorological dispersion',
+    'street_canyon_dispersion_relations': 'street canyon dispersion',
+}
+
+# Rules reported as warnings; every other rule makes a file invalid
+WARNING_RULES = {'unexpected_key'}
+
+# Rules compiled by the process pool initializer, so they are sent to each worker once
+_WORKER_RULES = None
+
 def load_json(filepath):
     """Explicitly load JSON data from a given file path."""
     with open(filepath, 'r', encoding='utf-8') as file:
         return json.load(file)
 
+def compile_rules(ontology_yaml_path):
+    """
+    Compile the validation rules of an ontology once: the permitted category
+    names of each categorised entity group (from the ontology enums) and the
+    required top-level structure.
+
+    Args:
+        ontology_yaml_path (str or Path): Path to the YAML ontology.
+
+    Returns:
+        dict: {"categories": {group: set of enum values}, "required": {key: type}}.
+    """
+    with open(ontology_yaml_path, 'r', encoding='utf-8') as file:
+        ontology = yaml.safe_load(file)
+
+    enums = ontology.get('enums', {})
+    categories = {}
+    for group, class_name in CATEGORY_CLASSES.items():
+        attributes = ontology['classes'][class_name].get('attributes', {})
+        enum_names = [spec['range'] for spec in attributes.values() if spec and spec.get('range') in enums]
+        categories[group] = {value for enum_name in enum_names
+                             for value in enums[enum_name].get('permissible_values', {})}
+    return {'categories': categories, 'required': dict(REQUIRED_KEYS)}
+
+def _issue(rule, entity, message):
+    return {'rule': rule, 'entity': entity, 'message': message}
+
+def find_issues(data, rules=None):
+    """
+    Explicitly check one JSON document and return structured issues.
+
+    The document is parsed once into a `KnowledgeGraph`, so every entity
+    reference is checked with an O(1) lookup. Relations may use either the
+    canonical shape or the prompt-hints shape
+    ({"meteorological_factor": str, "pollutants": [...]} and {"street_canyon_factor": str, ...}).
+
+    Args:
+        data (dict or KnowledgeGraph): The JSON data containing entities and relationships.
+        rules (dict, optional): Rules from `compile_rules`; without them,
+            category names are not checked against the ontology enums.
+
+    Returns:
+        list: Issue dicts with "rule", "entity" and "message".
+    """
+    graph = as_graph(data)
+    issues = []
+
+    if None in graph.invalid_keys:
+        return [_issue('structure', None, "Top-level JSON value is not an object.")]
+
+    # Explicit structure checks; a broken section is treated as empty so the rest is still checked
+    for key, expected_type in (rules['required'] if rules else REQUIRED_KEYS).items():
+        if key in graph.missing_keys:
+            issues.append(_issue('missing_key', key, f"Missing top-level key: '{key}'."))
+        elif key in graph.invalid_keys:
+            issues.append(_issue('structure', key, f"Top-level key '{key}' should be a {expected_type.__name__}."))
+    for key in graph.extra:
+        issues.append(_issue('unexpected_key', key, f"Unexpected top-level key: '{key}'."))
+
+    # Explicitly check category names against the ontology enums
+    if rules:
+        for group, permitted in rules['categories'].items():
+            for category in graph.categories(group):
+                if category not in permitted:
+                    issues.append(_issue('unknown_category', category,
+                                         f"Unknown category '{category}' in {group}; expected one of "
+                                         f"{', '.join(sorted(permitted))}."))
+
+    for section, value in graph.malformed:
+        if section in RELATION_NAMES:
+            issues.append(_issue('malformed_relation', None,
+                                 f"Malformed {RELATION_NAMES[section]} relation: {json.dumps(value)}."))
+        else:
+            issues.append(_issue('malformed_entity', None, f"Malformed entity in {section}: {json.dumps(value)}."))
+
+    # Explicit validation: every relation endpoint must be a declared entity of its group
+    for rel_category, groups in RELATION_GROUPS.items():
+        relation_name = RELATION_NAMES[rel_category]
+        for endpoints in graph.relation_pairs(rel_category):
+            for group, entity in zip(groups, endpoints):
+                if not graph.has_entity(group, entity):
+                    issues.append(_issue('missing_entity', entity,
+                                         f"Missing {ENTITY_KINDS[group]} entity: '{entity}' in {relation_name} relation."))
+
+    return issues
+
 def validate_entities(data):
     """
     Explicitly validate that entities within JSON relations are properly defined in their categories.
@@ -26,58 +162,134 @@ def validate_entities(data):
     Returns:
         list: Explicit list of errors indicating mismatched or missing entities.
     """
-    errors = []
-
-    # Explicitly gather defined entities
-    pollutants = {name for category in data['pollutants'].values() for name in category}
-    sources = {name for category in data['pollution_sources'].values() for name in category}
-    measures = {name for category in data['mitigation_measures'].values() for name in category}
-    meteorological_factors = set(data['meteorological_factors'])
-    street_canyon_factors = set(data['street_canyons'])
-
-    # Explicit validation: pollutant-source relationships
-    for pollutant, source in data['pollutant_source_relations']:
-        if pollutant not in pollutants:
-            errors.append(f"Missing pollutant entity: '{pollutant}' in pollutant-source relation.")
-        if source not in sources:
-            errors.append(f"Missing source entity: '{source}' in pollutant-source relation.")
-
-    # Explicit validation: source-mitigation relationships
-    for source, mitigation in data['source_mitigation_relations']:
-        if source not in sources:
-            errors.append(f"Missing source entity: '{source}' in source-mitigation relation.")
-        if mitigation not in measures:
-            errors.append(f"Missing mitigation measure entity: '{mitigation}' in source-mitigation relation.")
-
-    # Explicit validation: meteorological dispersion relationships
-    for relation in data['meteorological_dispersion_relations']:
-        factor = relation['meteorological_factor']['type']
-        pollutant = relation['pollutant']
-        if factor not in meteorological_factors:
-            errors.append(f"Missing meteorological factor entity: '{factor}' in meteorological dispersion relation.")
-        if pollutant not in pollutants:
-            errors.append(f"Missing pollutant entity: '{pollutant}' in meteorological dispersion relation.")
-
-    # Explicit validation: street canyon dispersion relationships
-    for relation in data['street_canyon_dispersion_relations']:
-        factor = relation['street_canyon_description']
-        pollutant = relation['pollutant']
-        if factor not in street_canyon_factors:
-            errors.append(f"Missing street canyon factor entity: '{factor}' in street canyon dispersion relation.")
-        if pollutant not in pollutants:
-            errors.append(f"Missing pollutant entity: '{pollutant}' in street canyon dispersion relation.")
-
-    return errors
-
-def AQ_Json_validator(json_filepath):
+    return [issue['message'] for issue in find_issues(data) if issue['rule'] not in WARNING_RULES]
+
+def _init_worker(rules):
+    global _WORKER_RULES
+    _WORKER_RULES = rules
+
+def is_knowledge_graph(data):
+    """Return True for JSON shaped like a knowledge graph: an object that is empty or uses a top-level KG key."""
+    return isinstance(data, dict) and (not data or any(key in data for key in REQUIRED_KEYS))
+
+def _validate_file(filepath, scanned=False):
+    """
+    Validate one file in a pool worker; returns (filepath, issues), or (filepath, None)
+    for a file found by a directory scan that is not a knowledge graph.
+    """
+    try:
+        data = load_json(filepath)
+    except (OSError, UnicodeDecodeError, json.JSONDecodeError) as error:
+        return filepath, [_issue('invalid_json', None, f"Could not read JSON: {error}")]
+    if scanned and not is_knowledge_graph(data):
+        return filepath, None
+    return filepath, find_issues(data, _WORKER_RULES)
+
+def iter_json_files(inputs, pattern="*.json"):
+    """Yield JSON file paths from a directory (recursively), a single file or an iterable of paths."""
+    if isinstance(inputs, (str, Path)):
+        inputs = Path(inputs)
+        if inputs.is_dir():
+            yield from sorted(inputs.rglob(pattern))
+        else:
+            yield inputs
+        return
+    for path in inputs:
+        yield Path(path)
+
+def iter_file_issues(filepaths, rules, max_workers=None, chunksize=16, scanned=False):
+    """
+    Validate files across a process pool, yielding (filepath, issues) in input order.
+
+    Args:
+        filepaths (list of str): JSON files to validate.
+        rules (dict): Rules from `compile_rules`, handed to each worker when it starts.
+        max_workers (int, optional): Worker processes (defaults to the CPU count).
+        chunksize (int): Files sent to a worker at a time.
+        scanned (bool): Whether the files came from a directory scan; those that are
+            not knowledge graphs then yield None instead of a list of issues.
+    """
+    filepaths = list(filepaths)
+    if not filepaths:
+        return
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=(rules,)) as executor:
+        yield from executor.map(_validate_file, filepaths, [scanned] * len(filepaths), chunksize=chunksize)
+
+def validate_corpus(inputs, ontology_yaml_path, report_filepath=None, max_workers=None, chunksize=16):
+    """
+    Validate many extracted JSON files across a process pool.
+
+    The ontology rules are compiled once and handed to each worker when it
+    starts. Results are streamed as they arrive, one JSONL record per issue:
+    {"file", "rule", "entity", "severity", "message"}.
+
+    When `inputs` is a directory, JSON files in it that are not knowledge graphs
+    (see `is_knowledge_graph`, e.g. evaluation query lists) are skipped and
+    counted; files passed explicitly are always validated.
+
+    Args:
+        inputs (str, Path or iterable): Directory of JSON files, one file, or an iterable of paths.
+        ontology_yaml_path (str or Path): Path to the YAML ontology.
+        report_filepath (str or Path, optional): JSONL file to write the issues to.
+        max_workers (int, optional): Worker processes (defaults to the CPU count).
+        chunksize (int): Files sent to a worker at a time.
+
+    Returns:
+        dict: Aggregate counts ("files", "valid_files", "invalid_files", "skipped_files", "errors",
+        "warnings", "by_rule").
+    """
+    rules = compile_rules(ontology_yaml_path)
+    filepaths = [str(path) for path in iter_json_files(inputs)]
+    scanned = isinstance(inputs, (str, Path)) and Path(inputs).is_dir()
+    summary = {'files': 0, 'valid_files': 0, 'invalid_files': 0, 'skipped_files': 0, 'errors': 0, 'warnings': 0}
+    by_rule = Counter()
+
+    report = open(report_filepath, 'w', encoding='utf-8') if report_filepath else None
+    try:
+        for filepath, issues in iter_file_issues(filepaths, rules, max_workers, chunksize, scanned):
+            if issues is None:
+                summary['skipped_files'] += 1
+                continue
+            summary['files'] += 1
+            errors = 0
+            for issue in issues:
+                severity = 'warning' if issue['rule'] in WARNING_RULES else 'error'
+                errors += severity == 'error'
+                summary[f'{severity}s'] += 1
+                by_rule[issue['rule']] += 1
+                if report is not None:
+                    report.write(json.dumps({'file': filepath, 'rule': issue['rule'], 'entity': issue['entity'],
+                                             'severity': severity, 'message': issue['message']}) + "\n")
+            summary['valid_files' if not errors else 'invalid_files'] += 1
+    finally:
+        if report is not None:
+            report.close()
+
+    summary['by_rule'] = dict(by_rule)
+    status = "✅" if not summary['invalid_files'] else "🚨"
+    print(f"{status} Validated {summary['files']} files: {summary['valid_files']} valid, "
+          f"{summary['invalid_files']} invalid ({summary['errors']} errors, {summary['warnings']} warnings)")
+    for rule, count in by_rule.most_common():
+        print(f"- {rule}: {count}")
+    if summary['skipped_files']:
+        print(f"⚠️ Skipped {summary['skipped_files']} JSON files that are not knowledge graphs")
+    return summary
+
+def AQ_Json_validator(json_filepath, ontology_yaml_path=None):
     """
     Main function to explicitly validate JSON data and print validation results.
 
     Args:
         json_filepath (str or Path): Path to the JSON file to validate.
+        ontology_yaml_path (str or Path, optional): Also check category names against the ontology enums.
     """
     data = load_json(json_filepath)
-    errors = validate_entities(data)
+    if ontology_yaml_path is None:
+        errors = validate_entities(data)
+    else:
+        rules = compile_rules(ontology_yaml_path)
+        errors = [issue['message'] for issue in find_issues(data, rules) if issue['rule'] not in WARNING_RULES]
 
     if not errors:
         print("✅ JSON validation passed. All entities explicitly match correctly.")
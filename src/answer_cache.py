@@ -0,0 +1,183 @@
+"""
+RAG Answer Cache
+
+Keeps recent question/answer pairs in memory in front of the local RAG chain,
+so repeated and near-identical questions (as issued by a dashboard) are
+answered in milliseconds instead of a full retrieval and LLM generation.
+Questions are matched exactly on their normalised text, then semantically on
+their embedding; entries expire by age and by least-recent use, and the whole
+cache is dropped when the graph or its embeddings change.
+
+Author: Xiang Xie (xiang.xie@ncl.ac.uk)
+Date: 17/10/2026
+"""
+
+import re
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+def normalise_question(question):
+    """Return the exact-match key of a question: lower case, single spaces, no trailing punctuation."""
+    return re.sub(r"\s+", " ", question).strip().lower().rstrip("?!. ")
+
+class AnswerCache:
+    """
+    In-memory LRU/TTL cache of RAG answers with exact and semantic lookup.
+
+    Question embeddings are kept L2-normalised in one `max_entries x dim`
+    float32 matrix, so a semantic lookup is a single matrix-vector product.
+    The cache is meant for one process; it is not persisted.
+
+    Args:
+        max_entries (int): Maximum number of cached answers (least recently used evicted first).
+        ttl (float, optional): Seconds an answer stays valid (None for no expiry).
+        similarity_threshold (float): Minimum cosine similarity for a semantic hit (None disables it).
+        version_fn (callable, optional): Returns the current graph/embedding fingerprint;
+            the cache is cleared when it changes.
+        check_interval (float): Minimum seconds between two `version_fn` calls.
+        clock (callable): Time source in seconds.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600.0, similarity_threshold=0.95, version_fn=None,
+                 check_interval=30.0, clock=time.monotonic):
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer.")
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.version_fn = version_fn
+        self.check_interval = check_interval
+        self.clock = clock
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        self.version = None
+        self._checked = None
+        self._entries = OrderedDict()
+        self._vectors = None
+        self._slot_keys = [None] * max_entries
+        self._free = list(range(max_entries - 1, -1, -1))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_version(self):
+        """Clear the cache when the fingerprint from `version_fn` changed (at most every `check_interval`)."""
+        if self.version_fn is None:
+            return
+        now = self.clock()
+        if self._checked is not None and now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        self.set_version(self.version_fn())
+
+    def set_version(self, version):
+        """Record the graph/embedding fingerprint the answers belong to, clearing them if it changed."""
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        if entry["slot"] is not None:
+            self._vectors[entry["slot"]] = 0.0
+            self._slot_keys[entry["slot"]] = None
+            self._free.append(entry["slot"])
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry["created"] > self.ttl
+
+    def _normalised_vector(self, embedding):
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, question, embedding=None):
+        """
+        Return the cached answer for a question, or None.
+
+        Args:
+            question (str): Natural language question.
+            embedding (array-like or callable, optional): Question embedding for the semantic
+                lookup, or a function returning it (only called when the exact lookup misses).
+
+        Returns:
+            dict or None: {"question", "answer", "sources", "match", "similarity"} where
+            "match" is "exact" or "semantic" and "question" the cached question.
+        """
+        self._check_version()
+        now = self.clock()
+
+        key = normalise_question(question)
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry, now):
+            self._remove(key)
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return {"question": entry["question"], "answer": entry["answer"], "sources": entry["sources"],
+                    "match": "exact", "similarity": 1.0}
+
+        if embedding is not None and self.similarity_threshold is not None and self._vectors is not None:
+            if callable(embedding):
+                embedding = embedding()
+            scores = self._vectors @ self._normalised_vector(embedding)
+            # Free slots hold zero vectors, so only live entries can pass a positive threshold
+            candidates = np.flatnonzero(scores >= self.similarity_threshold)
+            for slot in candidates[np.argsort(-scores[candidates], kind="stable")]:
+                slot_key = self._slot_keys[slot]
+                if slot_key is None:
+                    continue
+                entry = self._entries[slot_key]
+                if self._expired(entry, now):
+                    self._remove(slot_key)
+                    continue
+                self._entries.move_to_end(slot_key)
+                self.semantic_hits += 1
+                return {"question": entry["question"], "answer": entry["answer"], "sources": entry["sources"],
+                        "match": "semantic", "similarity": float(scores[slot])}
+
+        self.misses += 1
+        return None
+
+    def put(self, question, answer, sources=(), embedding=None):
+        """Cache an answer (and the question embedding, enabling semantic hits)."""
+        self._check_version()
+        key = normalise_question(question)
+        if key in self._entries:
+            self._remove(key)
+        while len(self._entries) >= self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+        slot = None
+        if embedding is not None:
+            vector = self._normalised_vector(embedding)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            elif len(vector) != self._vectors.shape[1]:
+                raise ValueError(f"Embedding dimension {len(vector)} does not match cache dimension "
+                                 f"{self._vectors.shape[1]}.")
+            slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._slot_keys[slot] = key
+
+        self._entries[key] = {"question": question, "answer": answer, "sources": list(sources),
+                              "slot": slot, "created": self.clock()}
+
+    def clear(self):
+        """Drop every cached answer."""
+        self._entries.clear()
+        self._slot_keys = [None] * self.max_entries
+        self._free = list(range(self.max_entries - 1, -1, -1))
+        if self._vectors is not None:
+            self._vectors[:] = 0.0
+
+    def stats(self):
+        """Return entry and hit/miss counts."""
+        return {"entries": len(self._entries), "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits, "misses": self.misses}
@@ -0,0 +1,305 @@
+"""
+Persistent Embedding Cache
+
+Stores sentence embeddings on disk so the embedding pipeline, similarity
+search and local RAG modules can reuse vectors for texts they have already
+encoded. Vectors live in a memory-mapped float32 array and a small JSON index
+maps text hashes to array slots in least-recently-used order.
+
+Author: Xiang Xie (xiang.xie@ncl.ac.uk)
+Date: 16/10/2026
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import re
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory file locks (Windows): the cache is then only safe for one process at a time
+    fcntl = None
+
+DEFAULT_CACHE_DIR = Path(os.environ.get(
+    "AQKG_EMBEDDING_CACHE",
+    Path.home() / ".cache" / "urban-air-quality-kg" / "embeddings",
+))
+
+# Vectors `encode` stages before it flushes them (flush() and interpreter exit write the rest)
+FLUSH_EVERY = 256
+
+# Open caches, flushed by one exit hook without keeping them alive
+_OPEN_CACHES = weakref.WeakSet()
+
+def _flush_open_caches():
+    for cache in list(_OPEN_CACHES):
+        cache.flush()
+
+atexit.register(_flush_open_caches)
+
+def text_key(text):
+    """Return the cache key (SHA-256 hex digest) of a text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by (model name, normalisation flag, text hash).
+
+    Each (model, normalisation) pair gets its own directory holding
+    `vectors.f32` (a memory-mapped `capacity x dim` float32 array) and
+    `index.json` (text hash -> slot, oldest first). When `max_entries` is
+    reached, the least recently used slot is overwritten.
+
+    Several processes may share a cache directory. New vectors are staged in
+    memory and written by `flush`, which claims their slots, writes them and
+    replaces the index while holding an exclusive `fcntl` lock on the
+    directory's `lock` file, after re-reading an index another process
+    replaced. Lookups re-read a replaced index under a shared lock, so a slot
+    is never read after another process reused it. Recency updates from
+    lookups are persisted by the next `flush` (at the latest at exit).
+
+    `encode` stages newly encoded vectors and only flushes once `flush_every`
+    are pending, since each flush rewrites the whole index; other processes
+    see them after that flush, an explicit `flush` or interpreter exit. Open
+    caches are flushed at exit without being kept alive; flush a cache before
+    dropping it if it may still hold staged vectors.
+
+    Args:
+        model_name (str): Embedding model identifier.
+        normalize (bool): Whether the cached vectors are L2-normalised.
+        cache_dir (str or Path, optional): Root cache directory
+            (defaults to $AQKG_EMBEDDING_CACHE or ~/.cache/urban-air-quality-kg/embeddings).
+        max_entries (int): Maximum number of cached vectors.
+        flush_every (int): Staged vectors at which `encode` flushes.
+    """
+
+    def __init__(self, model_name, normalize=True, cache_dir=None, max_entries=100_000, flush_every=FLUSH_EVERY):
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer.")
+
+        self.model_name = model_name
+        self.normalize = normalize
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.path = Path(cache_dir or DEFAULT_CACHE_DIR) / f"{slug}-{'norm' if normalize else 'raw'}"
+        self.hits = 0
+        self.misses = 0
+
+        self._dim = None
+        self._capacity = 0
+        self._vectors = None
+        self._entries = OrderedDict()
+        self._free = []
+        self._pending = OrderedDict()   # text hash -> vector staged for the next flush
+        self._touched = OrderedDict()   # text hash -> None, looked up since the last flush (oldest first)
+        self._dirty = False
+        self._index_signature = None
+        with self._locked(exclusive=False):
+            self._refresh()
+        _OPEN_CACHES.add(self)
+
+    def __len__(self):
+        return len(self._entries) + sum(key not in self._entries for key in self._pending)
+
+    @contextmanager
+    def _locked(self, exclusive):
+        """Hold the cache directory's advisory lock (shared or exclusive) across processes."""
+        if fcntl is None:
+            yield
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / "lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Re-read the index (and remap the vectors) if it changed since this process last read or wrote it."""
+        index_path = self.path / "index.json"
+        try:
+            stat = index_path.stat()
+        except FileNotFoundError:
+            return
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature == self._index_signature:
+            return
+        with open(index_path, "r", encoding="utf-8") as file:
+            index = json.load(file)
+        self._index_signature = signature
+        self._dim = index["dim"]
+        self._capacity = index["capacity"]
+        self._entries = OrderedDict(index["entries"])
+        self._vectors = np.memmap(self.path / "vectors.f32", dtype=np.float32, mode="r+",
+                                  shape=(self._capacity, self._dim))
+        # Honour a smaller size cap than the one the cache was written with
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._dirty = True
+        used = set(self._entries.values())
+        self._free = [slot for slot in range(self._capacity - 1, -1, -1) if slot not in used]
+
+    def _reserve(self, needed):
+        """Grow the backing array so it can hold `needed` entries (up to `max_entries`)."""
+        needed = min(needed, self.max_entries)
+        if needed <= self._capacity:
+            return
+        capacity = min(self.max_entries, max(needed, 2 * self._capacity, 1024))
+        self.path.mkdir(parents=True, exist_ok=True)
+        vectors_path = self.path / "vectors.f32"
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        with open(vectors_path, "ab") as file:
+            file.truncate(capacity * self._dim * 4)
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+        self._free = list(range(capacity - 1, self._capacity - 1, -1)) + self._free
+        self._capacity = capacity
+
+    def _free_slot(self):
+        """Return an unused slot, evicting the least recently used entry when full."""
+        if self._free and len(self._entries) < self.max_entries:
+            return self._free.pop()
+        _, slot = self._entries.popitem(last=False)
+        return slot
+
+    def lookup(self, texts):
+        """
+        Look up cached vectors for texts.
+
+        Args:
+            texts (list of str): Texts to look up.
+
+        Returns:
+            list: A float32 vector (copy) per text, or None where the text is not cached.
+        """
+        found = []
+        with self._locked(exclusive=False):
+            self._refresh()
+            for text in texts:
+                key = text_key(text)
+                if key in self._pending:
+                    found.append(np.array(self._pending[key]))
+                    continue
+                slot = self._entries.get(key)
+                if slot is None:
+                    found.append(None)
+                    continue
+                self._entries.move_to_end(key)
+                self._touched[key] = None
+                self._touched.move_to_end(key)
+                found.append(np.array(self._vectors[slot]))
+        return found
+
+    def put_many(self, texts, vectors, flush=True):
+        """
+        Store vectors for texts, evicting least recently used entries when full.
+
+        Pass `flush=False` when storing many batches in a row and call `flush` once at
+        the end; until then the vectors are held in memory (and returned by `lookup`).
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError("Expected one vector per text.")
+        if self._dim is None:
+            self._dim = vectors.shape[1]
+        elif vectors.shape[1] != self._dim:
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match cache dimension {self._dim}.")
+
+        for text, vector in zip(texts, vectors):
+            key = text_key(text)
+            self._pending.pop(key, None)
+            self._pending[key] = vector
+        if flush:
+            self.flush()
+
+    def encode(self, texts, encode_fn):
+        """
+        Return vectors for texts, encoding only the ones missing from the cache.
+
+        Args:
+            texts (list of str): Texts to embed.
+            encode_fn (callable): Encodes a list of texts into an (n, dim) array
+                using the same model and normalisation as this cache.
+
+        Returns:
+            numpy.ndarray: Float32 array of shape (len(texts), dim).
+        """
+        texts = list(texts)
+        found = self.lookup(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, found) if vector is None))
+        self.hits += len(texts) - sum(vector is None for vector in found)
+        self.misses += len(missing)
+
+        if missing:
+            encoded = np.asarray(encode_fn(missing), dtype=np.float32)
+            self.put_many(missing, encoded, flush=len(self._pending) + len(missing) >= self.flush_every)
+            fresh = dict(zip(missing, encoded))
+            found = [fresh[text] if vector is None else vector for text, vector in zip(texts, found)]
+
+        if not found:
+            return np.zeros((0, self._dim or 0), dtype=np.float32)
+        return np.stack(found)
+
+    def flush(self):
+        """
+        Persist staged vectors and recency updates: under the exclusive lock, re-read
+        the index if another process replaced it, claim slots, write the vectors and
+        replace the index.
+        """
+        if not (self._pending or self._touched or self._dirty):
+            return
+        with self._locked(exclusive=True):
+            self._refresh()
+            for key in self._touched:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+            if self._pending:
+                if self._dim is None:
+                    self._dim = len(next(iter(self._pending.values())))
+                self._reserve(len(self._entries) + len(self._pending))
+                for key, vector in self._pending.items():
+                    slot = self._entries.pop(key, None)
+                    if slot is None:
+                        slot = self._free_slot()
+                    self._vectors[slot] = vector
+                    self._entries[key] = slot
+            if self._vectors is not None:
+                self._write_index()
+            self._pending.clear()
+            self._touched.clear()
+            self._dirty = False
+
+    def _write_index(self):
+        """Flush the vectors, then atomically replace the index; call with the exclusive lock held."""
+        self._vectors.flush()
+        index_path = self.path / "index.json"
+        tmp_path = index_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"model_name": self.model_name, "normalize": self.normalize, "dim": self._dim,
+                       "capacity": self._capacity, "entries": self._entries}, file)
+        os.replace(tmp_path, index_path)
+        stat = index_path.stat()
+        self._index_signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def clear(self):
+        """Drop every cached vector for this model and normalisation setting."""
+        self._pending.clear()
+        self._touched.clear()
+        with self._locked(exclusive=True):
+            self._refresh()
+            self._entries.clear()
+            self._free = list(range(self._capacity - 1, -1, -1))
+            if self._vectors is not None:
+                self._write_index()
+            self._dirty = False
@@ -0,0 +1,140 @@
+"""
+Length-Bucketed Parallel Embedding Encoder
+
+Encodes large numbers of node texts on CPU. Texts are sorted by length and
+cut into batches of similar length, so each batch pads to a short maximum;
+the batches are spread over a pool of encoder processes (each loading the
+sentence-transformer once, with its own slice of the CPU threads) and the
+float32 results are streamed back batch by batch, so callers write them out
+as they arrive instead of holding every vector as Python lists.
+
+Author: Xiang Xie (xiang.xie@ncl.ac.uk)
+Date: 17/10/2026
+"""
+
+import collections
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+try:
+    from .runtime import get_sentence_transformer
+except ImportError:
+    from runtime import get_sentence_transformer
+
+DEFAULT_BATCH_SIZE = 64
+
+_worker_model = None
+_worker_settings = None
+
+def length_buckets(texts, batch_size=DEFAULT_BATCH_SIZE, length_fn=len):
+    """
+    Group text positions into batches of similar length, longest first.
+
+    Args:
+        texts (list of str): Texts to encode.
+        batch_size (int): Texts per batch.
+        length_fn (callable): Length of a text (characters by default; a tokenizer's
+            token count gives tighter buckets).
+
+    Returns:
+        list: numpy arrays of text positions, one per batch.
+    """
+    if not len(texts):
+        return []
+    lengths = np.fromiter((length_fn(text) for text in texts), dtype=np.int64, count=len(texts))
+    # Longest first, so the slowest batches start early and the pool drains evenly
+    order = np.argsort(-lengths, kind="stable")
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+def _init_encoder(model_name, normalize, device, n_threads):
+    """Pool initializer: limit this process's CPU threads and load the model once."""
+    global _worker_model, _worker_settings
+    if n_threads:
+        try:
+            import torch
+            torch.set_num_threads(n_threads)
+        except ImportError:
+            pass
+    _worker_model = get_sentence_transformer(model_name, device=device)
+    _worker_settings = {"normalize": normalize}
+
+def _encode_batch(positions, texts):
+    """Encode one bucket in a worker; returns (positions, float32 matrix)."""
+    vectors = _worker_model.encode(texts, batch_size=len(texts), normalize_embeddings=_worker_settings["normalize"],
+                                   convert_to_numpy=True, show_progress_bar=False)
+    return positions, np.ascontiguousarray(vectors, dtype=np.float32)
+
+def encode_stream(texts, model_name, batch_size=DEFAULT_BATCH_SIZE, workers=0, n_threads=None, normalize=True,
+                  device=None, length_fn=len, max_in_flight=None, stats=None):
+    """
+    Encode texts in length-sorted batches, yielding float32 results as they complete.
+
+    With `workers` > 0, batches are encoded by that many processes; at most
+    `max_in_flight` batches are queued or held at once, so a slow consumer
+    bounds memory instead of results piling up. Batches are yielded in
+    submission order (longest texts first), not input order.
+
+    Args:
+        texts (list of str): Texts to encode.
+        model_name (str): Sentence-transformer model.
+        batch_size (int): Texts per batch.
+        workers (int): Encoder processes (0 encodes in this process).
+        n_threads (int, optional): Torch threads per worker (defaults to cores / workers).
+        normalize (bool): L2-normalise the vectors.
+        device (str, optional): Torch device.
+        length_fn (callable): Text length used for bucketing.
+        max_in_flight (int, optional): Batches outstanding at once (defaults to 2 * workers).
+        stats (dict, optional): Filled with "texts", "batches", "seconds" and "texts_per_second".
+
+    Yields:
+        tuple: (positions into `texts`, float32 array of shape (len(positions), dim)).
+    """
+    texts = list(texts)
+    buckets = length_buckets(texts, batch_size, length_fn)
+    started = time.perf_counter()
+    encoded = 0
+
+    def report():
+        if stats is not None:
+            seconds = time.perf_counter() - started
+            stats.update({"texts": encoded, "batches": len(buckets), "seconds": seconds,
+                          "texts_per_second": encoded / seconds if seconds > 0 else 0.0})
+
+    if not buckets:
+        report()
+        return
+
+    if workers < 1:
+        _init_encoder(model_name, normalize, device, n_threads)
+        for positions in buckets:
+            yield _encode_batch(positions, [texts[position] for position in positions])
+            encoded += len(positions)
+            report()
+        return
+
+    if n_threads is None:
+        n_threads = max(1, (os.cpu_count() or 1) // workers)
+    max_in_flight = max_in_flight or 2 * workers
+    # Spawned workers: forking a process that already holds torch threads is unsafe
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers, initializer=_init_encoder,
+                      initargs=(model_name, normalize, device, n_threads)) as pool:
+        in_flight = collections.deque()
+        remaining = iter(buckets)
+        for positions in remaining:
+            in_flight.append(pool.apply_async(_encode_batch, (positions, [texts[position] for position in positions])))
+            if len(in_flight) >= max_in_flight:
+                break
+        while in_flight:
+            positions, vectors = in_flight.popleft().get()
+            next_positions = next(remaining, None)
+            if next_positions is not None:
+                in_flight.append(pool.apply_async(
+                    _encode_batch, (next_positions, [texts[position] for position in next_positions])))
+            yield positions, vectors
+            encoded += len(positions)
+            report()
+    report()
@@ -11,26 +11,44 @@ Date: 08/01/2025
 import yaml
 import json
 import re
-from llama_cpp import Llama
+import collections
+import functools
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
+import weakref
+from llama_cpp import Llama, LlamaGrammar
 from pathlib import Path
 
+try:
+    from .extraction_cache import ExtractionCache, ontology_version, sha256_text
+    from .merge_knowledge import merge_data
+except ImportError:
+    from extraction_cache import ExtractionCache, ontology_version, sha256_text
+    from merge_knowledge import merge_data
+
+DEFAULT_N_CTX = 8192
+DEFAULT_MAX_TOKENS = 4096
+DEFAULT_OVERLAP_TOKENS = 128
+
+# Everything after the text chunk; the static part before it is rendered by `render_prompt_prefix`
+PROMPT_SUFFIX = '''
+"""
+
+Provide ONLY the structured JSON. Do NOT include any additional text.
+'''
+
+# Primed prefix KV states per loaded model (the values must not reference their keys)
+_PREFIX_STATES = weakref.WeakKeyDictionary()
+
 def load_ontology(ontology_path):
     """Load the urban air quality ontology from a YAML file."""
     with open(ontology_path, 'r', encoding='utf-8') as file:
         return yaml.safe_load(file)
 
-def create_body_prompt(text_chunk, ontology_yaml_path, hints_file_path):
-    """
-    Generate an explicit LLM extraction prompt based on a formal YAML ontology and supplemental prompt hints.
-
-    Args:
-        text_chunk (str): The text for structured data extraction.
-        ontology_yaml_path (Path): Path to the ontology YAML file.
-        hints_file_path (Path): Path to the supplemental hints markdown file.
-
-    Returns:
-        str: Explicitly formatted prompt for LLM.
-    """
+@functools.lru_cache(maxsize=8)
+def _render_prompt_prefix(ontology_yaml_path, ontology_mtime, hints_file_path, hints_mtime):
     # Load the YAML ontology explicitly
     ontology = load_ontology(ontology_yaml_path)
 
@@ -54,8 +72,8 @@ def create_body_prompt(text_chunk, ontology_yaml_path, hints_file_path):
         for enum_name, enum_content in enums.items():
             ontology_description += f"  - **{enum_name}**: {', '.join(enum_content.get('permissible_values', {}).keys())}\n"
 
-    # Create the explicit prompt using ontology + hints
-    prompt = f"""
+    # Create the static prompt prefix using ontology + hints; the text chunk follows it
+    return f"""
 You are an environmental knowledge extraction agent.
 
 Your task is to extract structured knowledge explicitly based on the provided ontology definitions and instructions. 
@@ -69,44 +87,966 @@ Additionally, strictly follow the JSON format provided below:
 
 Text:
 \"\"\"
-{text_chunk}
-\"\"\"
-
-Provide ONLY the structured JSON. Do NOT include any additional text.
 """
-    return prompt
 
-def extract_json_from_text(input_txt_path, ontology_yaml_path, hints_file_path, output_json_path, model_path):
+def render_prompt_prefix(ontology_yaml_path, hints_file_path):
+    """
+    Return the static part of the extraction prompt (ontology reference and JSON hints).
+
+    The rendering is memoised per (ontology file, hints file) and their
+    modification times, so editing either file invalidates it.
+    """
+    ontology_yaml_path = Path(ontology_yaml_path).resolve()
+    hints_file_path = Path(hints_file_path).resolve()
+    return _render_prompt_prefix(str(ontology_yaml_path), ontology_yaml_path.stat().st_mtime_ns,
+                                 str(hints_file_path), hints_file_path.stat().st_mtime_ns)
+
+def create_body_prompt(text_chunk, ontology_yaml_path, hints_file_path):
+    """
+    Generate an explicit LLM extraction prompt based on a formal YAML ontology and supplemental prompt hints.
+
+    Args:
+        text_chunk (str): The text for structured data extraction.
+        ontology_yaml_path (Path): Path to the ontology YAML file.
+        hints_file_path (Path): Path to the supplemental hints markdown file.
+
+    Returns:
+        str: Explicitly formatted prompt for LLM.
+    """
+    return render_prompt_prefix(ontology_yaml_path, hints_file_path) + text_chunk + PROMPT_SUFFIX
+
+class PromptPrefixState:
+    """
+    llama.cpp KV state of the static prompt prefix.
+
+    The prefix is evaluated once and its state saved. Before each chunk the
+    state is restored and the prompt is passed as tokens that start with the
+    exact prefix tokens, so llama.cpp's prefix match only evaluates the chunk.
+
+    The state holds no reference to its model (the model is the key it is
+    cached under), so the model is passed to each method.
+    """
+
+    def __init__(self, llm, prefix):
+        self.prefix = prefix
+        self.tokens = llm.tokenize(prefix.encode("utf-8"), add_bos=True, special=True)
+        llm.reset()
+        llm.eval(self.tokens)
+        self.state = llm.save_state()
+
+    def prompt_tokens(self, llm, text_chunk):
+        """Return the full prompt tokens for a chunk: cached prefix tokens plus chunk and suffix."""
+        return self.tokens + llm.tokenize((text_chunk + PROMPT_SUFFIX).encode("utf-8"), add_bos=False, special=True)
+
+    def restore(self, llm):
+        """Load the saved prefix state into the model."""
+        llm.load_state(self.state)
+
+def prefix_state(llm, ontology_yaml_path, hints_file_path):
+    """Return the primed prefix state for a model, re-priming it when the rendered prefix changes."""
+    prefix = render_prompt_prefix(ontology_yaml_path, hints_file_path)
+    state = _PREFIX_STATES.get(llm)
+    if state is None or state.prefix != prefix:
+        state = PromptPrefixState(llm, prefix)
+        _PREFIX_STATES[llm] = state
+    return state
+
+# JSON terminals shared by every compiled extraction grammar
+GBNF_TERMINALS = r'''ws ::= [ \t\n]*
+string ::= "\"" ( [^"\\\x00-\x1f] | "\\" ( ["\\/bfnrt] | "u" [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] ) )* "\"" ws
+string-array ::= "[" ws ( string ( "," ws string )* )? "]" ws'''
+
+def load_hints_example(hints_file_path):
+    """Return the JSON output example embedded in the prompt hints markdown."""
+    with open(hints_file_path, "r", encoding="utf-8") as f:
+        hints = f.read()
+    example_match = re.search(r"```json\s*(\{.*?\})\s*```", hints, re.DOTALL)
+    if not example_match:
+        raise ValueError(f"No ```json example found in {hints_file_path}")
+    return json.loads(example_match.group(1))
+
+def _gbnf_literal(text):
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def _gbnf_quoted(text):
+    """Return a GBNF literal matching `text` as a JSON string token."""
+    return _gbnf_literal(json.dumps(text)) + " ws"
+
+class _GrammarCompiler:
+    """Compile the hints JSON example into GBNF rules, using ontology classes and enums where they apply."""
+
+    def __init__(self, ontology):
+        self.enums = {name: list(content.get("permissible_values", {}))
+                      for name, content in ontology.get("enums", {}).items()}
+        self.classes = ontology.get("classes", {})
+        self.rules = {}
+
+    def _add(self, name, body):
+        self.rules[name] = body
+        return name
+
+    def _object(self, name, fields):
+        members = ' "," ws '.join(f'{_gbnf_quoted(key)} ":" ws {rule}' for key, rule in fields)
+        return self._add(name, f'"{{" ws {members} "}}" ws' if members else '"{" ws "}" ws')
+
+    def _array_of(self, name, item_rule):
+        return self._add(name, f'"[" ws ( {item_rule} ( "," ws {item_rule} )* )? "]" ws')
+
+    def _enum_for_keys(self, keys):
+        """Return the enum whose permissible values cover every key of an example object."""
+        for enum_name, values in self.enums.items():
+            if keys and set(keys) <= set(values):
+                return enum_name
+        return None
+
+    def _class_for_keys(self, keys):
+        """Return the attributes of the ontology class whose attribute names equal the example keys."""
+        for cls_content in self.classes.values():
+            attributes = cls_content.get("attributes", {})
+            if attributes and set(attributes) == set(keys):
+                return attributes
+        return None
+
+    def _attribute_rule(self, name, attribute):
+        enum_values = self.enums.get(attribute.get("range"))
+        if enum_values:
+            value_rule = self._add(f"{name}-value", " | ".join(_gbnf_quoted(value) for value in enum_values))
+        else:
+            value_rule = "string"
+        if attribute.get("multivalued"):
+            return "string-array" if value_rule == "string" else self._array_of(name, value_rule)
+        return value_rule
+
+    def compile(self, name, example):
+        """Return the rule name matching values shaped like `example`."""
+        if isinstance(example, dict):
+            enum_name = self._enum_for_keys(list(example))
+            if enum_name:
+                # Category objects always list every permissible enum value, in ontology order
+                return self._object(name, [(value, "string-array") for value in self.enums[enum_name]])
+            attributes = self._class_for_keys(list(example))
+            if attributes:
+                return self._object(name, [(key, self._attribute_rule(f"{name}-{key.replace('_', '-')}", attributes[key]))
+                                           for key in example])
+            return self._object(name, [(key, self.compile(f"{name}-{key.replace('_', '-')}", value))
+                                       for key, value in example.items()])
+        if isinstance(example, list):
+            if not example or isinstance(example[0], str):
+                return "string-array"
+            if isinstance(example[0], list):
+                # Fixed-length tuples such as [pollutant, source]
+                members = ' "," ws '.join("string" for _ in example[0])
+                return self._array_of(name, self._add(f"{name}-item", f'"[" ws {members} "]" ws'))
+            return self._array_of(name, self.compile(f"{name}-item", example[0]))
+        return "string"
+
+@functools.lru_cache(maxsize=8)
+def _build_json_grammar(ontology_yaml_path, ontology_mtime, hints_file_path, hints_mtime):
+    compiler = _GrammarCompiler(load_ontology(ontology_yaml_path))
+    compiler.compile("root", load_hints_example(hints_file_path))
+    rules = [f"{name} ::= {body}" for name, body in compiler.rules.items()]
+    # llama.cpp starts from `root`, so it goes first
+    rules.sort(key=lambda rule: not rule.startswith("root ::="))
+    return "\n".join(rules + [GBNF_TERMINALS]) + "\n"
+
+def build_json_grammar(ontology_yaml_path, hints_file_path):
+    """
+    Compile a GBNF decoding grammar for the extraction output.
+
+    The structure follows the JSON example in the prompt hints. Category
+    objects take their keys from the matching ontology enum, and relation
+    objects take their fields from the ontology class with the same attributes.
+    Memoised per file path and modification time.
+    """
+    ontology_yaml_path = Path(ontology_yaml_path).resolve()
+    hints_file_path = Path(hints_file_path).resolve()
+    return _build_json_grammar(str(ontology_yaml_path), ontology_yaml_path.stat().st_mtime_ns,
+                               str(hints_file_path), hints_file_path.stat().st_mtime_ns)
+
+@functools.lru_cache(maxsize=8)
+def _load_llama_grammar(grammar_text):
+    return LlamaGrammar.from_string(grammar_text, verbose=False)
+
+class JsonObjectScanner:
+    """
+    Find the first complete top-level JSON object in streamed text.
+
+    The scanner keeps its depth, in-string and escape state between `feed`
+    calls, so every streamed piece is scanned once. A "{" only counts as the
+    start of the object if the text up to its matching "}" parses as JSON;
+    otherwise (e.g. braces in prose the model wrote before the JSON) scanning
+    resumes at the next "{" after it.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.begin = None
+        self.position = 0
+        self.depth = 0
+        self.in_string = self.escaped = False
+
+    def feed(self, piece):
+        """Add streamed text; return the JSON object text once it closes, or None while it is still open."""
+        self.text += piece
+        text = self.text
+        while True:
+            if self.begin is None:
+                begin = text.find("{", self.position)
+                if begin < 0:
+                    self.position = len(text)
+                    return None
+                self.begin, self.position, self.depth = begin, begin, 0
+                self.in_string = self.escaped = False
+            candidate_end = self._scan(text)
+            if candidate_end is None:
+                return None
+            candidate = text[self.begin:candidate_end]
+            try:
+                json.loads(candidate)
+                return candidate
+            except json.JSONDecodeError:
+                self.position = self.begin + 1
+                self.begin = None
+
+    def _scan(self, text):
+        """Advance over `text` from the saved position; return the index past the closing "}" or None."""
+        depth, in_string, escaped = self.depth, self.in_string, self.escaped
+        for position in range(self.position, len(text)):
+            char = text[position]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    return position + 1
+        self.position, self.depth, self.in_string, self.escaped = len(text), depth, in_string, escaped
+        return None
+
+def stream_json_object(llm, prompt, max_tokens=DEFAULT_MAX_TOKENS, grammar=None):
+    """
+    Stream a completion and stop as soon as the top-level JSON object closes.
+
+    Returns:
+        tuple: (JSON object text or None, number of streamed tokens).
+    """
+    scanner = JsonObjectScanner()
+    n_tokens = 0
+    for chunk in llm(prompt, max_tokens=max_tokens, stream=True, grammar=grammar):
+        n_tokens += 1
+        json_text = scanner.feed(chunk["choices"][0]["text"])
+        if json_text is not None:
+            return json_text, n_tokens
+    return None, n_tokens
+
+def load_llm(model_path, n_ctx=DEFAULT_N_CTX, n_threads=None):
+    """Load a gguf model once so it can be reused for every chunk and document."""
+    return Llama(model_path=str(model_path), n_ctx=n_ctx, n_threads=n_threads)
+
+class LazyLlama:
+    """
+    A gguf model that is only loaded when it is first used.
+
+    `model_path` and `n_ctx()` are answered without loading, so cache keys can
+    be computed (and a fully cached run completed) without reading the
+    weights. Every other attribute is forwarded to the loaded `Llama`.
+    """
+
+    def __init__(self, model_path, n_ctx=DEFAULT_N_CTX, n_threads=None):
+        self.model_path = str(model_path)
+        self._n_ctx = n_ctx
+        self._n_threads = n_threads
+        self._llm = None
+
+    @property
+    def loaded(self):
+        return self._llm is not None
+
+    def n_ctx(self):
+        return self._n_ctx if self._llm is None else self._llm.n_ctx()
+
+    def __getattr__(self, name):
+        if self._llm is None:
+            self._llm = load_llm(self.model_path, n_ctx=self._n_ctx, n_threads=self._n_threads)
+        return getattr(self._llm, name)
+
+    def __call__(self, *args, **kwargs):
+        # Special methods are looked up on the type, so generation is forwarded explicitly
+        return self.__getattr__("__call__")(*args, **kwargs)
+
+def count_tokens(llm, text):
+    """Return the number of model tokens in a text (without BOS)."""
+    return len(llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+def chunk_budget(llm, ontology_yaml_path, hints_file_path, max_tokens=DEFAULT_MAX_TOKENS):
+    """
+    Return how many text tokens fit in one prompt: the context window minus the
+    ontology prompt (rendered with an empty chunk) and the generation budget.
+    """
+    # Tokenizing is enough to size the prompt; the prefix is only evaluated once a chunk needs the model
+    prefix = render_prompt_prefix(ontology_yaml_path, hints_file_path)
+    prompt_tokens = (len(llm.tokenize(prefix.encode("utf-8"), add_bos=True, special=True)) +
+                     len(llm.tokenize(PROMPT_SUFFIX.encode("utf-8"), add_bos=False, special=True)))
+    budget = llm.n_ctx() - prompt_tokens - max_tokens
+    if budget <= 0:
+        raise ValueError(f"No room for text: the prompt uses {prompt_tokens} tokens and max_tokens is "
+                         f"{max_tokens}, but n_ctx is only {llm.n_ctx()}.")
+    return budget
+
+def chunk_text(text, llm, max_chunk_tokens, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
+    """
+    Split a text into token windows that each fit the prompt budget.
+
+    Args:
+        text (str): Document text.
+        llm (Llama): Model whose tokenizer is used.
+        max_chunk_tokens (int): Maximum tokens per chunk.
+        overlap_tokens (int): Tokens shared between consecutive chunks, so
+            statements on a boundary are seen whole at least once.
+
+    Returns:
+        list: Chunk texts.
+    """
+    if overlap_tokens >= max_chunk_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_chunk_tokens.")
+
+    tokens = llm.tokenize(text.encode("utf-8"), add_bos=False)
+    if len(tokens) <= max_chunk_tokens:
+        return [text] if text.strip() else []
+
+    chunks = []
+    step = max_chunk_tokens - overlap_tokens
+    for start in range(0, len(tokens), step):
+        window = tokens[start:start + max_chunk_tokens]
+        chunks.append(llm.detokenize(window).decode("utf-8", errors="ignore"))
+        if start + max_chunk_tokens >= len(tokens):
+            break
+    return chunks
+
+def extraction_cache_key(cache, llm, text, ontology_yaml_path, hints_file_path, max_tokens, use_grammar,
+                         overlap_tokens=DEFAULT_OVERLAP_TOKENS, scope="chunk"):
+    """
+    Return the extraction cache key for a chunk (or, with `scope="document"`, a whole
+    document): text, rendered prompt, model file hash and chunking and sampling parameters.
+    """
+    prompt_text = render_prompt_prefix(ontology_yaml_path, hints_file_path) + PROMPT_SUFFIX
+    if use_grammar:
+        prompt_text += build_json_grammar(ontology_yaml_path, hints_file_path)
+    params = {"scope": scope, "n_ctx": llm.n_ctx(), "max_tokens": max_tokens, "overlap_tokens": overlap_tokens,
+              "use_grammar": use_grammar}
+    return cache.make_key(text, prompt_text, cache.model_hash(llm.model_path), params)
+
+def extract_json_from_chunk(llm, text_chunk, ontology_yaml_path, hints_file_path, max_tokens=DEFAULT_MAX_TOKENS,
+                            use_grammar=True, cache=None, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
+    """
+    Run the ontology-guided extraction prompt on one text chunk.
+
+    Generation is streamed and stopped as soon as the top-level JSON object
+    closes. With `use_grammar`, decoding is constrained by the grammar from
+    `build_json_grammar`, so the output is always well-formed.
+
+    Args:
+        cache (ExtractionCache, optional): Return stored results without calling
+            the model, and store newly parsed ones.
+        overlap_tokens (int): Chunk overlap the chunk was split with (part of the cache key).
+
+    Returns:
+        tuple: (extracted JSON dict, prompt token count, generated token count).
+    """
+    if cache is not None:
+        key = extraction_cache_key(cache, llm, text_chunk, ontology_yaml_path, hints_file_path, max_tokens,
+                                   use_grammar, overlap_tokens)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, 0, 0
+
+    grammar = _load_llama_grammar(build_json_grammar(ontology_yaml_path, hints_file_path)) if use_grammar else None
+    state = prefix_state(llm, ontology_yaml_path, hints_file_path)
+    state.restore(llm)
+    prompt_tokens = state.prompt_tokens(llm, text_chunk)
+    json_text, completion_tokens = stream_json_object(llm, prompt_tokens, max_tokens, grammar)
+
+    try:
+        extracted_json = json.loads(json_text) if json_text else None
+    except json.JSONDecodeError:
+        extracted_json = None
+
+    # Failed runs are not cached, so they are retried next time
+    if extracted_json is None:
+        return {}, len(prompt_tokens), completion_tokens
+    if cache is not None:
+        cache.put(key, extracted_json, ontology_version(ontology_yaml_path))
+    return extracted_json, len(prompt_tokens), completion_tokens
+
+def merge_chunk_results(results):
+    """Merge per-chunk extractions into one document result (fuzzy de-duplication as in merge_knowledge)."""
+    # Start from an empty graph so even the first chunk is normalised and de-duplicated
+    merged = {}
+    for result in results:
+        merged = merge_data(merged, result)
+    return merged
+
+def extract_document(llm, text, ontology_yaml_path, hints_file_path, max_tokens=DEFAULT_MAX_TOKENS,
+                     overlap_tokens=DEFAULT_OVERLAP_TOKENS, use_grammar=True, cache=None):
+    """
+    Chunk a document to the prompt budget, extract every chunk and merge the results.
+
+    With a cache, the merged result of an unchanged document is returned before
+    it is tokenized, so a `LazyLlama` is never loaded for a fully cached document.
+
+    Returns:
+        tuple: (merged JSON dict, stats dict with "chunks", "prompt_tokens", "completion_tokens").
+    """
+    stats = {"chunks": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    if cache is not None:
+        document_cache_key = extraction_cache_key(cache, llm, text, ontology_yaml_path, hints_file_path, max_tokens,
+                                                  use_grammar, overlap_tokens, scope="document")
+        cached = cache.get(document_cache_key, count_miss=False)
+        if cached is not None:
+            return cached, stats
+
+    budget = chunk_budget(llm, ontology_yaml_path, hints_file_path, max_tokens)
+    results = []
+    for chunk in chunk_text(text, llm, budget, overlap_tokens):
+        result, prompt_tokens, completion_tokens = extract_json_from_chunk(
+            llm, chunk, ontology_yaml_path, hints_file_path, max_tokens, use_grammar, cache, overlap_tokens)
+        results.append(result)
+        stats["chunks"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+    merged = merge_chunk_results(results)
+
+    # Only documents whose every chunk parsed are cached whole; failed chunks are retried next time
+    if cache is not None and all(results):
+        cache.put(document_cache_key, merged, ontology_version(ontology_yaml_path))
+    return merged, stats
+
+def iter_input_files(inputs, pattern="*.txt"):
+    """Yield text file paths from a directory, a single file or an iterable of paths."""
+    if isinstance(inputs, (str, Path)):
+        inputs = Path(inputs)
+        if inputs.is_dir():
+            yield from sorted(inputs.glob(pattern))
+        else:
+            yield inputs
+        return
+    for path in inputs:
+        yield Path(path)
+
+def output_json_paths(output_dir, input_paths):
+    """
+    Map input text files to their JSON outputs in `output_dir`.
+
+    Outputs are named `<stem>.json`; when several inputs share a stem, each of
+    them gets `<stem>-<hash of its resolved path>.json` so none overwrites another.
+    """
+    input_paths = [Path(path) for path in input_paths]
+    stems = collections.Counter(path.stem for path in {path.resolve() for path in input_paths})
+    return {path: Path(output_dir) / (f"{path.stem}.json" if stems[path.stem] == 1 else
+                                      f"{path.stem}-{sha256_text(str(path.resolve()))[:8]}.json")
+            for path in input_paths}
+
+def report_throughput(stats, seconds):
+    """Print chunk and token throughput for an extraction run."""
+    tokens = stats["prompt_tokens"] + stats["completion_tokens"]
+    seconds = max(seconds, 1e-9)
+    print(f"⏱️ {stats['chunks']} chunks in {seconds:.1f}s: {stats['chunks'] / seconds:.2f} chunks/sec, "
+          f"{tokens / seconds:.1f} tokens/sec ({stats['completion_tokens'] / seconds:.1f} generated tokens/sec)")
+
+def extract_corpus(inputs, ontology_yaml_path, hints_file_path, output_dir, model_path=None, llm=None,
+                   n_ctx=DEFAULT_N_CTX, max_tokens=DEFAULT_MAX_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS,
+                   use_grammar=True, cache=None):
+    """
+    Extract structured knowledge from many text files with one long-lived model.
+
+    Each document is chunked to fit the context left after the ontology prompt,
+    every chunk is extracted, and the per-chunk JSON is merged into one
+    `<document stem>.json` in `output_dir` (see `output_json_paths`).
+
+    Args:
+        inputs (str, Path or iterable): Directory of .txt files, one file, or an iterable of paths.
+        ontology_yaml_path (Path): Path to YAML ontology file.
+        hints_file_path (Path): Path to the supplemental hints markdown file.
+        output_dir (Path): Directory for the per-document JSON outputs.
+        model_path (Path, optional): gguf model to load (on first use) when `llm` is not given.
+        llm (Llama, optional): Already loaded model to reuse.
+        n_ctx (int): Context window used when loading the model.
+        max_tokens (int): Generation budget per chunk.
+        overlap_tokens (int): Tokens shared between consecutive chunks.
+        use_grammar (bool): Constrain decoding with the ontology-derived JSON grammar.
+        cache (ExtractionCache, optional): Reuse stored results for unchanged chunks and prompts.
+
+    Returns:
+        dict: Run statistics ("documents", "chunks", "prompt_tokens", "completion_tokens", "seconds").
+    """
+    if llm is None:
+        llm = LazyLlama(model_path, n_ctx=n_ctx)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if cache is not None:
+        cache.reset_stats()
+
+    started = time.perf_counter()
+    totals = {"documents": 0, "chunks": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    outputs = output_json_paths(output_dir, iter_input_files(inputs))
+    for input_path, output_json_path in outputs.items():
+        with open(input_path, 'r', encoding='utf-8') as file:
+            text = file.read()
+        result, stats = extract_document(llm, text, ontology_yaml_path, hints_file_path, max_tokens, overlap_tokens,
+                                         use_grammar, cache)
+
+        with open(output_json_path, 'w', encoding='utf-8') as json_file:
+            json.dump(result, json_file, indent=2)
+        print(f"✅ JSON saved to: {output_json_path} ({stats['chunks']} chunks)")
+
+        totals["documents"] += 1
+        for key in ("chunks", "prompt_tokens", "completion_tokens"):
+            totals[key] += stats[key]
+
+    totals["seconds"] = time.perf_counter() - started
+    report_throughput(totals, totals["seconds"])
+    if cache is not None:
+        totals["cache_hits"], totals["cache_misses"] = cache.hits, cache.misses
+        cache.report()
+    return totals
+
+# Times a task may bring its worker down before it is reported as failed instead of retried
+MAX_TASK_ATTEMPTS = 2
+
+def _pool_worker(model_path, n_ctx, n_threads, ontology_yaml_path, hints_file_path, max_tokens, overlap_tokens,
+                 use_grammar, cache_path, tasks, results):
+    """
+    Worker process of `extract_corpus_pool`: load the model once, report ready, then serve
+    ("split", document, path) and ("extract", document, index, chunk) tasks from its own queue
+    until a None sentinel, then send its ("stats", cache hits, cache misses). `results` is the
+    write end of a pipe owned by this worker; sends are synchronous, so every finished task has
+    reached the parent before the next one starts.
+    """
+    llm = load_llm(model_path, n_ctx=n_ctx, n_threads=n_threads)
+    cache = ExtractionCache(cache_path) if cache_path else None
+    budget = chunk_budget(llm, ontology_yaml_path, hints_file_path, max_tokens)
+    results.send(("ready",))
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            try:
+                if task[0] == "split":
+                    _, document, path = task
+                    with open(path, 'r', encoding='utf-8') as file:
+                        chunks = chunk_text(file.read(), llm, budget, overlap_tokens)
+                    results.send(("split", document, chunks))
+                else:
+                    _, document, index, chunk = task
+                    result, prompt_tokens, completion_tokens = extract_json_from_chunk(
+                        llm, chunk, ontology_yaml_path, hints_file_path, max_tokens, use_grammar, cache,
+                        overlap_tokens)
+                    results.send(("chunk", document, index, result, prompt_tokens, completion_tokens))
+            except Exception as error:
+                results.send(("error", task[1], task[2] if task[0] == "extract" else None, repr(error)))
+        results.send(("stats", cache.hits, cache.misses) if cache is not None else ("stats", 0, 0))
+    finally:
+        if cache is not None:
+            cache.close()
+        results.close()
+
+def extraction_settings(model_path, ontology_yaml_path, hints_file_path, n_ctx, max_tokens, overlap_tokens,
+                        use_grammar):
+    """Return the settings that decide how a document is chunked and extracted, for journal keys."""
+    model_path = Path(model_path).resolve()
+    stat = model_path.stat()
+    return {
+        # Path, size and mtime stand in for the model's content hash, which is slow to compute
+        "model": [str(model_path), stat.st_size, stat.st_mtime_ns],
+        "prompt": sha256_text(render_prompt_prefix(ontology_yaml_path, hints_file_path)),
+        "n_ctx": n_ctx,
+        "max_tokens": max_tokens,
+        "overlap_tokens": overlap_tokens,
+        "use_grammar": use_grammar,
+    }
+
+def document_key(input_path, settings):
+    """Return the journal key of one document version: a hash of its content and the extraction settings."""
+    with open(input_path, 'r', encoding='utf-8') as file:
+        text = file.read()
+    return sha256_text(json.dumps({"text": sha256_text(text), "settings": settings}, sort_keys=True))
+
+def read_journal(journal_path):
+    """
+    Replay an extraction journal written by `extract_corpus_pool`.
+
+    Chunk results are only kept for documents that are not done, so a long
+    journal of finished documents replays without holding their results.
+
+    Returns:
+        dict: document key -> {"chunks": chunk count or None, "results": {index: result},
+        "done": bool, "output": hash of the written JSON or None}.
+    """
+    documents = {}
+    if not Path(journal_path).exists():
+        return documents
+    with open(journal_path, 'r', encoding='utf-8') as journal:
+        for line in journal:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A record cut short by an interruption; its chunk is simply redone
+                continue
+            entry = documents.setdefault(record["document"],
+                                         {"chunks": None, "results": {}, "done": False, "output": None})
+            if "chunks" in record:
+                if entry["chunks"] is not None and entry["chunks"] != record["chunks"]:
+                    # Re-chunked differently (new model or budget): earlier chunk results no longer line up
+                    entry["results"].clear()
+                entry["chunks"] = record["chunks"]
+            elif "chunk" in record:
+                entry["results"][record["chunk"]] = record["result"]
+            elif record.get("done"):
+                entry["done"] = True
+                entry["output"] = record.get("output")
+                entry["results"].clear()
+    return documents
+
+def compact_journal(journal_path):
+    """
+    Rewrite an extraction journal with one record per finished document, keeping
+    the chunk results only of documents that are still in progress.
+    """
+    journal_path = Path(journal_path)
+    if not journal_path.exists():
+        return
+    tmp_path = journal_path.with_suffix(journal_path.suffix + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as journal:
+        for document, entry in read_journal(journal_path).items():
+            if entry["done"]:
+                journal.write(json.dumps({"document": document, "done": True, "output": entry["output"]}) + "\n")
+                continue
+            if entry["chunks"] is not None:
+                journal.write(json.dumps({"document": document, "chunks": entry["chunks"]}) + "\n")
+            for index, result in sorted(entry["results"].items()):
+                journal.write(json.dumps({"document": document, "chunk": index, "result": result}) + "\n")
+    os.replace(tmp_path, journal_path)
+
+def extract_corpus_pool(inputs, ontology_yaml_path, hints_file_path, output_dir, model_path, workers=2,
+                        n_threads=None, queue_size=None, n_ctx=DEFAULT_N_CTX, max_tokens=DEFAULT_MAX_TOKENS,
+                        overlap_tokens=DEFAULT_OVERLAP_TOKENS, use_grammar=True, cache_path=None,
+                        journal_path=None):
+    """
+    Extract structured knowledge from many text files across a pool of worker processes.
+
+    Each of the `workers` processes loads the gguf model once (the parent never
+    loads it), chunks documents with its own tokenizer and extracts chunks
+    handed to it through its own task queue, so the parent only runs ahead of
+    the workers by `queue_size` tasks and knows which tasks each one holds.
+    A worker that dies mid-task is replaced and its tasks are handed out
+    again; a task that takes down `MAX_TASK_ATTEMPTS` workers is reported as
+    failed. Every finished chunk is appended to a JSONL journal as soon as it
+    arrives; when all chunks of a document are in, they are merged into
+    `<document stem>.json` in `output_dir` (see `output_json_paths`). Journal
+    records are keyed by document content and extraction settings, so a
+    re-run after an interruption only extracts the chunks that are missing,
+    while an edited document is extracted afresh. A run that finishes compacts
+    the journal (see `compact_journal`).
+
+    Args:
+        inputs (str, Path or iterable): Directory of .txt files, one file, or an iterable of paths.
+        ontology_yaml_path (Path): Path to YAML ontology file.
+        hints_file_path (Path): Path to the supplemental hints markdown file.
+        output_dir (Path): Directory for the per-document JSON outputs.
+        model_path (Path): gguf model loaded by every worker.
+        workers (int): Number of worker processes (and loaded model copies).
+        n_threads (int, optional): llama.cpp threads per worker (defaults to cores / workers).
+        queue_size (int, optional): Maximum tasks handed out ahead of the workers (defaults to 2 * workers).
+        n_ctx (int): Context window of each worker's model.
+        max_tokens (int): Generation budget per chunk.
+        overlap_tokens (int): Tokens shared between consecutive chunks.
+        use_grammar (bool): Constrain decoding with the ontology-derived JSON grammar.
+        cache_path (Path, optional): ExtractionCache database shared by the workers.
+        journal_path (Path, optional): Progress journal (defaults to `output_dir/extraction_journal.jsonl`).
+
+    Returns:
+        dict: Run statistics ("documents", "chunks", "resumed_chunks", "failed_chunks",
+        "prompt_tokens", "completion_tokens", "seconds", and with a cache "cache_hits" and
+        "cache_misses" summed over the workers that finished).
+    """
+    if workers < 1:
+        raise ValueError("workers must be a positive integer.")
+    if n_threads is None:
+        n_threads = max(1, (os.cpu_count() or 1) // workers)
+    queue_size = queue_size or 2 * workers
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    journal_path = Path(journal_path or output_dir / "extraction_journal.jsonl")
+    state = read_journal(journal_path)
+
+    # Documents are identified by content, so inputs with the same text are extracted once
+    settings = extraction_settings(model_path, ontology_yaml_path, hints_file_path, n_ctx, max_tokens,
+                                   overlap_tokens, use_grammar)
+    sources = {}                          # document key -> text file read by its split task
+    outputs = collections.defaultdict(list)  # document key -> JSON files written when it is done
+    for input_path, output_json_path in output_json_paths(output_dir, iter_input_files(inputs)).items():
+        document = document_key(input_path, settings)
+        sources.setdefault(document, str(input_path))
+        outputs[document].append(output_json_path)
+
+    def is_done(document):
+        # Finished documents are skipped only while every output still holds what was written
+        entry = state.get(document, {})
+        return entry.get("done") and all(
+            path.exists() and sha256_text(path.read_text(encoding='utf-8')) == entry["output"]
+            for path in outputs[document])
+
+    documents = list(sources)
+    to_split = collections.deque(document for document in documents if not is_done(document))
+
+    totals = {"documents": 0, "chunks": 0, "resumed_chunks": 0, "failed_chunks": 0,
+              "prompt_tokens": 0, "completion_tokens": 0}
+    if cache_path:
+        totals["cache_hits"] = totals["cache_misses"] = 0
+    started = time.perf_counter()
+    print(f"🔁 {len(documents) - len(to_split)} of {len(documents)} documents already extracted; "
+          f"{len(to_split)} to go with {workers} workers x {n_threads} threads")
+    if not to_split:
+        totals["seconds"] = time.perf_counter() - started
+        return totals
+
+    context = multiprocessing.get_context()
+    depth = max(1, -(-queue_size // workers))  # tasks handed to each worker, counting the running one
+    active = {}                                # result pipe -> {"process", "tasks", "held", "ready"}
+
+    def spawn():
+        tasks = context.Queue()
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_pool_worker, daemon=True, args=(
+            model_path, n_ctx, n_threads, ontology_yaml_path, hints_file_path, max_tokens, overlap_tokens,
+            use_grammar, cache_path, tasks, sender))
+        process.start()
+        # Only the worker keeps the write end open, so the pipe reports EOF as soon as it exits
+        sender.close()
+        active[receiver] = {"process": process, "tasks": tasks, "held": collections.deque(), "ready": False}
+
+    for _ in range(workers):
+        spawn()
+
+    pending = collections.deque()  # tasks produced but not yet handed to a worker
+    attempts = collections.Counter()  # task -> times it was running when its worker died
+    chunk_results = {}             # document -> {index: result}, only for documents still in flight
+    chunk_counts = {}
+    failed = set()
+
+    def outstanding():
+        return sum(len(worker["held"]) for worker in active.values())
+
+    def finish(document, journal):
+        count = chunk_counts[document]
+        done = chunk_results[document]
+        if len(done) < count:
+            return
+        del chunk_results[document]
+        if document in failed:
+            print(f"⚠️ Skipped {sources[document]}: some chunks failed and will be retried on the next run")
+            return
+        text = json.dumps(merge_chunk_results(done[index] for index in range(count)), indent=2)
+        for output_json_path in outputs[document]:
+            output_json_path.write_text(text, encoding='utf-8')
+            print(f"✅ JSON saved to: {output_json_path} ({count} chunks)")
+        journal.write(json.dumps({"document": document, "done": True, "output": sha256_text(text)}) + "\n")
+        journal.flush()
+        totals["documents"] += 1
+
+    def handle(message, journal):
+        kind, document = message[0], message[1]
+        if kind == "split":
+            chunks = message[2]
+            previous = state.get(document, {})
+            resumed = previous.get("results", {}) if previous.get("chunks") == len(chunks) else {}
+            chunk_counts[document] = len(chunks)
+            chunk_results[document] = dict(resumed)
+            totals["resumed_chunks"] += len(resumed)
+            journal.write(json.dumps({"document": document, "chunks": len(chunks)}) + "\n")
+            pending.extend(("extract", document, index, chunk)
+                           for index, chunk in enumerate(chunks) if index not in resumed)
+            finish(document, journal)
+        elif kind == "chunk":
+            _, _, index, result, prompt_tokens, completion_tokens = message
+            chunk_results[document][index] = result
+            journal.write(json.dumps({"document": document, "chunk": index, "result": result}) + "\n")
+            totals["chunks"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            finish(document, journal)
+        else:
+            _, _, index, error = message
+            print(f"⚠️ Worker failed on {sources[document]}" + (f" chunk {index}" if index is not None else "")
+                  + f": {error}")
+            totals["failed_chunks"] += 1
+            failed.add(document)
+            if index is None:
+                return
+            # Leave the chunk out of the journal so a re-run retries it
+            chunk_results[document][index] = {}
+            finish(document, journal)
+        journal.flush()
+
+    def receive(worker, message, journal):
+        if message[0] == "ready":
+            worker["ready"] = True
+            return
+        worker["held"].popleft()
+        handle(message, journal)
+
+    def dispatch():
+        # Keep every live worker `depth` tasks deep, remembering what each one holds
+        for worker in active.values():
+            while pending and len(worker["held"]) < depth and worker["process"].is_alive():
+                task = pending.popleft()
+                worker["tasks"].put(task)
+                worker["held"].append(task)
+
+    def reap(journal):
+        for receiver, worker in list(active.items()):
+            if worker["process"].is_alive():
+                continue
+            # Collect whatever the worker sent before it exited, then recover the tasks it still held
+            try:
+                while receiver.poll():
+                    receive(worker, receiver.recv(), journal)
+            except (EOFError, OSError):
+                pass
+            del active[receiver]
+            receiver.close()
+            worker["tasks"].cancel_join_thread()
+            worker["tasks"].close()
+            held = worker["held"]
+            exitcode = worker["process"].exitcode
+            if not worker["ready"]:
+                # Died while loading the model: no task is to blame and a replacement would fail the same way
+                print(f"⚠️ Extraction worker exited with code {exitcode} before loading the model")
+                pending.extendleft(reversed(held))
+                continue
+            if held:
+                task = held.popleft()
+                attempts[task] += 1
+                where = sources[task[1]] + (f" chunk {task[2]}" if task[0] == "extract" else "")
+                print(f"⚠️ Extraction worker exited with code {exitcode} while on {where} "
+                      f"(attempt {attempts[task]} of {MAX_TASK_ATTEMPTS})")
+                if attempts[task] >= MAX_TASK_ATTEMPTS:
+                    handle(("error", task[1], task[2] if task[0] == "extract" else None,
+                            f"worker exited with code {exitcode}"), journal)
+                else:
+                    held.appendleft(task)
+                pending.extendleft(reversed(held))
+            spawn()
+
+    # Terminate a record cut short by an interruption so new records start on their own line
+    if journal_path.exists() and journal_path.stat().st_size:
+        with open(journal_path, 'rb+') as journal:
+            journal.seek(-1, os.SEEK_END)
+            if journal.read(1) != b"\n":
+                journal.write(b"\n")
+
+    finished = False
+    try:
+        with open(journal_path, 'a', encoding='utf-8') as journal:
+            while to_split or pending or outstanding():
+                # Split further documents only while the backlog is short, so memory stays bounded
+                while to_split and len(pending) + outstanding() < queue_size + workers:
+                    document = to_split.popleft()
+                    pending.append(("split", document, sources[document]))
+                dispatch()
+                # Workers hold more tasks than they are running, so waiting for a result never starves them
+                for receiver in multiprocessing.connection.wait(list(active), timeout=1.0):
+                    try:
+                        receive(active[receiver], receiver.recv(), journal)
+                    except (EOFError, OSError):
+                        # The worker exited; it is reaped below once its exit code is in
+                        pass
+                reap(journal)
+                if not active:
+                    raise RuntimeError("All extraction workers exited before the corpus was finished.")
+        finished = True
+    finally:
+        for worker in active.values():
+            worker["tasks"].put(None)
+        for receiver, worker in active.items():
+            # Idle workers answer the sentinel with their cache counts before they exit
+            try:
+                while finished and receiver.poll(5):
+                    message = receiver.recv()
+                    if message[0] == "stats" and cache_path:
+                        totals["cache_hits"] += message[1]
+                        totals["cache_misses"] += message[2]
+            except (EOFError, OSError):
+                pass
+            worker["process"].join(timeout=5)
+            if worker["process"].is_alive():
+                worker["process"].terminate()
+            receiver.close()
+
+    # The run finished: drop the chunk records of documents that are now done
+    compact_journal(journal_path)
+    totals["seconds"] = time.perf_counter() - started
+    report_throughput(totals, totals["seconds"])
+    if cache_path:
+        lookups = totals["cache_hits"] + totals["cache_misses"]
+        rate = totals["cache_hits"] / lookups * 100 if lookups else 0.0
+        print(f"🗄️ Extraction cache: {totals['cache_hits']} hits, {totals['cache_misses']} misses "
+              f"({rate:.0f}% hit rate)")
+    return totals
+
+def extract_json_from_text(input_txt_path, ontology_yaml_path, hints_file_path, output_json_path, model_path,
+                           llm=None, max_tokens=DEFAULT_MAX_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS,
+                           use_grammar=True, cache=None):
     """Extract structured knowledge from text and save as JSON.
 
+    Texts longer than the context left after the ontology prompt are split
+    into overlapping chunks whose extractions are merged.
+
     Args:
         input_txt_path (Path): Path to input text file.
         ontology_yaml_path (Path): Path to YAML ontology file.
+        hints_file_path (Path): Path to the supplemental hints markdown file.
         output_json_path (Path): Path to save the output JSON file.
         model_path (Path): Path to LLM model file.
+        llm (Llama, optional): Already loaded model to reuse instead of loading `model_path`.
+        max_tokens (int): Generation budget per chunk.
+        overlap_tokens (int): Tokens shared between consecutive chunks.
+        use_grammar (bool): Constrain decoding with the ontology-derived JSON grammar.
+        cache (ExtractionCache, optional): Reuse stored results for unchanged chunks and prompts.
     """
     with open(input_txt_path, 'r', encoding='utf-8') as file:
         text = file.read()
 
-    prompt = create_body_prompt(text, ontology_yaml_path, hints_file_path)
-
-    # Initialize LLM
-    llm = Llama(model_path=str(model_path), n_ctx=8192)
-
-    # Get response from LLM
-    response = llm(prompt, max_tokens=4096)
+    # Initialize LLM (loaded on first use, so a cached document never loads it)
+    if llm is None:
+        llm = LazyLlama(model_path)
 
-    response_text = response['choices'][0]['text']
+    if cache is not None:
+        cache.reset_stats()
 
-    # Robustly extract JSON from the response
-    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-    extracted_json = json.loads(json_match.group()) if json_match else {}
+    started = time.perf_counter()
+    extracted_json, stats = extract_document(llm, text, ontology_yaml_path, hints_file_path, max_tokens, overlap_tokens,
+                                             use_grammar, cache)
 
     # Save extracted JSON
     with open(output_json_path, 'w', encoding='utf-8') as json_file:
         json.dump(extracted_json, json_file, indent=2)
 
     print(f"✅ JSON saved to: {output_json_path}")
+    report_throughput(stats, time.perf_counter() - started)
+    if cache is not None:
+        cache.report()
 
 # Example usage
 if __name__ == '__main__':
@@ -116,4 +1056,4 @@ if __name__ == '__main__':
         hints_file_path=Path("../prompt_hints.md"),
         output_json_path=Path("../data/output/extracted_knowledge.json"),
         model_path=Path("path/to/llm_model.gguf")
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,166 @@
+"""
+Extraction Result Cache
+
+Stores parsed LLM extraction results in a local SQLite database so re-runs
+over an unchanged corpus (after a crash or a small edit) skip the model.
+Entries are keyed by (chunk or document text hash, rendered-prompt hash, model
+file hash, chunking and sampling parameters) and tagged with the ontology
+version that produced them.
+
+Author: Xiang Xie (xiang.xie@ncl.ac.uk)
+Date: 16/10/2026
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path(os.environ.get(
+    "AQKG_EXTRACTION_CACHE",
+    Path.home() / ".cache" / "urban-air-quality-kg" / "extraction_cache.sqlite",
+))
+
+def sha256_text(text):
+    """Return the SHA-256 hex digest of a text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def sha256_file(path, block_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def ontology_version(ontology_yaml_path):
+    """Return the version tag of an ontology file (a hash of its contents)."""
+    return sha256_file(ontology_yaml_path)[:16]
+
+class ExtractionCache:
+    """
+    SQLite-backed cache of parsed extraction results.
+
+    Args:
+        path (str or Path, optional): Database file (defaults to
+            $AQKG_EXTRACTION_CACHE or ~/.cache/urban-air-quality-kg/extraction_cache.sqlite).
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or DEFAULT_CACHE_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._connection = sqlite3.connect(self.path)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS extractions (
+                key TEXT PRIMARY KEY,
+                ontology_version TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS extractions_ontology_version ON extractions (ontology_version);
+            CREATE TABLE IF NOT EXISTS model_hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL
+            );
+        """)
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def model_hash(self, model_path):
+        """
+        Return the content hash of a model file.
+
+        Hashing a multi-gigabyte gguf is slow, so the digest is stored per
+        (path, size, mtime) and only recomputed when the file changes.
+        """
+        model_path = Path(model_path).resolve()
+        stat = model_path.stat()
+        row = self._connection.execute(
+            "SELECT sha256 FROM model_hashes WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (str(model_path), stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row:
+            return row[0]
+        digest = sha256_file(model_path)
+        self._connection.execute(
+            "INSERT OR REPLACE INTO model_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+            (str(model_path), stat.st_size, stat.st_mtime_ns, digest))
+        self._connection.commit()
+        return digest
+
+    @staticmethod
+    def make_key(chunk_text, prompt_text, model_hash, params):
+        """Return the cache key of one extraction call."""
+        return sha256_text(json.dumps({
+            "chunk": sha256_text(chunk_text),
+            "prompt": sha256_text(prompt_text),
+            "model": model_hash,
+            "params": params,
+        }, sort_keys=True))
+
+    def get(self, key, count_miss=True):
+        """
+        Return the cached result for a key (counting a hit or miss), or None.
+
+        Pass `count_miss=False` for a lookup whose miss is followed by finer-grained lookups
+        (a whole document before its chunks), so misses are not counted twice.
+        """
+        row = self._connection.execute("SELECT result FROM extractions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            if count_miss:
+                self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, result, version):
+        """Store a parsed result under a key, tagged with an ontology version."""
+        self._connection.execute(
+            "INSERT OR REPLACE INTO extractions (key, ontology_version, result, created) VALUES (?, ?, ?, ?)",
+            (key, version, json.dumps(result), time.time()))
+        self._connection.commit()
+
+    def invalidate(self, version=None, keep_version=None):
+        """
+        Delete cached results.
+
+        Args:
+            version (str, optional): Delete entries produced with this ontology version.
+            keep_version (str, optional): Delete entries from every other ontology version.
+                With neither argument, every entry is deleted.
+
+        Returns:
+            int: Number of deleted entries.
+        """
+        if version is not None:
+            cursor = self._connection.execute("DELETE FROM extractions WHERE ontology_version = ?", (version,))
+        elif keep_version is not None:
+            cursor = self._connection.execute("DELETE FROM extractions WHERE ontology_version != ?", (keep_version,))
+        else:
+            cursor = self._connection.execute("DELETE FROM extractions")
+        self._connection.commit()
+        return cursor.rowcount
+
+    def reset_stats(self):
+        """Reset the hit and miss counters at the start of a run."""
+        self.hits = 0
+        self.misses = 0
+
+    def report(self):
+        """Print the hit and miss counts of this run."""
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        print(f"🗄️ Extraction cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate)")
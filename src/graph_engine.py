@@ -0,0 +1,494 @@
+"""
+Embedded Air Quality Graph Engine
+
+In-process, read-only stand-in for the Neo4j knowledge graph. Nodes are held
+in flat arrays and each relationship type (EMITS, MITIGATES,
+AFFECTS_DISPERSION) gets its own CSR adjacency in both directions, so the
+traversals the pipeline runs are answered with array slices instead of Bolt
+round trips. The engine is built from validated JSON or a graph snapshot;
+`Neo4jGraphBackend` offers the same traversals over a live database, so
+callers can take either.
+
+Author: Xiang Xie (xiang.xie@ncl.ac.uk)
+Date: 17/10/2026
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from .graph_snapshot import GraphSnapshot
+    from .kg_model import NODE_SPECS, PAIR_CATEGORIES, RELATION_SPECS, as_graph, KnowledgeGraph
+    from .local_vector_index import INDEX_LABELS, index_label
+except ImportError:
+    from graph_snapshot import GraphSnapshot
+    from kg_model import NODE_SPECS, PAIR_CATEGORIES, RELATION_SPECS, as_graph, KnowledgeGraph
+    from local_vector_index import INDEX_LABELS, index_label
+
+# Relationship types in a fixed order, so type codes are stable between builds
+REL_TYPES = list(dict.fromkeys(rel_type for _, rel_type, _ in RELATION_SPECS.values()))
+
+def _csr(sources, targets, node_count):
+    """Return (indptr, indices) of a CSR adjacency with targets grouped by source, in edge order."""
+    sources = np.asarray(sources, dtype=np.int32)
+    targets = np.asarray(targets, dtype=np.int32)
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(node_count + 1, dtype=np.int32)
+    np.cumsum(np.bincount(sources, minlength=node_count), out=indptr[1:])
+    return indptr, targets[order]
+
+class GraphEngine:
+    """
+    Read-only graph with CSR adjacency per relationship type.
+
+    Nodes are identified by their key (`name`, or `description` for
+    StreetCanyon). Methods taking a name accept an optional label to
+    disambiguate names shared by several labels.
+
+    Args:
+        labels (list of str): Label of each node.
+        keys (list of str): Key of each node.
+        categories (list): Category of each node (None where absent).
+        edges (iterable): (start node, relationship type, end node) triples of node indexes.
+        vector_index (LocalVectorIndex, optional): Embeddings of the nodes for `search_many`.
+    """
+
+    def __init__(self, labels, keys, categories, edges, vector_index=None):
+        self.labels = list(labels)
+        self.keys = list(keys)
+        self.categories = list(categories)
+        self.vector_index = vector_index
+        self._by_key = {}
+        for node, (label, key) in enumerate(zip(self.labels, self.keys)):
+            self._by_key.setdefault(key, []).append(node)
+
+        by_type = {rel_type: ([], []) for rel_type in REL_TYPES}
+        for start, rel_type, end in edges:
+            starts, ends = by_type.setdefault(rel_type, ([], []))
+            starts.append(start)
+            ends.append(end)
+        self.rel_types = list(by_type)
+        self._out = {rel_type: _csr(starts, ends, len(self.keys)) for rel_type, (starts, ends) in by_type.items()}
+        self._in = {rel_type: _csr(ends, starts, len(self.keys)) for rel_type, (starts, ends) in by_type.items()}
+        self._combined = {}
+        self._edges = None
+        self._fingerprint = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def edge_count(self):
+        return sum(len(indices) for _, indices in self._out.values())
+
+    # Construction
+    @classmethod
+    def from_json(cls, data):
+        """
+        Build the engine from validated JSON data, a JSON file or a KnowledgeGraph.
+
+        As with the Neo4j import, relations whose endpoints are not declared entities are skipped.
+        """
+        if isinstance(data, (str, Path)):
+            data = KnowledgeGraph.load(data)
+        graph = as_graph(data)
+
+        labels, keys, categories, nodes = [], [], [], {}
+        for label, (group, _) in NODE_SPECS.items():
+            for name, category in graph.iter_entities(group):
+                nodes[label, name] = len(keys)
+                labels.append(label)
+                keys.append(name)
+                categories.append(category)
+
+        edges = []
+        for rel_category, (start_label, rel_type, end_label) in RELATION_SPECS.items():
+            for first, second in graph.relation_pairs(rel_category):
+                start, end = (second, first) if rel_category in PAIR_CATEGORIES else (first, second)
+                if (start_label, start) in nodes and (end_label, end) in nodes:
+                    edges.append((nodes[start_label, start], rel_type, nodes[end_label, end]))
+        return cls(labels, keys, categories, edges)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Build the engine (with its vector index) from a GraphSnapshot or snapshot file."""
+        if not isinstance(snapshot, GraphSnapshot):
+            snapshot = GraphSnapshot.load(snapshot)
+        categories = snapshot.properties.get("category", [None] * len(snapshot))
+        edges = [(int(start), snapshot.rel_types[code], int(end))
+                 for start, end, code in zip(snapshot.edge_start, snapshot.edge_end, snapshot.edge_type)]
+        return cls(
+            labels=[snapshot.node_label_name(row) for row in range(len(snapshot))],
+            keys=[snapshot.node_key(row) for row in range(len(snapshot))],
+            categories=categories,
+            edges=edges,
+            vector_index=snapshot.to_vector_index() if len(snapshot.embeddings) else None,
+        )
+
+    def fingerprint(self):
+        """Return (and cache) a content hash of the nodes, relationships and embeddings."""
+        if self._fingerprint is None:
+            digest = hashlib.sha256(json.dumps([self.labels, self.keys, self.categories, self.rel_types],
+                                               ensure_ascii=False).encode("utf-8"))
+            for array in self._edge_arrays():
+                digest.update(np.ascontiguousarray(array).tobytes())
+            if self.vector_index is not None:
+                digest.update(np.ascontiguousarray(self.vector_index.embeddings).tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    # Node lookup
+    def nodes(self, name, label=None):
+        """Return the indexes of the nodes with a key (and label)."""
+        return [node for node in self._by_key.get(name, ()) if label is None or self.labels[node] == label]
+
+    def has_node(self, name, label=None):
+        return bool(self.nodes(name, label))
+
+    def node(self, index):
+        """Return a node as {"name", "label", "category"}."""
+        return {"name": self.keys[index], "label": self.labels[index], "category": self.categories[index]}
+
+    # Traversals
+    def neighbour_indexes(self, node, rel_type, direction="out"):
+        """Return the neighbour indexes of one node through one relationship type ("out" or "in")."""
+        if rel_type not in self._out:
+            return np.zeros(0, dtype=np.int32)
+        indptr, indices = (self._out if direction == "out" else self._in)[rel_type]
+        return indices[indptr[node]:indptr[node + 1]]
+
+    def neighbours(self, name, rel_type, direction="out", label=None, neighbour_label=None):
+        """Return the sorted keys of the nodes related to `name` through one relationship type."""
+        found = {self.keys[neighbour]
+                 for node in self.nodes(name, label)
+                 for neighbour in self.neighbour_indexes(node, rel_type, direction)
+                 if neighbour_label is None or self.labels[neighbour] == neighbour_label}
+        return sorted(found)
+
+    def sources_emitting(self, pollutant):
+        """Return the sources that emit a pollutant."""
+        return self.neighbours(pollutant, "EMITS", "in", label="Pollutant")
+
+    def pollutants_emitted_by(self, source):
+        """Return the pollutants a source emits."""
+        return self.neighbours(source, "EMITS", "out", label="Source")
+
+    def mitigations_for_source(self, source):
+        """Return the mitigation measures of a source."""
+        return self.neighbours(source, "MITIGATES", "in", label="Source")
+
+    def mitigations_for_pollutant(self, pollutant):
+        """
+        Return the mitigation measures of the sources that emit a pollutant.
+
+        Returns:
+            list: {"mitigation", "sources"} dicts sorted by mitigation name.
+        """
+        mitigations = {}
+        for source in self.sources_emitting(pollutant):
+            for mitigation in self.mitigations_for_source(source):
+                mitigations.setdefault(mitigation, []).append(source)
+        return [{"mitigation": mitigation, "sources": sources} for mitigation, sources in sorted(mitigations.items())]
+
+    def dispersion_factors(self, pollutant):
+        """Return the meteorological and street canyon factors affecting a pollutant's dispersion."""
+        return self.neighbours(pollutant, "AFFECTS_DISPERSION", "in", label="Pollutant")
+
+    def hop_counts(self, starts, k=2, rel_types=None):
+        """
+        Breadth-first k-hop expansion from node indexes, following relationships in both directions.
+
+        Returns:
+            numpy.ndarray: Hop count of every node (0 for the starts, -1 where not reached within k hops).
+        """
+        indptr, indices = self._undirected(tuple(self.rel_types if rel_types is None else rel_types))
+        hops = np.full(len(self.keys), -1, dtype=np.int32)
+        frontier = np.unique(np.asarray(starts, dtype=np.int32))
+        hops[frontier] = 0
+        for hop in range(1, k + 1):
+            if not len(frontier):
+                break
+            # Gather every CSR slice of the frontier in one vectorised step
+            begins, lengths = indptr[frontier], indptr[frontier + 1] - indptr[frontier]
+            offsets = np.repeat(begins - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            reached = np.unique(indices[offsets])
+            frontier = reached[hops[reached] < 0]
+            hops[frontier] = hop
+        return hops
+
+    def k_hop_indexes(self, starts, k=2, rel_types=None):
+        """
+        Return (node indexes, hop counts) of every node reached from the starts within k hops,
+        excluding the starts, nearest first.
+        """
+        hops = self.hop_counts(starts, k, rel_types)
+        reached = np.flatnonzero(hops > 0)
+        order = np.argsort(hops[reached], kind="stable")
+        return reached[order], hops[reached][order]
+
+    def k_hop(self, name, k=2, rel_types=None, label=None):
+        """
+        Return the k-hop neighbourhood of a node, following relationships in both directions.
+
+        Args:
+            name (str): Key of the start node.
+            k (int): Maximum number of hops.
+            rel_types (list of str, optional): Relationship types to follow (default all).
+            label (str, optional): Label of the start node.
+
+        Returns:
+            list: {"name", "label", "category", "hops"} dicts sorted by (hops, label, name),
+            excluding the start node.
+        """
+        nodes, hops = self.k_hop_indexes(self.nodes(name, label), k, rel_types)
+        neighbourhood = [dict(self.node(node), hops=hop) for node, hop in zip(nodes.tolist(), hops.tolist())]
+        neighbourhood.sort(key=lambda item: (item["hops"], item["label"], item["name"]))
+        return neighbourhood
+
+    def expand(self, seeds, k=1, rel_types=None):
+        """
+        Return the relationships within k hops of each seed node.
+
+        A relationship is within k hops when one of its endpoints is at most k - 1
+        hops from the seed; its depth is that distance plus one.
+
+        Args:
+            seeds (list): (label, name) tuples of the seed nodes.
+            k (int): Maximum number of hops.
+            rel_types (list of str, optional): Relationship types to follow (default all).
+
+        Returns:
+            list: {"seed", "start", "start_label", "rel_type", "end", "end_label", "depth"} dicts,
+            where "seed" is the position of the seed in `seeds`.
+        """
+        rel_types = tuple(self.rel_types if rel_types is None else rel_types)
+        starts, codes, ends = self._edge_arrays()
+        selected = np.isin(codes, [self.rel_types.index(rel_type) for rel_type in rel_types if rel_type in self._out])
+
+        triples = []
+        for seed, (label, name) in enumerate(seeds):
+            nodes = self.nodes(name, label)
+            if not nodes:
+                continue
+            hops = self.hop_counts(nodes, k - 1, rel_types)
+            unreached = np.iinfo(np.int32).max
+            nearest = np.minimum(np.where(hops[starts] < 0, unreached, hops[starts]),
+                                 np.where(hops[ends] < 0, unreached, hops[ends]))
+            for edge in np.flatnonzero(selected & (nearest < k)).tolist():
+                start, end = int(starts[edge]), int(ends[edge])
+                triples.append({"seed": seed, "start": self.keys[start], "start_label": self.labels[start],
+                                "rel_type": self.rel_types[codes[edge]], "end": self.keys[end],
+                                "end_label": self.labels[end], "depth": int(nearest[edge]) + 1})
+        return triples
+
+    def _edge_arrays(self):
+        """Return (and cache) flat (start, relationship type code, end) arrays of every relationship."""
+        if self._edges is None:
+            starts, codes, ends = [], [], []
+            for code, rel_type in enumerate(self.rel_types):
+                indptr, indices = self._out[rel_type]
+                starts.append(np.repeat(np.arange(len(self.keys), dtype=np.int32), np.diff(indptr)))
+                codes.append(np.full(len(indices), code, dtype=np.int32))
+                ends.append(indices)
+            self._edges = tuple(
+                np.concatenate(parts) if parts else np.zeros(0, dtype=np.int32) for parts in (starts, codes, ends))
+        return self._edges
+
+    def _undirected(self, rel_types):
+        """Return (and cache) one CSR adjacency over the given relationship types in both directions."""
+        if rel_types not in self._combined:
+            starts, ends = [], []
+            for rel_type in rel_types:
+                if rel_type not in self._out:
+                    continue
+                indptr, indices = self._out[rel_type]
+                sources = np.repeat(np.arange(len(self.keys), dtype=np.int32), np.diff(indptr))
+                starts += [sources, indices]
+                ends += [indices, sources]
+            sources = np.concatenate(starts) if starts else np.zeros(0, dtype=np.int32)
+            targets = np.concatenate(ends) if ends else np.zeros(0, dtype=np.int32)
+            self._combined[rel_types] = _csr(sources, targets, len(self.keys))
+        return self._combined[rel_types]
+
+    # Vector index protocol (see LocalVectorIndex), so the engine can stand in for Neo4j vector queries
+    def search_many(self, query_vectors, top_k=5, label=None, index_name=None):
+        if self.vector_index is None:
+            raise ValueError("This engine has no embeddings; build it from a snapshot.")
+        return self.vector_index.search_many(query_vectors, top_k=top_k, label=label, index_name=index_name)
+
+    def search(self, query_vector, top_k=5, label=None, index_name=None):
+        return self.search_many([query_vector], top_k=top_k, label=label, index_name=index_name)[0]
+
+class Neo4jGraphBackend:
+    """
+    The `GraphEngine` traversals (and vector searches) answered by a live Neo4j
+    database, so code can take either backend.
+
+    Args:
+        driver: Neo4j driver.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def _names(self, query, **params):
+        with self.driver.session() as session:
+            return session.execute_read(lambda tx: [record["name"] for record in tx.run(query, **params)])
+
+    def sources_emitting(self, pollutant):
+        return self._names("""
+            MATCH (s:Source)-[:EMITS]->(:Pollutant {name: $name})
+            RETURN DISTINCT s.name AS name ORDER BY name
+        """, name=pollutant)
+
+    def pollutants_emitted_by(self, source):
+        return self._names("""
+            MATCH (:Source {name: $name})-[:EMITS]->(p:Pollutant)
+            RETURN DISTINCT p.name AS name ORDER BY name
+        """, name=source)
+
+    def mitigations_for_source(self, source):
+        return self._names("""
+            MATCH (m:MitigationMeasure)-[:MITIGATES]->(:Source {name: $name})
+            RETURN DISTINCT m.name AS name ORDER BY name
+        """, name=source)
+
+    def mitigations_for_pollutant(self, pollutant):
+        query = """
+            MATCH (m:MitigationMeasure)-[:MITIGATES]->(s:Source)-[:EMITS]->(:Pollutant {name: $name})
+            WITH m.name AS mitigation, s.name AS source ORDER BY source
+            RETURN mitigation, collect(DISTINCT source) AS sources ORDER BY mitigation
+        """
+        with self.driver.session() as session:
+            return session.execute_read(lambda tx: [
+                {"mitigation": record["mitigation"], "sources": list(record["sources"])}
+                for record in tx.run(query, name=pollutant)])
+
+    def dispersion_factors(self, pollutant):
+        return self._names("""
+            MATCH (f)-[:AFFECTS_DISPERSION]->(:Pollutant {name: $name})
+            RETURN DISTINCT coalesce(f.name, f.description) AS name ORDER BY name
+        """, name=pollutant)
+
+    def k_hop(self, name, k=2, rel_types=None, label=None):
+        """
+        Return the k-hop neighbourhood of a node (see `GraphEngine.k_hop`).
+
+        Start nodes are found through their label and key property (`name`, or
+        `description` for street canyons), one branch per label when no label is given.
+        """
+        rel_filter = ":" + "|".join(rel_types) if rel_types else ""
+        labels = [label] if label is not None else list(NODE_SPECS)
+        branches = [f"MATCH (n:{node_label} {{{NODE_SPECS[node_label][1]}: $name}}) RETURN n"
+                    for node_label in labels if node_label in NODE_SPECS]
+        if not branches:
+            return []
+        query = f"""
+            CALL {{
+                {" UNION ".join(branches)}
+            }}
+            WITH collect(n) AS starts
+            UNWIND starts AS n
+            MATCH path = (n)-[{rel_filter}*1..{int(k)}]-(m)
+            WHERE NOT m IN starts
+            WITH m, min(length(path)) AS hops
+            RETURN coalesce(m.name, m.description) AS name, labels(m)[0] AS label, m.category AS category, hops
+            ORDER BY hops, label, name
+        """
+        with self.driver.session() as session:
+            return session.execute_read(lambda tx: [dict(record) for record in tx.run(query, name=name)])
+
+    def fingerprint(self):
+        """
+        Return a content hash of the live graph: node keys with their embedding hashes,
+        and every relationship with its properties, so caches can tell when the graph
+        or its embeddings changed.
+        """
+        node_query = """
+            MATCH (n)
+            RETURN labels(n)[0] + "|" + coalesce(n.name, n.description, "") + "|" +
+                   coalesce(n.category, "") + "|" + coalesce(n.embedding_hash, "") AS node
+        """
+        # Property maps have no canonical string form in Cypher, so relationships are serialised here
+        relation_query = """
+            MATCH (a)-[r]->(b)
+            RETURN coalesce(a.name, a.description, "") AS start, type(r) AS type,
+                   coalesce(b.name, b.description, "") AS end, properties(r) AS props
+        """
+
+        def read(tx):
+            nodes = sorted(record["node"] for record in tx.run(node_query))
+            relations = sorted(json.dumps([record["start"], record["type"], record["end"], dict(record["props"])],
+                                          sort_keys=True, ensure_ascii=False, default=str)
+                               for record in tx.run(relation_query))
+            return [nodes, relations]
+
+        with self.driver.session() as session:
+            content = session.execute_read(read)
+        return hashlib.sha256(json.dumps(content, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def search_many(self, query_vectors, top_k=5, label=None, index_name=None):
+        """Vector index protocol over the Neo4j vector indexes: one query per label, all query vectors batched."""
+        if index_name is None:
+            index_names = [name for name, index_label in INDEX_LABELS.items() if label in (None, index_label)]
+        else:
+            index_label(index_name)
+            index_names = [index_name]
+        query = """
+            UNWIND range(0, size($embeddings) - 1) AS row
+            UNWIND $index_names AS index_name
+            CALL db.index.vector.queryNodes(index_name, $top_k, $embeddings[row]) YIELD node, score
+            RETURN row, coalesce(node.name, node.description) AS name, node.category AS category, score
+            ORDER BY row, score DESC
+        """
+        embeddings = [[float(value) for value in vector] for vector in np.atleast_2d(query_vectors)]
+        results = [[] for _ in embeddings]
+        with self.driver.session() as session:
+            records = session.execute_read(lambda tx: list(tx.run(
+                query, embeddings=embeddings, index_names=index_names, top_k=int(top_k))))
+        for record in records:
+            if len(results[record["row"]]) < top_k:
+                results[record["row"]].append(
+                    {"name": record["name"], "category": record["category"], "score": record["score"]})
+        return results
+
+    def expand(self, seeds, k=1, rel_types=None):
+        """
+        Return the relationships within k hops of each seed node (see `GraphEngine.expand`).
+
+        Seeds are grouped by label so each group is one `UNWIND` batch that finds its
+        nodes through the label and key property (`name`, or `description` for street
+        canyons) instead of scanning every node; all batches share one read transaction.
+        """
+        rel_filter = ":" + "|".join(rel_types) if rel_types else ""
+        rows_by_label = {}
+        for seed, (label, name) in enumerate(seeds):
+            if label in NODE_SPECS:
+                rows_by_label.setdefault(label, []).append({"seed": seed, "name": name})
+        batches = [(f"""
+            UNWIND $rows AS row
+            MATCH (n:{label} {{{NODE_SPECS[label][1]}: row.name}})
+            MATCH path = (n)-[{rel_filter}*1..{int(k)}]-()
+            UNWIND range(0, length(path) - 1) AS position
+            WITH row.seed AS seed, relationships(path)[position] AS r, min(position + 1) AS depth
+            WITH seed, r, depth, startNode(r) AS a, endNode(r) AS b
+            RETURN seed,
+                   coalesce(a.name, a.description) AS start, labels(a)[0] AS start_label,
+                   type(r) AS rel_type,
+                   coalesce(b.name, b.description) AS end, labels(b)[0] AS end_label,
+                   depth
+        """, rows) for label, rows in rows_by_label.items()]
+        if not batches:
+            return []
+        with self.driver.session() as session:
+            return session.execute_read(lambda tx: [dict(record) for query, rows in batches
+                                                    for record in tx.run(query, rows=rows)])
+
+# Example usage
+if __name__ == "__main__":
+    engine = GraphEngine.from_json(Path("../data/baseline KG/Validated_air_quality_knowledge.json"))
+    print(f"✅ Loaded {len(engine)} nodes and {engine.edge_count} relationships")
+    print("Sources emitting NOx:", engine.sources_emitting("Nitrogen oxides (NOx)"))
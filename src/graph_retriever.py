@@ -0,0 +1,218 @@
+"""
+Graph-Aware Retrieval for the Local RAG
+
+Retrieves context for a question from the whole knowledge graph instead of
+one vector index: the question is matched against every node label, the hits
+are expanded by one or two hops in a single batched traversal, and the
+resulting triples are ranked, de-duplicated and packed into a token budget
+so the LLM context window carries facts rather than bare node names.
+
+Works with a `GraphEngine` (in process) or a `Neo4jGraphBackend` (live
+database) as the graph, and with any vector index following the
+`LocalVectorIndex` protocol (including both backends).
+
+Author: Xiang Xie (xiang.xie@ncl.ac.uk)
+Date: 17/10/2026
+"""
+
+import numpy as np
+
+try:
+    from .local_vector_index import INDEX_LABELS
+except ImportError:
+    from local_vector_index import INDEX_LABELS
+
+# Node labels searched for seed entities, in context order
+SEARCH_LABELS = list(INDEX_LABELS.values())
+
+# How each relationship type reads in the packed context, subject first and object first
+RELATION_PHRASES = {
+    "EMITS": ("emits", "is emitted by"),
+    "MITIGATES": ("mitigates", "is mitigated by"),
+    "AFFECTS_DISPERSION": ("affects dispersion of", "has dispersion affected by"),
+}
+
+def approximate_tokens(text):
+    """Cheap token estimate (about four characters per token) used when no tokenizer is given."""
+    return max(1, (len(text) + 3) // 4)
+
+def rank_triples(hits, triples, decay=0.5):
+    """
+    Score and de-duplicate expanded triples.
+
+    A triple scores the best `seed score * decay ** (depth - 1)` over the seeds it
+    was reached from, so facts about strong hits and facts close to them come first.
+
+    Args:
+        hits (list): Seed hits as {"name", "label", "category", "score"} dicts.
+        triples (list): Expansion rows with "seed" (position in `hits`) and "depth".
+        decay (float): Score multiplier per extra hop.
+
+    Returns:
+        list: Unique {"start", "start_label", "rel_type", "end", "end_label", "depth", "score"}
+        dicts, best first.
+    """
+    ranked = {}
+    for triple in triples:
+        score = hits[triple["seed"]]["score"] * decay ** (triple["depth"] - 1)
+        key = (triple["start_label"], triple["start"], triple["rel_type"], triple["end_label"], triple["end"])
+        if key not in ranked or score > ranked[key]["score"]:
+            ranked[key] = {"start": triple["start"], "start_label": triple["start_label"],
+                           "rel_type": triple["rel_type"], "end": triple["end"],
+                           "end_label": triple["end_label"], "depth": triple["depth"], "score": score}
+    return sorted(ranked.values(), key=lambda item: (-item["score"], item["depth"], item["start"], item["end"]))
+
+def _phrase(rel_type, inverse):
+    phrases = RELATION_PHRASES.get(rel_type, (rel_type, f"is {rel_type} of"))
+    return phrases[1] if inverse else phrases[0]
+
+def pack_context(hits, triples, max_tokens, count_tokens=approximate_tokens):
+    """
+    Greedily pack the best entities and facts into a token budget.
+
+    Facts sharing an endpoint and relationship are merged onto one line,
+    anchored on whichever endpoint more of the facts share ("Road traffic
+    emits: NOx; PM2.5", "NOx is emitted by: Buses; Ships"), so each additional
+    fact only costs its own tokens. Items that do not fit are skipped in favour
+    of smaller, lower-ranked ones.
+
+    Args:
+        hits (list): Seed hits, best first.
+        triples (list): Ranked triples from `rank_triples`.
+        max_tokens (int): Token budget of the packed context.
+        count_tokens (callable): Token counter for a text.
+
+    Returns:
+        tuple: (context text, packed hits, packed triples, tokens used).
+    """
+    entity_header, fact_header = "Relevant entities:\n", "Facts:\n"
+    items = sorted([(hit["score"], 0, hit) for hit in hits] + [(triple["score"], 1, triple) for triple in triples],
+                   key=lambda item: (-item[0], item[1]))
+    # How many candidate facts hang off each (endpoint, relationship, side), to pick line anchors
+    fan_out = {}
+    for triple in triples:
+        for anchor in ((triple["start"], triple["rel_type"], False), (triple["end"], triple["rel_type"], True)):
+            fan_out[anchor] = fan_out.get(anchor, 0) + 1
+
+    used = 0
+    entities, facts = [], {}
+    packed_hits, packed_triples = [], []
+    for _, kind, item in items:
+        if kind == 0:
+            line = f"- {item['name']} ({item['label']}" + (f", {item['category']}" if item["category"] else "") + ")\n"
+            cost = count_tokens(line) + (0 if entities else count_tokens(entity_header))
+            if used + cost > max_tokens:
+                continue
+            entities.append(line)
+            packed_hits.append(item)
+        else:
+            forward = (item["start"], item["rel_type"], False)
+            inverse = (item["end"], item["rel_type"], True)
+            if forward in facts or inverse in facts:
+                anchor = forward if forward in facts else inverse
+                other = item["end"] if anchor is forward else item["start"]
+                cost = count_tokens(f"; {other}")
+            else:
+                anchor = inverse if fan_out[inverse] > fan_out[forward] else forward
+                other = item["end"] if anchor is forward else item["start"]
+                cost = (count_tokens(f"- {anchor[0]} {_phrase(item['rel_type'], anchor[2])}: {other}\n")
+                        + (0 if facts else count_tokens(fact_header)))
+            if used + cost > max_tokens:
+                continue
+            facts.setdefault(anchor, []).append(other)
+            packed_triples.append(item)
+        used += cost
+
+    sections = []
+    if entities:
+        sections.append(entity_header + "".join(entities))
+    if facts:
+        sections.append(fact_header + "".join(
+            f"- {name} {_phrase(rel_type, inverse)}: {'; '.join(others)}\n"
+            for (name, rel_type, inverse), others in facts.items()))
+    return "".join(sections).rstrip("\n"), packed_hits, packed_triples, used
+
+class GraphRetriever:
+    """
+    Multi-label vector search plus batched neighbourhood expansion over the KG.
+
+    Args:
+        graph: `GraphEngine` or `Neo4jGraphBackend` answering `expand`.
+        embed_queries (callable): Maps a list of texts to a matrix of query vectors.
+        vector_index (optional): Index with `search_many(vectors, top_k, label=...)`;
+            defaults to `graph` (a snapshot-built engine or a Neo4j backend).
+        hits_per_label (int): Seed hits kept per node label.
+        min_score (float): Seed hits scoring below this are dropped.
+        hops (int): Expansion depth (1 or 2).
+        decay (float): Triple score multiplier per extra hop.
+        max_tokens (int): Token budget of the packed context.
+        count_tokens (callable): Token counter (e.g. `llm.get_num_tokens`).
+        labels (list of str, optional): Node labels to search (default all indexed labels).
+    """
+
+    def __init__(self, graph, embed_queries, vector_index=None, hits_per_label=3, min_score=0.0,
+                 hops=1, decay=0.5, max_tokens=1024, count_tokens=approximate_tokens, labels=None):
+        self.graph = graph
+        self.embed_queries = embed_queries
+        self.vector_index = vector_index if vector_index is not None else graph
+        self.hits_per_label = hits_per_label
+        self.min_score = min_score
+        self.hops = hops
+        self.decay = decay
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+        self.labels = list(labels or SEARCH_LABELS)
+
+    def search_hits(self, query_vectors):
+        """Return the seed hits of each query across all node labels, best first."""
+        per_query = [[] for _ in range(len(query_vectors))]
+        for label in self.labels:
+            results = self.vector_index.search_many(query_vectors, top_k=self.hits_per_label, label=label)
+            for hits, label_hits in zip(per_query, results):
+                hits.extend(dict(hit, label=label) for hit in label_hits if hit["score"] >= self.min_score)
+        for hits in per_query:
+            hits.sort(key=lambda hit: -hit["score"])
+        return per_query
+
+    def retrieve_many(self, questions, query_vectors=None):
+        """
+        Retrieve packed graph context for a batch of questions.
+
+        Queries are embedded and searched together, and the hits of every
+        question are expanded in one traversal call.
+
+        Args:
+            questions (list of str): Natural language questions.
+            query_vectors (array-like, optional): Their embeddings, when already computed.
+
+        Returns:
+            list: One {"context", "hits", "triples", "tokens"} dict per question.
+        """
+        questions = list(questions)
+        if not questions:
+            return []
+        if query_vectors is None:
+            query_vectors = self.embed_queries(questions)
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        per_query = self.search_hits(query_vectors)
+
+        # One expansion over the distinct seeds of all questions
+        seeds = list(dict.fromkeys((hit["label"], hit["name"]) for hits in per_query for hit in hits))
+        positions = {seed: position for position, seed in enumerate(seeds)}
+        by_seed = {}
+        for triple in self.graph.expand(seeds, k=self.hops):
+            by_seed.setdefault(triple["seed"], []).append(triple)
+
+        retrieved = []
+        for hits in per_query:
+            triples = [dict(triple, seed=rank)
+                       for rank, hit in enumerate(hits)
+                       for triple in by_seed.get(positions[hit["label"], hit["name"]], ())]
+            context, packed_hits, packed_triples, tokens = pack_context(
+                hits, rank_triples(hits, triples, self.decay), self.max_tokens, self.count_tokens)
+            retrieved.append({"context": context, "hits": packed_hits, "triples": packed_triples, "tokens": tokens})
+        return retrieved
+
+    def retrieve(self, question):
+        """Retrieve packed graph context for one question."""
+        return self.retrieve_many([question])[0]
@@ -0,0 +1,368 @@
+"""
+Binary Graph Snapshot
+
+Stores the RAG knowledge graph (nodes, relationships, properties and node
+embeddings) in one compact columnar `.npz` file, as an alternative to the
+APOC Cypher text dump. Embeddings are kept as a raw float32 matrix (or a
+float16 / per-vector int8 quantised one) instead of decimal text. A snapshot
+can be built from a live Neo4j database or from an existing APOC dump, and
+restored either into Neo4j through batched `UNWIND` writes or straight into
+memory.
+
+Author: Xiang Xie (xiang.xie@ncl.ac.uk)
+Date: 17/10/2026
+"""
+
+import json
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from .kg_model import NODE_SPECS, PAIR_CATEGORIES, RELATION_SPECS, KnowledgeGraph
+    from .local_vector_index import QUANTIZED_PRECISIONS, LocalVectorIndex, _normalise_rows, dequantize, quantize
+    from .neo4j_import import create_schema, node_merge_query, relation_merge_query, run_in_batches
+except ImportError:
+    from kg_model import NODE_SPECS, PAIR_CATEGORIES, RELATION_SPECS, KnowledgeGraph
+    from local_vector_index import QUANTIZED_PRECISIONS, LocalVectorIndex, _normalise_rows, dequantize, quantize
+    from neo4j_import import create_schema, node_merge_query, relation_merge_query, run_in_batches
+
+SNAPSHOT_VERSION = 1
+
+# (start label, relationship type, end label) explicitly mapped back to the JSON relation category
+RELATION_CATEGORIES = {spec: rel_category for rel_category, spec in RELATION_SPECS.items()}
+
+# APOC dump statements (each UNWIND literal is on one line): one node batch per label, one relationship batch per type
+DUMP_NODE_PATTERN = re.compile(r"UNWIND (\[[^\n]*\]) AS row\nCREATE \(n:`UNIQUE IMPORT LABEL`[^\n]*SET n:(\w+);")
+DUMP_RELATION_PATTERN = re.compile(
+    r"UNWIND (\[[^\n]*\]) AS row\nMATCH \(start:[^\n]*\nMATCH \(end:[^\n]*\nCREATE \(start\)-\[r:(\w+)\]->\(end\)")
+# A double-quoted Cypher string, or an unquoted map key (which JSON needs quoted)
+CYPHER_TOKEN_PATTERN = re.compile(r'("(?:[^"\\]|\\.)*")|([{,]\s*)(\w+|`[^`]*`)\s*:')
+
+def cypher_literal_to_python(literal):
+    """Parse a Cypher list/map literal as written by APOC (unquoted keys) into Python objects."""
+    def quote_key(match):
+        if match.group(1):
+            return match.group(1)
+        return f'{match.group(2)}"{match.group(3).strip("`")}":'
+    return json.loads(CYPHER_TOKEN_PATTERN.sub(quote_key, literal))
+
+def parse_cypher_dump(dump_filepath):
+    """
+    Read the nodes and relationships of an APOC `export.cypher` dump.
+
+    Returns:
+        tuple: (nodes as (id, label, properties) tuples, edges as (start id, type, end id, properties) tuples).
+    """
+    with open(dump_filepath, 'r', encoding='utf-8') as file:
+        text = file.read()
+
+    nodes = [(row['_id'], label, row.get('properties', {}))
+             for literal, label in DUMP_NODE_PATTERN.findall(text)
+             for row in cypher_literal_to_python(literal)]
+    edges = [(row['start']['_id'], rel_type, row['end']['_id'], row.get('properties', {}))
+             for literal, rel_type in DUMP_RELATION_PATTERN.findall(text)
+             for row in cypher_literal_to_python(literal)]
+    return nodes, edges
+
+def fetch_graph(tx):
+    """Read every node and relationship of a Neo4j database as plain tuples."""
+    nodes = [(record["id"], record["label"], dict(record["props"])) for record in tx.run("""
+        MATCH (n)
+        RETURN elementId(n) AS id, labels(n)[0] AS label, properties(n) AS props
+    """)]
+    edges = [(record["start"], record["type"], record["end"], dict(record["props"])) for record in tx.run("""
+        MATCH (a)-[r]->(b)
+        RETURN elementId(a) AS start, type(r) AS type, elementId(b) AS end, properties(r) AS props
+    """)]
+    return nodes, edges
+
+class GraphSnapshot:
+    """
+    Columnar in-memory graph: one row per node and per relationship.
+
+    Node columns are `ids`, `node_label` (codes into `labels`), `properties`
+    (one list per scalar property name, None where a node lacks it) and
+    `embedding_row` (row into `embeddings`, -1 for nodes without an embedding).
+    Relationship columns are `edge_start`, `edge_end` (node rows) and
+    `edge_type` (codes into `rel_types`), with `edge_properties` as for nodes.
+    """
+
+    def __init__(self, ids, labels, node_label, properties, embedding_row, embeddings,
+                 rel_types, edge_start, edge_end, edge_type, edge_properties):
+        self.ids = ids
+        self.labels = labels
+        self.node_label = node_label
+        self.properties = properties
+        self.embedding_row = embedding_row
+        self.embeddings = embeddings
+        self.rel_types = rel_types
+        self.edge_start = edge_start
+        self.edge_end = edge_end
+        self.edge_type = edge_type
+        self.edge_properties = edge_properties
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def edge_count(self):
+        return len(self.edge_start)
+
+    @classmethod
+    def from_records(cls, nodes, edges, embedding_property="embedding"):
+        """
+        Build a snapshot from (id, label, properties) node tuples and
+        (start id, type, end id, properties) edge tuples.
+        """
+        labels, rel_types = [], []
+        label_codes, type_codes = {}, {}
+        ids, node_label, embedding_row, vectors = [], [], [], []
+        property_names = sorted({key for _, _, props in nodes for key in props if key != embedding_property})
+        properties = {name: [] for name in property_names}
+
+        for node_id, label, props in nodes:
+            ids.append(node_id)
+            node_label.append(label_codes.setdefault(label, len(labels)))
+            if len(labels) < len(label_codes):
+                labels.append(label)
+            for name in property_names:
+                properties[name].append(props.get(name))
+            embedding = props.get(embedding_property)
+            embedding_row.append(len(vectors) if embedding is not None else -1)
+            if embedding is not None:
+                vectors.append(embedding)
+
+        rows = {node_id: row for row, node_id in enumerate(ids)}
+        edge_start, edge_end, edge_type = [], [], []
+        edge_property_names = sorted({key for *_, props in edges for key in props})
+        edge_properties = {name: [] for name in edge_property_names}
+        for start, rel_type, end, props in edges:
+            edge_start.append(rows[start])
+            edge_end.append(rows[end])
+            edge_type.append(type_codes.setdefault(rel_type, len(rel_types)))
+            if len(rel_types) < len(type_codes):
+                rel_types.append(rel_type)
+            for name in edge_property_names:
+                edge_properties[name].append(props.get(name))
+
+        embeddings = np.asarray(vectors, dtype=np.float32) if vectors else np.zeros((0, 0), dtype=np.float32)
+        return cls(ids, labels, np.asarray(node_label, dtype=np.uint8), properties,
+                   np.asarray(embedding_row, dtype=np.int32), embeddings, rel_types,
+                   np.asarray(edge_start, dtype=np.int32), np.asarray(edge_end, dtype=np.int32),
+                   np.asarray(edge_type, dtype=np.uint8), edge_properties)
+
+    @classmethod
+    def from_cypher_dump(cls, dump_filepath):
+        """Build a snapshot from an APOC Cypher dump such as `data/RAG/neo4j_graph_dump.cypher`."""
+        return cls.from_records(*parse_cypher_dump(dump_filepath))
+
+    @classmethod
+    def from_neo4j(cls, driver):
+        """Build a snapshot of a live Neo4j database."""
+        with driver.session() as session:
+            nodes, edges = session.execute_read(fetch_graph)
+        return cls.from_records(nodes, edges)
+
+    def save(self, snapshot_filepath, dtype="float32"):
+        """
+        Write the snapshot to one `.npz` file.
+
+        Args:
+            snapshot_filepath (str or Path): Output file.
+            dtype (str): Embedding storage type, "float32", "float16" (half the size)
+                or "int8" (a quarter, plus one float32 scale per vector).
+
+        Returns:
+            Path: The snapshot file.
+        """
+        if dtype != "float32" and dtype not in QUANTIZED_PRECISIONS:
+            raise ValueError(f"Unsupported embedding dtype: {dtype!r} "
+                             f"(expected one of {('float32',) + QUANTIZED_PRECISIONS}).")
+        if dtype == "float32":
+            codes, scales = self.embeddings.astype(np.float32), None
+        else:
+            codes, scales = quantize(self.embeddings, dtype)
+        extra = {} if scales is None else {"embedding_scales": scales}
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "ids": self.ids,
+            "labels": self.labels,
+            "rel_types": self.rel_types,
+            "properties": self.properties,
+            "edge_properties": self.edge_properties,
+        }
+        snapshot_filepath = Path(snapshot_filepath)
+        snapshot_filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(snapshot_filepath, "wb") as file:
+            np.savez(
+                file,
+                meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+                node_label=self.node_label,
+                embedding_row=self.embedding_row,
+                embeddings=codes,
+                edge_start=self.edge_start,
+                edge_end=self.edge_end,
+                edge_type=self.edge_type,
+                **extra,
+            )
+        return snapshot_filepath
+
+    @classmethod
+    def load(cls, snapshot_filepath):
+        """Load a snapshot file into memory (float16 and int8 embeddings are restored to float32)."""
+        with np.load(snapshot_filepath) as arrays:
+            meta = json.loads(arrays["meta"].tobytes().decode("utf-8"))
+            if meta["version"] != SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported snapshot version: {meta['version']}")
+            scales = arrays["embedding_scales"] if "embedding_scales" in arrays.files else None
+            return cls(meta["ids"], meta["labels"], arrays["node_label"], meta["properties"],
+                       arrays["embedding_row"], dequantize(arrays["embeddings"], scales), meta["rel_types"],
+                       arrays["edge_start"], arrays["edge_end"], arrays["edge_type"], meta["edge_properties"])
+
+    def node_label_name(self, row):
+        return self.labels[self.node_label[row]]
+
+    def node_properties(self, row, with_embedding=True):
+        """Return the property map of one node (the embedding as a list of floats)."""
+        props = {name: values[row] for name, values in self.properties.items() if values[row] is not None}
+        if with_embedding and self.embedding_row[row] >= 0:
+            props["embedding"] = self.embeddings[self.embedding_row[row]].tolist()
+        return props
+
+    def edge_properties_of(self, edge):
+        """Return the property map of one relationship."""
+        return {name: values[edge] for name, values in self.edge_properties.items() if values[edge] is not None}
+
+    def node_key(self, row):
+        """Return the identifying property value of a node (`name`, or `description` for StreetCanyon)."""
+        label = self.node_label_name(row)
+        key = NODE_SPECS[label][1] if label in NODE_SPECS else "name"
+        return self.properties.get(key, [None] * len(self))[row]
+
+    def to_vector_index(self):
+        """Return a LocalVectorIndex over every embedded node (no database, no re-encoding)."""
+        rows = [row for row in range(len(self)) if self.embedding_row[row] >= 0]
+        rows.sort(key=lambda row: (self.node_label_name(row), row))
+        embeddings = self.embeddings[self.embedding_row[rows]] if rows else np.zeros((0, 0), dtype=np.float32)
+        categories = self.properties.get("category", [None] * len(self))
+        return LocalVectorIndex(
+            _normalise_rows(embeddings.astype(np.float32)) if rows else embeddings,
+            ids=[self.ids[row] for row in rows],
+            names=[self.node_key(row) for row in rows],
+            categories=[categories[row] for row in rows],
+            labels=[self.node_label_name(row) for row in rows],
+        )
+
+    def to_knowledge_graph(self):
+        """Return the nodes and relationships as a KnowledgeGraph (the validated JSON model)."""
+        graph = KnowledgeGraph()
+        categories = self.properties.get("category", [None] * len(self))
+        for row in range(len(self)):
+            label = self.node_label_name(row)
+            if label not in NODE_SPECS:
+                continue
+            group = NODE_SPECS[label][0]
+            category = (categories[row] or "Uncategorized") if graph.entities[group].categorised else None
+            graph.add_entity(group, self.node_key(row), category)
+        for start, end, code in zip(self.edge_start, self.edge_end, self.edge_type):
+            spec = (self.node_label_name(start), self.rel_types[code], self.node_label_name(end))
+            rel_category = RELATION_CATEGORIES.get(spec)
+            if rel_category is None:
+                continue
+            first, second = self.node_key(start), self.node_key(end)
+            # Pair relations are stored in JSON order, the reverse of the graph direction
+            if rel_category in PAIR_CATEGORIES:
+                first, second = second, first
+            if rel_category == "meteorological_dispersion_relations":
+                relation = {"meteorological_factor": {"type": first, "range": ""}, "pollutant": second}
+            elif rel_category == "street_canyon_dispersion_relations":
+                relation = {"pollutant": second, "street_canyon_description": first}
+            else:
+                relation = [first, second]
+            graph.add_relation(rel_category, relation, merge=True)
+        return graph
+
+def export_snapshot(source, snapshot_filepath, dtype="float32"):
+    """
+    Write a snapshot of a Neo4j database or of an APOC Cypher dump.
+
+    Args:
+        source: Neo4j driver, or the path of an APOC `.cypher` dump.
+        snapshot_filepath (str or Path): Output `.npz` file.
+        dtype (str): Embedding storage type, "float32", "float16" or "int8".
+
+    Returns:
+        GraphSnapshot: The exported snapshot.
+    """
+    if isinstance(source, (str, Path)):
+        snapshot = GraphSnapshot.from_cypher_dump(source)
+    else:
+        snapshot = GraphSnapshot.from_neo4j(source)
+    snapshot.save(snapshot_filepath, dtype=dtype)
+    print(f"✅ Snapshot of {len(snapshot)} nodes and {snapshot.edge_count} relationships saved to: "
+          f"{snapshot_filepath}")
+    return snapshot
+
+def load_snapshot_into_neo4j(driver, snapshot, batch_size=1000):
+    """
+    Restore a snapshot into Neo4j with batched `UNWIND` writes (the `neo4j_import`
+    bulk-mode queries), creating the uniqueness constraints first.
+
+    Args:
+        driver: Neo4j driver (or any object exposing a compatible `session()`).
+        snapshot (GraphSnapshot or str or Path): Snapshot or snapshot file.
+        batch_size (int): Maximum number of rows per round trip and transaction.
+
+    Returns:
+        dict: Import statistics (`nodes`, `relationships`, `seconds`, `rows_per_second`).
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer.")
+    if not isinstance(snapshot, GraphSnapshot):
+        snapshot = GraphSnapshot.load(snapshot)
+
+    node_rows = {}
+    for row in range(len(snapshot)):
+        label = snapshot.node_label_name(row)
+        if label not in NODE_SPECS:
+            print(f"⚠️ Skipping node with unsupported label: {label}")
+            continue
+        props = snapshot.node_properties(row)
+        props.pop(NODE_SPECS[label][1], None)
+        node_rows.setdefault(label, []).append({"key": snapshot.node_key(row), "props": props})
+
+    relation_rows = {}
+    for edge, (start, end, code) in enumerate(zip(snapshot.edge_start, snapshot.edge_end, snapshot.edge_type)):
+        spec = (snapshot.node_label_name(start), snapshot.rel_types[code], snapshot.node_label_name(end))
+        rel_category = RELATION_CATEGORIES.get(spec)
+        if rel_category is None:
+            print(f"⚠️ Skipping relationship with unsupported pattern: {spec}")
+            continue
+        relation_rows.setdefault(rel_category, []).append(
+            {"start": snapshot.node_key(start), "end": snapshot.node_key(end), "props": snapshot.edge_properties_of(edge)})
+
+    started = time.perf_counter()
+    node_count = relation_count = 0
+    with driver.session() as session:
+        create_schema(session)
+        for label, rows in node_rows.items():
+            node_count += run_in_batches(session, node_merge_query(label), rows, batch_size)
+        for rel_category, rows in relation_rows.items():
+            relation_count += run_in_batches(session, relation_merge_query(rel_category, with_properties=True), rows,
+                                             batch_size)
+
+    seconds = time.perf_counter() - started
+    total = node_count + relation_count
+    return {
+        "nodes": node_count,
+        "relationships": relation_count,
+        "seconds": seconds,
+        "rows_per_second": total / seconds if seconds > 0 else float("inf"),
+    }
+
+# Example usage
+if __name__ == "__main__":
+    export_snapshot(Path("../data/RAG/neo4j_graph_dump.cypher"), Path("../data/RAG/neo4j_graph_snapshot.npz"))
@@ -0,0 +1,308 @@
+"""
+Hybrid Lexical and Vector Entity Search
+
+Keeps a small in-memory inverted index over the knowledge graph entities:
+node names, the abbreviations given in parentheses ("Nitrogen oxides (NOx)",
+"Heavy goods vehicles (HGVs, trucks)") and the effect text of the dispersion
+relations touching each node. Queries are scored with BM25 and fused with
+vector search results by reciprocal rank fusion, so exact identifiers such as
+"PM2.5" or "NO2" rank as well as paraphrases do. A query that is exactly an
+entity name or abbreviation is answered from a hash lookup without running
+the embedding model.
+
+Author: Xiang Xie (xiang.xie@ncl.ac.uk)
+Date: 17/10/2026
+"""
+
+import re
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from .kg_model import DISPERSION_CATEGORIES, NODE_SPECS, RELATION_SPECS, KnowledgeGraph, as_graph
+    from .local_vector_index import INDEX_LABELS
+except ImportError:
+    from kg_model import DISPERSION_CATEGORIES, NODE_SPECS, RELATION_SPECS, KnowledgeGraph, as_graph
+    from local_vector_index import INDEX_LABELS
+
+# BM25 term frequency saturation and document length normalisation
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal rank fusion constant: a result at rank r contributes 1 / (RRF_K + r)
+RRF_K = 60
+
+# Question words that carry no entity information
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how in into is it its of on or that the their there these
+this to what when where which who why with
+""".split())
+
+# Identifiers keep their inner dots and commas ("pm2.5", "1,3"); hyphens and slashes split words
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+PARENTHESES_PATTERN = re.compile(r"\(([^()]*)\)")
+
+def normalise_token(token):
+    """Lower-case a token and drop a plural "s" ("HGVs" -> "hgv", "ships" -> "ship")."""
+    token = token.lower()
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def tokenize(text):
+    """Return the index terms of a text: lower-cased words and identifiers, stopwords removed."""
+    return [normalise_token(token) for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def normalise_name(text):
+    """Return the exact-lookup key of a name or query: lower case, single spaces, no outer punctuation."""
+    return re.sub(r"\s+", " ", text).strip().lower().strip(" ?!.,;:'\"")
+
+def name_aliases(name):
+    """
+    Return the alternative names written into an entity name: the name without its
+    parenthesised part and each comma, semicolon or slash separated item inside it.
+
+    Example: "Heavy goods vehicles (HGVs, trucks)" -> ["Heavy goods vehicles", "HGVs", "trucks"].
+    """
+    aliases = []
+    base = PARENTHESES_PATTERN.sub(" ", name).strip()
+    if base and base != name:
+        aliases.append(base)
+    for inner in PARENTHESES_PATTERN.findall(name):
+        aliases.extend(item.strip() for item in re.split(r"[,;/]", inner) if item.strip())
+    return aliases
+
+def reciprocal_rank_fusion(result_lists, top_k=5, k=RRF_K):
+    """
+    Fuse ranked result lists by reciprocal rank.
+
+    Scores are the reciprocal rank sum divided by its maximum (first in every list),
+    so they fall in (0, 1] on the same scale as exact lookups (1.0).
+
+    Args:
+        result_lists (list): Ranked lists of {"name", "category", ...} dicts for one query.
+        top_k (int): Number of fused results.
+        k (int): Fusion constant; larger values flatten the rank weights.
+
+    Returns:
+        list: {"name", "category", "score"} dicts, best first.
+    """
+    fused = {}
+    best = len(result_lists) / (k + 1.0)
+    for results in result_lists:
+        for rank, hit in enumerate(results, start=1):
+            key = (hit["name"], hit["category"])
+            entry = fused.setdefault(key, {"name": hit["name"], "category": hit["category"], "score": 0.0})
+            entry["score"] += 1.0 / (k + rank) / best
+    return sorted(fused.values(), key=lambda hit: -hit["score"])[:top_k]
+
+class LexicalIndex:
+    """
+    BM25 inverted index over knowledge graph entities, with an exact name lookup.
+
+    Each node is one document made of its name, its aliases (see `name_aliases`)
+    and the effect text of its dispersion relations. Postings store the
+    precomputed BM25 weight of each (term, document) pair, so a query is a sum of
+    a few short arrays.
+
+    Args:
+        labels, names, categories (list): Label, key and category (or None) of each node.
+        texts (list of str, optional): Extra text indexed with each node (e.g. relation effects).
+    """
+
+    def __init__(self, labels, names, categories, texts=None):
+        self.labels = list(labels)
+        self.names = list(names)
+        self.categories = list(categories)
+        texts = list(texts) if texts is not None else [""] * len(self.names)
+
+        self.label_names = list(dict.fromkeys(self.labels))
+        codes = {label: code for code, label in enumerate(self.label_names)}
+        self.label_codes = np.array([codes[label] for label in self.labels], dtype=np.int32)
+
+        # Exact lookup: normalised name or alias -> [(priority, node)], full names first
+        self._exact = {}
+        postings = {}
+        lengths = np.zeros(len(self.names), dtype=np.float32)
+        for node, (name, text) in enumerate(zip(self.names, texts)):
+            aliases = name_aliases(name)
+            for priority, key in enumerate([name] + aliases):
+                entries = self._exact.setdefault(normalise_name(key), [])
+                if all(existing != node for _, existing in entries):
+                    entries.append((min(priority, 1), node))
+            terms = Counter(tokenize(" ".join([name] + aliases + [text or ""])))
+            lengths[node] = sum(terms.values())
+            for term, count in terms.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(node)
+                postings[term][1].append(count)
+        for entries in self._exact.values():
+            entries.sort()
+
+        average_length = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+        self._postings = {}
+        for term, (nodes, counts) in postings.items():
+            nodes = np.asarray(nodes, dtype=np.int32)
+            counts = np.asarray(counts, dtype=np.float32)
+            idf = np.log(1.0 + (len(self.names) - len(nodes) + 0.5) / (len(nodes) + 0.5))
+            saturation = counts * (BM25_K1 + 1.0) / (
+                counts + BM25_K1 * (1.0 - BM25_B + BM25_B * lengths[nodes] / average_length))
+            self._postings[term] = (nodes, (idf * saturation).astype(np.float32))
+
+    def __len__(self):
+        return len(self.names)
+
+    # Construction
+    @classmethod
+    def from_json(cls, data):
+        """Build the index from validated JSON data, a JSON file or a KnowledgeGraph."""
+        if isinstance(data, (str, Path)):
+            data = KnowledgeGraph.load(data)
+        graph = as_graph(data)
+
+        labels, names, categories, nodes = [], [], [], {}
+        for label, (group, _) in NODE_SPECS.items():
+            for name, category in graph.iter_entities(group):
+                nodes[label, name] = len(names)
+                labels.append(label)
+                names.append(name)
+                categories.append(category)
+
+        texts = [[] for _ in names]
+        for rel_category in DISPERSION_CATEGORIES:
+            start_label, _, end_label = RELATION_SPECS[rel_category]
+            for relation in graph.iter_relations(rel_category):
+                if not relation.get("effect"):
+                    continue
+                if rel_category == "meteorological_dispersion_relations":
+                    start = relation["meteorological_factor"]["type"]
+                else:
+                    start = relation["street_canyon_description"]
+                for node in (nodes.get((start_label, start)), nodes.get((end_label, relation["pollutant"]))):
+                    if node is not None:
+                        texts[node].append(relation["effect"])
+        return cls(labels, names, categories, [" ".join(text) for text in texts])
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Build the index from a GraphSnapshot (relationship `effect` properties are indexed when present)."""
+        categories = snapshot.properties.get("category", [None] * len(snapshot))
+        texts = [[] for _ in range(len(snapshot))]
+        for start, end, effect in zip(snapshot.edge_start, snapshot.edge_end,
+                                      snapshot.edge_properties.get("effect", [None] * snapshot.edge_count)):
+            if effect:
+                texts[start].append(effect)
+                texts[end].append(effect)
+        return cls(
+            labels=[snapshot.node_label_name(row) for row in range(len(snapshot))],
+            names=[snapshot.node_key(row) for row in range(len(snapshot))],
+            categories=categories,
+            texts=[" ".join(text) for text in texts],
+        )
+
+    # Search
+    def _label_code(self, label=None, index_name=None):
+        if index_name is not None:
+            label = INDEX_LABELS.get(index_name, label)
+        if label is None:
+            return None
+        return self.label_names.index(label) if label in self.label_names else -1
+
+    def _hit(self, node, score):
+        return {"name": self.names[node], "category": self.categories[node], "score": float(score)}
+
+    def lookup(self, query, label=None, index_name=None):
+        """
+        Return the nodes whose name or alias is exactly the query (full-name matches first).
+
+        Returns:
+            list: {"name", "category", "score"} dicts with score 1.0; empty when nothing matches.
+        """
+        code = self._label_code(label, index_name)
+        return [self._hit(node, 1.0) for _, node in self._exact.get(normalise_name(query), ())
+                if code is None or self.label_codes[node] == code]
+
+    def search_many(self, query_texts, top_k=5, label=None, index_name=None):
+        """
+        Score query texts with BM25.
+
+        Args:
+            query_texts (list of str): Natural language queries.
+            top_k (int): Number of results per query.
+            label (str, optional): Restrict results to one node label.
+            index_name (str, optional): Restrict results to the label of a Neo4j vector index.
+
+        Returns:
+            list: One list per query of {"name", "category", "score"} dicts, best first
+            (nodes sharing no term with the query are left out).
+        """
+        code = self._label_code(label, index_name)
+        results = []
+        for query in query_texts:
+            scores = np.zeros(len(self.names), dtype=np.float32)
+            for term in set(tokenize(query)):
+                posting = self._postings.get(term)
+                if posting is not None:
+                    scores[posting[0]] += posting[1]
+            if code is not None:
+                scores[self.label_codes != code] = 0.0
+            matched = np.flatnonzero(scores > 0)
+            top = matched[np.argsort(-scores[matched], kind="stable")[:top_k]]
+            results.append([self._hit(node, scores[node]) for node in top])
+        return results
+
+    def search(self, query_text, top_k=5, label=None, index_name=None):
+        """Return the top-k BM25 results for a single query text."""
+        return self.search_many([query_text], top_k=top_k, label=label, index_name=index_name)[0]
+
+def hybrid_search_many(query_texts, lexical_index, vector_search_many, top_k=5, label=None, index_name=None,
+                       candidates=None, rrf_k=RRF_K):
+    """
+    Search query texts lexically and semantically and fuse the rankings.
+
+    Queries that exactly name an entity (or one of its abbreviations) are answered
+    from the lexical index alone, padded with BM25 results; only the remaining
+    queries are passed to `vector_search_many`, in one batch.
+
+    Args:
+        query_texts (list of str): Natural language queries.
+        lexical_index (LexicalIndex): BM25 index over the same nodes.
+        vector_search_many (callable): Maps (query texts, top_k) to one ranked result list per text.
+        top_k (int): Number of results per query.
+        label (str, optional): Restrict results to one node label.
+        index_name (str, optional): Restrict results to the label of a Neo4j vector index.
+        candidates (int, optional): Results taken from each ranking before fusion (default 4 * top_k, at least 20).
+        rrf_k (int): Reciprocal rank fusion constant.
+
+    Returns:
+        list: One list per query of {"name", "category", "score"} dicts, best first, with
+        scores in (0, 1]: exact matches score 1.0 and fused results their normalised
+        reciprocal rank sum (see `reciprocal_rank_fusion`).
+    """
+    query_texts = list(query_texts)
+    candidates = candidates or max(4 * top_k, 20)
+    results = [None] * len(query_texts)
+
+    remaining = []
+    for position, query in enumerate(query_texts):
+        exact = lexical_index.lookup(query, label=label, index_name=index_name)
+        if not exact:
+            remaining.append(position)
+            continue
+        # BM25 padding is ranked after the exact hits, so its fused scores stay below their 1.0
+        names = {(hit["name"], hit["category"]) for hit in exact}
+        lexical = [hit for hit in lexical_index.search(query, top_k=top_k + len(exact), label=label,
+                                                       index_name=index_name)
+                   if (hit["name"], hit["category"]) not in names]
+        padding = reciprocal_rank_fusion([exact + lexical], top_k=top_k, k=rrf_k)[len(exact):]
+        results[position] = (exact + padding)[:top_k]
+
+    if remaining:
+        texts = [query_texts[position] for position in remaining]
+        lexical = lexical_index.search_many(texts, top_k=candidates, label=label, index_name=index_name)
+        semantic = vector_search_many(texts, candidates)
+        for position, lexical_hits, semantic_hits in zip(remaining, lexical, semantic):
+            results[position] = reciprocal_rank_fusion([lexical_hits, semantic_hits], top_k=top_k, k=rrf_k)
+    return results
@@ -0,0 +1,468 @@
+"""
+Urban Air Quality Knowledge Graph Model
+
+Compact in-memory model of the air quality KG JSON shared by the validator,
+the merge and the Neo4j import. Every entity name and attribute text is
+interned once into a string table; entity and relation tables are stored in
+typed arrays of string ids, with hash indexes for O(1) membership checks and
+per-relation-type adjacency. The model loads from and dumps to the existing
+JSON format.
+
+Author: Xiang Xie (xiang.xie@ncl.ac.uk)
+Date: 16/10/2026
+"""
+
+import json
+from array import array
+
+# Entity groups explicitly mapped to whether their JSON value is categorised ({category: [names]})
+ENTITY_GROUPS = {
+    'pollutants': True,
+    'pollution_sources': True,
+    'mitigation_measures': True,
+    'meteorological_factors': False,
+    'street_canyons': False,
+}
+
+# Relation categories explicitly mapped to the entity groups of their (first, second) endpoint,
+# in the order they appear in the JSON
+RELATION_GROUPS = {
+    'pollutant_source_relations': ('pollutants', 'pollution_sources'),
+    'source_mitigation_relations': ('pollution_sources', 'mitigation_measures'),
+    'meteorological_dispersion_relations': ('meteorological_factors', 'pollutants'),
+    'street_canyon_dispersion_relations': ('street_canyons', 'pollutants'),
+}
+
+# Node labels explicitly mapped to their JSON category and identifying property
+NODE_SPECS = {
+    "Pollutant": ("pollutants", "name"),
+    "Source": ("pollution_sources", "name"),
+    "MitigationMeasure": ("mitigation_measures", "name"),
+    "MeteorologicalFactor": ("meteorological_factors", "name"),
+    "StreetCanyon": ("street_canyons", "description"),
+}
+
+# Relation categories explicitly mapped to (start label, relationship type, end label)
+RELATION_SPECS = {
+    "pollutant_source_relations": ("Source", "EMITS", "Pollutant"),
+    "source_mitigation_relations": ("MitigationMeasure", "MITIGATES", "Source"),
+    "meteorological_dispersion_relations": ("MeteorologicalFactor", "AFFECTS_DISPERSION", "Pollutant"),
+    "street_canyon_dispersion_relations": ("StreetCanyon", "AFFECTS_DISPERSION", "Pollutant"),
+}
+
+# Relation categories stored as [pollutant, source] / [source, mitigation] pairs
+PAIR_CATEGORIES = ("pollutant_source_relations", "source_mitigation_relations")
+
+DISPERSION_CATEGORIES = ('meteorological_dispersion_relations', 'street_canyon_dispersion_relations')
+
+# Descriptive relation fields that are merged rather than used for identity (a meteorological range is identity)
+RELATION_ATTRIBUTES = ['effect', 'direction']
+
+def canonical_relations(rel_category, relation):
+    """
+    Convert a relation into the canonical JSON shape used by the validator and importer.
+
+    Pair relations become two-item lists. Dispersion relations become
+    {"meteorological_factor": {"type", "range"}, "pollutant", ...} and
+    {"pollutant", "street_canyon_description", ...} dicts. The prompt-hints shape
+    ({"meteorological_factor": str, "pollutants": [...]} and
+    {"street_canyon_factor": str, ...}) is expanded into one relation per pollutant.
+
+    Returns:
+        list: Canonical relations (fresh objects that may be mutated).
+    """
+    if rel_category not in DISPERSION_CATEGORIES:
+        return [list(relation)]
+
+    attributes = {key: relation[key] for key in RELATION_ATTRIBUTES if relation.get(key)}
+    pollutants = relation.get('pollutants') or [relation.get('pollutant')]
+
+    if rel_category == 'meteorological_dispersion_relations':
+        factor = relation.get('meteorological_factor')
+        if isinstance(factor, dict):
+            factor = {'type': factor.get('type'), 'range': factor.get('range') or ''}
+        else:
+            factor = {'type': factor, 'range': relation.get('range') or ''}
+        return [{'meteorological_factor': dict(factor), 'pollutant': pollutant, **attributes}
+                for pollutant in pollutants]
+
+    description = relation.get('street_canyon_description', relation.get('street_canyon_factor'))
+    return [{'pollutant': pollutant, 'street_canyon_description': description, **attributes}
+            for pollutant in pollutants]
+
+def normalize_range(text):
+    """Return a meteorological range in comparable form: whitespace collapsed and case folded."""
+    return ' '.join((text or '').split()).casefold()
+
+def relation_key(rel_category, relation):
+    """
+    Return the hashable identity of a canonical relation: its (first, second) endpoints,
+    plus the range for meteorological relations, since the same factor can affect a
+    pollutant differently in different ranges. Ranges are compared after
+    `normalize_range`, so "High" and " high " are one range. Effect and direction are descriptive.
+    """
+    if rel_category == 'meteorological_dispersion_relations':
+        factor = relation['meteorological_factor']
+        return factor['type'], relation['pollutant'], normalize_range(factor['range'])
+    if rel_category == 'street_canyon_dispersion_relations':
+        return relation['street_canyon_description'], relation['pollutant']
+    return tuple(relation)
+
+def merge_attribute(current, incoming):
+    """Merge two descriptive texts, keeping each distinct non-empty value once."""
+    if not incoming:
+        return current
+    if not current:
+        return incoming
+    parts = current.split("; ")
+    return current if incoming in parts else f"{current}; {incoming}"
+
+class EntityTable:
+    """
+    Entities of one group: parallel arrays of category and name string ids,
+    plus a name -> first row index for O(1) membership checks.
+
+    A name may appear in several categories of the same group (as in the JSON);
+    every occurrence is kept so the dump round-trips.
+    """
+
+    __slots__ = ('group', 'categorised', 'categories', 'category', 'name', '_rows')
+
+    def __init__(self, group, categorised):
+        self.group = group
+        self.categorised = categorised
+        self.categories = array('l')   # category string ids in JSON order, including empty ones
+        self.category = array('l')     # per row; -1 for uncategorised groups
+        self.name = array('l')         # per row
+        self._rows = {}                # name string id -> first row
+
+    def __len__(self):
+        return len(self.name)
+
+class RelationTable:
+    """
+    Relations of one category: parallel arrays of (first, second) endpoint name
+    ids in JSON order and, for dispersion relations, the range, effect and
+    direction text ids. Rows are indexed by endpoint pair (for membership
+    checks) and by identity (the pair plus the range, see `relation_key`).
+    Adjacency indexes in both directions are built lazily.
+    """
+
+    __slots__ = ('rel_category', 'first', 'second', 'range', 'effect', 'direction', '_rows', '_keys', '_forward',
+                 '_backward')
+
+    def __init__(self, rel_category):
+        self.rel_category = rel_category
+        self.first = array('l')
+        self.second = array('l')
+        self.range = array('l')
+        self.effect = array('l')
+        self.direction = array('l')
+        self._rows = {}            # (first, second) -> first row
+        self._keys = {}            # (first, second, normalised range) -> row
+        self._forward = None       # first -> rows
+        self._backward = None      # second -> rows
+
+    def __len__(self):
+        return len(self.first)
+
+    def adjacency(self, reverse=False):
+        """Return the endpoint id -> row ids index for one direction, building it on first use."""
+        if self._forward is None:
+            self._forward, self._backward = {}, {}
+            for row, (first, second) in enumerate(zip(self.first, self.second)):
+                self._forward.setdefault(first, array('l')).append(row)
+                self._backward.setdefault(second, array('l')).append(row)
+        return self._backward if reverse else self._forward
+
+class KnowledgeGraph:
+    """
+    Interned, array-backed air quality knowledge graph.
+
+    Entities live in one `EntityTable` per entity group and relations in one
+    `RelationTable` per relation category. All strings go through one intern
+    table, so each distinct name is stored once however often it is referenced.
+    Relation endpoints are name ids, so relations that reference undeclared
+    entities are kept (the validator reports them).
+
+    Problems found while loading are recorded rather than raised:
+    `missing_keys`, `invalid_keys` (wrong JSON type), `malformed` entries
+    ((section, raw value) pairs) and `extra` (unknown top-level keys, kept
+    for the dump).
+    """
+
+    __slots__ = ('strings', '_ids', 'entities', 'relations', 'extra', 'missing_keys', 'invalid_keys', 'malformed')
+
+    def __init__(self):
+        self.strings = []
+        self._ids = {}
+        self.entities = {group: EntityTable(group, categorised) for group, categorised in ENTITY_GROUPS.items()}
+        self.relations = {rel_category: RelationTable(rel_category) for rel_category in RELATION_GROUPS}
+        self.extra = {}
+        self.missing_keys = []
+        self.invalid_keys = []
+        self.malformed = []
+
+    # String table
+    def intern(self, text):
+        """Return the id of a string, adding it to the string table if new."""
+        string_id = self._ids.get(text)
+        if string_id is None:
+            string_id = self._ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+    def string_id(self, text):
+        """Return the id of a string, or None if it was never interned."""
+        return self._ids.get(text)
+
+    # Entities
+    def add_category(self, group, category):
+        """Declare a (possibly empty) category of a categorised group."""
+        table = self.entities[group]
+        category_id = self.intern(category)
+        if category_id not in table.categories:
+            table.categories.append(category_id)
+        return category_id
+
+    def add_entity(self, group, name, category=None):
+        """Append an entity occurrence to a group. Returns its row."""
+        table = self.entities[group]
+        category_id = self.add_category(group, category) if table.categorised else -1
+        name_id = self.intern(name)
+        row = len(table.name)
+        table.name.append(name_id)
+        table.category.append(category_id)
+        table._rows.setdefault(name_id, row)
+        return row
+
+    def has_entity(self, group, name):
+        """Return whether a name is declared in a group (O(1))."""
+        name_id = self._ids.get(name)
+        return name_id is not None and name_id in self.entities[group]._rows
+
+    def entity_category(self, group, name):
+        """Return the category of the first occurrence of a declared name, or None."""
+        table = self.entities[group]
+        row = table._rows.get(self._ids.get(name))
+        if row is None or not table.categorised:
+            return None
+        return self.strings[table.category[row]]
+
+    def categories(self, group):
+        """Return the category names of a categorised group in JSON order."""
+        return [self.strings[category_id] for category_id in self.entities[group].categories]
+
+    def entity_names(self, group, category=None):
+        """
+        Return the entity names of a group in JSON order (category by category),
+        optionally restricted to one category.
+        """
+        table = self.entities[group]
+        if not table.categorised:
+            return [self.strings[name_id] for name_id in table.name]
+        category_ids = table.categories if category is None else [self._ids.get(category)]
+        names = []
+        for category_id in category_ids:
+            names.extend(self.strings[name_id]
+                         for name_id, row_category in zip(table.name, table.category) if row_category == category_id)
+        return names
+
+    def iter_entities(self, group):
+        """Yield unique (name, category) pairs of a group, keeping each name's first category."""
+        table = self.entities[group]
+        for name_id, row in table._rows.items():
+            category_id = table.category[row]
+            yield self.strings[name_id], self.strings[category_id] if category_id >= 0 else None
+
+    def ambiguous_entities(self, group):
+        """Return name -> distinct categories in JSON order, for the names listed under several categories."""
+        table = self.entities[group]
+        found = {}
+        for name_id, category_id in zip(table.name, table.category):
+            categories = found.setdefault(name_id, [])
+            if category_id not in categories:
+                categories.append(category_id)
+        return {self.strings[name_id]: [self.strings[category_id] for category_id in categories]
+                for name_id, categories in found.items() if len(categories) > 1}
+
+    # Relations
+    def add_relation(self, rel_category, relation, merge=False):
+        """
+        Append a canonical relation (see `canonical_relations`).
+
+        Args:
+            merge (bool): If a relation with the same identity (see `relation_key`) exists,
+                merge the descriptive attributes into it instead of appending a duplicate.
+
+        Returns:
+            bool: True if a new row was appended.
+        """
+        table = self.relations[rel_category]
+        first, second, *range_key = relation_key(rel_category, relation)
+        pair = (self.intern(first), self.intern(second))
+        key = pair + (self.intern(range_key[0] if range_key else ''),)
+        # The first spelling of a range is kept as written; the key only decides identity
+        range_text = relation['meteorological_factor']['range'] if range_key else ''
+        attributes = (relation.get('effect', '') if rel_category in DISPERSION_CATEGORIES else '',
+                      relation.get('direction', '') if rel_category in DISPERSION_CATEGORIES else '')
+
+        row = table._keys.get(key)
+        if merge and row is not None:
+            for column, incoming in zip((table.effect, table.direction), attributes):
+                current = self.strings[column[row]]
+                merged = merge_attribute(current, incoming or '')
+                if merged != current:
+                    column[row] = self.intern(merged)
+            return False
+
+        row = len(table.first)
+        table.first.append(pair[0])
+        table.second.append(pair[1])
+        table.range.append(self.intern(range_text))
+        table.effect.append(self.intern(attributes[0] or ''))
+        table.direction.append(self.intern(attributes[1] or ''))
+        table._rows.setdefault(pair, row)
+        table._keys.setdefault(key, row)
+        table._forward = table._backward = None
+        return True
+
+    def has_relation(self, rel_category, first, second):
+        """Return whether a relation between two names (in JSON order) exists (O(1))."""
+        first_id, second_id = self._ids.get(first), self._ids.get(second)
+        return (first_id, second_id) in self.relations[rel_category]._rows
+
+    def relation_pairs(self, rel_category):
+        """Yield the (first, second) endpoint names of every relation, in JSON order."""
+        table = self.relations[rel_category]
+        strings = self.strings
+        for first, second in zip(table.first, table.second):
+            yield strings[first], strings[second]
+
+    def iter_relations(self, rel_category):
+        """Yield every relation of a category as a fresh canonical JSON object."""
+        table = self.relations[rel_category]
+        strings = self.strings
+        for row in range(len(table)):
+            first, second = strings[table.first[row]], strings[table.second[row]]
+            if rel_category not in DISPERSION_CATEGORIES:
+                yield [first, second]
+                continue
+            attributes = {}
+            for attribute, column in zip(RELATION_ATTRIBUTES, (table.effect, table.direction)):
+                if strings[column[row]]:
+                    attributes[attribute] = strings[column[row]]
+            if rel_category == 'meteorological_dispersion_relations':
+                yield {'meteorological_factor': {'type': first, 'range': strings[table.range[row]]},
+                       'pollutant': second, **attributes}
+            else:
+                yield {'pollutant': second, 'street_canyon_description': first, **attributes}
+
+    def neighbours(self, rel_category, name, reverse=False):
+        """
+        Return the names related to `name` through one relation category.
+
+        Args:
+            reverse (bool): Follow relations from the second endpoint to the first
+                (e.g. pollutant -> sources for pollutant_source_relations).
+        """
+        table = self.relations[rel_category]
+        rows = table.adjacency(reverse).get(self._ids.get(name), ())
+        column = table.first if reverse else table.second
+        return [self.strings[column[row]] for row in rows]
+
+    # JSON conversion
+    @classmethod
+    def from_json(cls, data, merge_relations=False):
+        """
+        Build a graph from air quality JSON data.
+
+        Relations in the prompt-hints shape are expanded into canonical ones.
+
+        Args:
+            data (dict): Air quality JSON data.
+            merge_relations (bool): Collapse relations with the same identity
+                (see `relation_key`), merging their descriptive attributes.
+        """
+        graph = cls()
+        if not isinstance(data, dict):
+            graph.invalid_keys.append(None)
+            return graph
+
+        for group, categorised in ENTITY_GROUPS.items():
+            value = data.get(group)
+            if value is None:
+                graph.missing_keys.append(group)
+            elif not isinstance(value, dict if categorised else list):
+                graph.invalid_keys.append(group)
+            elif categorised:
+                for category, names in value.items():
+                    graph.add_category(group, category)
+                    graph._add_names(group, names if isinstance(names, list) else [names], category)
+            else:
+                graph._add_names(group, value, None)
+
+        for rel_category in RELATION_GROUPS:
+            value = data.get(rel_category)
+            if value is None:
+                graph.missing_keys.append(rel_category)
+            elif not isinstance(value, list):
+                graph.invalid_keys.append(rel_category)
+            else:
+                for relation in value:
+                    graph._add_raw_relation(rel_category, relation, merge_relations)
+
+        graph.extra = {key: value for key, value in data.items()
+                       if key not in ENTITY_GROUPS and key not in RELATION_GROUPS}
+        return graph
+
+    def _add_names(self, group, names, category):
+        for name in names:
+            if isinstance(name, str):
+                self.add_entity(group, name, category)
+            else:
+                self.malformed.append((group, name))
+
+    def _add_raw_relation(self, rel_category, relation, merge):
+        if rel_category in DISPERSION_CATEGORIES:
+            canonical = canonical_relations(rel_category, relation) if isinstance(relation, dict) else []
+        elif isinstance(relation, (list, tuple)) and len(relation) == 2:
+            canonical = [list(relation)]
+        else:
+            canonical = []
+        keys = [relation_key(rel_category, item)[:2] for item in canonical]
+        if not keys or not all(isinstance(endpoint, str) for key in keys for endpoint in key):
+            self.malformed.append((rel_category, relation))
+            return
+        for item in canonical:
+            self.add_relation(rel_category, item, merge=merge)
+
+    def to_json(self):
+        """Return the graph as air quality JSON data (canonical relation shapes)."""
+        data = {}
+        for group, table in self.entities.items():
+            if table.categorised:
+                data[group] = {category: self.entity_names(group, category) for category in self.categories(group)}
+            else:
+                data[group] = self.entity_names(group)
+        for rel_category in RELATION_GROUPS:
+            data[rel_category] = list(self.iter_relations(rel_category))
+        data.update(self.extra)
+        return data
+
+    @classmethod
+    def load(cls, filepath, merge_relations=False):
+        """Load a graph from an air quality JSON file."""
+        with open(filepath, 'r', encoding='utf-8') as file:
+            return cls.from_json(json.load(file), merge_relations=merge_relations)
+
+    def dump(self, filepath, indent=2):
+        """Write the graph to an air quality JSON file."""
+        with open(filepath, 'w', encoding='utf-8') as file:
+            json.dump(self.to_json(), file, indent=indent)
+
+def as_graph(data, merge_relations=False):
+    """Return `data` as a KnowledgeGraph, parsing it if it is JSON data."""
+    if isinstance(data, KnowledgeGraph):
+        return data
+    return KnowledgeGraph.from_json(data, merge_relations=merge_relations)
@@ -0,0 +1,412 @@
+"""
+Local NumPy Vector Index
+
+Exports node embeddings from Neo4j once into a contiguous, memory-mapped
+float32 matrix and answers top-k similarity queries in process, without a
+running database. The matrix can also be stored quantised (float16, or int8
+with a per-vector scale): searches then score the compact copy held in memory
+and re-rank the best candidates with the full-precision rows. Quantisation
+only applies to this index and to graph snapshots; Neo4j keeps the float list
+property its vector indexes require.
+
+Author: Xiang Xie (xiang.xie@ncl.ac.uk)
+Date: 16/10/2026
+"""
+
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Neo4j vector index names explicitly mapped to the node label they cover
+INDEX_LABELS = {
+    "pollutant_embeddings": "Pollutant",
+    "source_embeddings": "Source",
+    "mitigation_embeddings": "MitigationMeasure",
+    "meteorological_embeddings": "MeteorologicalFactor",
+    "street_canyon_embeddings": "StreetCanyon",
+}
+
+# Quantised embedding storage types, besides full-precision float32
+QUANTIZED_PRECISIONS = ("float16", "int8")
+
+# Labelled retrieval queries ({"question", "label", "relevant"}) for recall checks
+EVAL_QUERIES_PATH = Path(__file__).resolve().parent.parent / "data" / "eval" / "retrieval_queries.json"
+
+# Rows scored per block when searching a quantised matrix, bounding the float32 working copy
+SCORE_BLOCK_ROWS = 16384
+
+def index_label(index_name):
+    """Return the node label a vector index covers, rejecting unknown index names."""
+    if index_name not in INDEX_LABELS:
+        raise ValueError(f"Unknown vector index: {index_name!r} (expected one of {', '.join(INDEX_LABELS)}).")
+    return INDEX_LABELS[index_name]
+
+def _normalise_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def quantize(matrix, precision):
+    """
+    Quantise an embedding matrix.
+
+    int8 uses symmetric scalar quantisation per vector: `codes = round(row / scale)`
+    with `scale = max(|row|) / 127`, so `codes * scale` restores the row.
+
+    Args:
+        matrix (array-like): Matrix of shape (n, dim).
+        precision (str): "float16" or "int8".
+
+    Returns:
+        tuple: (codes, scales) where scales is a float32 vector for int8 and None for float16.
+    """
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    if precision == "float16":
+        return matrix.astype(np.float16), None
+    if precision == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0 if matrix.size else np.zeros(len(matrix), dtype=np.float32)
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unsupported precision: {precision!r} (expected one of {QUANTIZED_PRECISIONS}).")
+
+def dequantize(codes, scales=None):
+    """Return the float32 matrix approximated by quantised codes (and int8 scales)."""
+    matrix = np.asarray(codes, dtype=np.float32)
+    return matrix * np.asarray(scales, dtype=np.float32)[:, None] if scales is not None else matrix
+
+def fetch_embedded_nodes(tx):
+    query = """
+    MATCH (n)
+    WHERE n.embedding IS NOT NULL
+    RETURN elementId(n) AS id,
+           labels(n)[0] AS label,
+           coalesce(n.name, n.description) AS name,
+           n.category AS category,
+           n.embedding AS embedding
+    ORDER BY label, id
+    """
+    return [dict(rec) for rec in tx.run(query)]
+
+def write_vector_index(output_dir, ids, names, categories, labels, embeddings, precisions=()):
+    """
+    Write an index directory: `embeddings.npy` (float32, rows L2-normalised and
+    grouped by label) plus `meta.json` with the id, name, category and label side arrays.
+    Each requested quantised precision adds `embeddings.<precision>.npy`
+    (and `scales.int8.npy` for int8).
+
+    Args:
+        output_dir (str or Path): Directory to write to (created if missing).
+        ids, names, categories, labels (list): One entry per embedding row.
+        embeddings (array-like): Matrix of shape (n, dim).
+        precisions (iterable of str): Quantised copies to write ("float16", "int8").
+
+    Returns:
+        Path: The index directory.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Group rows by label so each label is one contiguous slice of the matrix
+    order = sorted(range(len(ids)), key=lambda row: (labels[row], row))
+    matrix = _normalise_rows(np.asarray(embeddings, dtype=np.float32)[order]) if order else \
+        np.zeros((0, 0), dtype=np.float32)
+    np.save(output_dir / "embeddings.npy", matrix.astype(np.float32))
+    for precision in precisions:
+        codes, scales = quantize(matrix, precision)
+        np.save(output_dir / f"embeddings.{precision}.npy", codes)
+        if scales is not None:
+            np.save(output_dir / f"scales.{precision}.npy", scales)
+
+    sorted_labels = [labels[row] for row in order]
+    label_ranges = {}
+    for row, label in enumerate(sorted_labels):
+        label_ranges.setdefault(label, [row, row])[1] = row + 1
+
+    with open(output_dir / "meta.json", "w", encoding="utf-8") as file:
+        json.dump({
+            "ids": [ids[row] for row in order],
+            "names": [names[row] for row in order],
+            "categories": [categories[row] for row in order],
+            "labels": sorted_labels,
+            "label_ranges": label_ranges,
+        }, file)
+    return output_dir
+
+def export_vector_index(driver, output_dir, precisions=()):
+    """
+    Export every embedded node from Neo4j into a local index directory.
+
+    Args:
+        driver: Neo4j driver.
+        output_dir (str or Path): Directory to write the index to.
+        precisions (iterable of str): Quantised copies to write as well ("float16", "int8").
+
+    Returns:
+        Path: The index directory.
+    """
+    with driver.session() as session:
+        nodes = session.execute_read(fetch_embedded_nodes)
+
+    write_vector_index(
+        output_dir,
+        ids=[node["id"] for node in nodes],
+        names=[node["name"] for node in nodes],
+        categories=[node["category"] for node in nodes],
+        labels=[node["label"] for node in nodes],
+        embeddings=[node["embedding"] for node in nodes],
+        precisions=precisions,
+    )
+    print(f"✅ Exported {len(nodes)} embeddings to: {output_dir}")
+    return Path(output_dir)
+
+def _top_rows(scores, k):
+    """Return the column indexes of the k best scores of each row, best first."""
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+class LocalVectorIndex:
+    """
+    In-process cosine similarity index over L2-normalised float32 embeddings.
+
+    Scores are reported as `(1 + cosine) / 2`, the same scale Neo4j's cosine
+    vector indexes return, so results are interchangeable with
+    `db.index.vector.queryNodes`.
+
+    With a quantised copy (`quantized`, plus `scales` for int8), searches score
+    the compact matrix first and re-rank the best `rerank * top_k` candidates
+    with exact float32 scores, so only those full-precision rows are read.
+
+    Args:
+        embeddings (array-like): Float32 matrix (possibly memory-mapped), rows grouped by label.
+        ids, names, categories, labels (list): One entry per row.
+        label_ranges (dict, optional): Label -> [start, end) row range.
+        quantized (numpy.ndarray, optional): float16 or int8 copy of `embeddings` used for scoring.
+        scales (numpy.ndarray, optional): Per-row scales of an int8 copy.
+        rerank (int): Candidates re-ranked exactly per requested result.
+    """
+
+    def __init__(self, embeddings, ids, names, categories, labels, label_ranges=None, quantized=None,
+                 scales=None, rerank=4):
+        self.embeddings = embeddings
+        self.ids = ids
+        self.names = names
+        self.categories = categories
+        self.labels = labels
+        if label_ranges is None:
+            label_ranges = {}
+            for row, label in enumerate(labels):
+                label_ranges.setdefault(label, [row, row])[1] = row + 1
+        self.label_ranges = label_ranges
+        self.quantized = quantized
+        self.scales = scales
+        self.rerank = rerank
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def precision(self):
+        return "float32" if self.quantized is None else self.quantized.dtype.name
+
+    @classmethod
+    def load(cls, index_dir, mmap=True, precision="float32", rerank=4):
+        """
+        Load an index directory written by `write_vector_index`, memory-mapping the float32 matrix.
+
+        Args:
+            index_dir (str or Path): Index directory.
+            mmap (bool): Memory-map the float32 matrix instead of reading it.
+            precision (str): "float32", or a quantised copy written with the index
+                ("float16", "int8") to load into memory for scoring.
+            rerank (int): Candidates re-ranked exactly per requested result.
+        """
+        index_dir = Path(index_dir)
+        embeddings = np.load(index_dir / "embeddings.npy", mmap_mode="r" if mmap else None)
+        quantized = scales = None
+        if precision != "float32":
+            quantized = np.load(index_dir / f"embeddings.{precision}.npy")
+            if precision == "int8":
+                scales = np.load(index_dir / f"scales.{precision}.npy")
+        with open(index_dir / "meta.json", "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        return cls(embeddings, meta["ids"], meta["names"], meta["categories"], meta["labels"],
+                   meta["label_ranges"], quantized=quantized, scales=scales, rerank=rerank)
+
+    def quantized_copy(self, precision, rerank=None):
+        """Return an index sharing this one's rows, scoring a `precision` copy quantised in memory."""
+        if precision == "float32":
+            quantized = scales = None
+        else:
+            quantized, scales = quantize(self.embeddings, precision)
+        return LocalVectorIndex(self.embeddings, self.ids, self.names, self.categories, self.labels,
+                                self.label_ranges, quantized=quantized, scales=scales,
+                                rerank=self.rerank if rerank is None else rerank)
+
+    @property
+    def nbytes(self):
+        """Bytes of the matrix searched in memory (the quantised copy when present)."""
+        if self.quantized is None:
+            return int(np.asarray(self.embeddings).nbytes)
+        return int(self.quantized.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def _rows(self, label=None, index_name=None):
+        if index_name is not None:
+            label = index_label(index_name)
+        if label is None:
+            return 0, len(self.ids)
+        start, end = self.label_ranges.get(label, (0, 0))
+        return start, end
+
+    def _approximate_scores(self, queries, start, end):
+        """Score queries against rows [start, end) of the quantised copy, block by block."""
+        scores = np.empty((len(queries), end - start), dtype=np.float32)
+        for block in range(start, end, SCORE_BLOCK_ROWS):
+            stop = min(block + SCORE_BLOCK_ROWS, end)
+            block_scores = queries @ self.quantized[block:stop].astype(np.float32).T
+            if self.scales is not None:
+                block_scores *= self.scales[block:stop]
+            scores[:, block - start:stop - start] = block_scores
+        return scores
+
+    def search_many(self, query_vectors, top_k=5, label=None, index_name=None):
+        """
+        Score a batch of query vectors against the index in one matrix product.
+
+        Args:
+            query_vectors (array-like): Matrix of shape (q, dim).
+            top_k (int): Number of results per query.
+            label (str, optional): Restrict results to one node label.
+            index_name (str, optional): Restrict results to the label of a Neo4j vector index.
+
+        Returns:
+            list: One list per query of {"name", "category", "score"} dicts, best first.
+        """
+        queries = _normalise_rows(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        start, end = self._rows(label, index_name)
+        if end <= start or top_k < 1:
+            return [[] for _ in range(len(queries))]
+
+        if self.quantized is None:
+            scores = queries @ self.embeddings[start:end].T
+            top = _top_rows(scores, min(top_k, end - start))
+            top_scores = np.take_along_axis(scores, top, axis=1)
+        else:
+            # Shortlist on the compact copy, then re-rank the shortlist with exact float32 scores
+            candidates = _top_rows(self._approximate_scores(queries, start, end),
+                                   min(max(top_k * self.rerank, top_k), end - start))
+            rows = np.asarray(self.embeddings[start + candidates.ravel()], dtype=np.float32)
+            exact = np.einsum("qcd,qd->qc", rows.reshape(*candidates.shape, -1), queries)
+            order = _top_rows(exact, min(top_k, candidates.shape[1]))
+            top = np.take_along_axis(candidates, order, axis=1)
+            top_scores = np.take_along_axis(exact, order, axis=1)
+
+        return [
+            [{"name": self.names[start + row], "category": self.categories[start + row],
+              "score": float((1.0 + score) / 2.0)}
+             for row, score in zip(rows, row_scores)]
+            for rows, row_scores in zip(top, top_scores)
+        ]
+
+    def search(self, query_vector, top_k=5, label=None, index_name=None):
+        """Return the top-k nodes for a single query vector."""
+        return self.search_many([query_vector], top_k=top_k, label=label, index_name=index_name)[0]
+
+def load_eval_queries(path=EVAL_QUERIES_PATH):
+    """Return the labelled retrieval queries: dicts with "question", "label" and "relevant" node names."""
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def evaluate_recall(index, query_vectors, queries, top_k=5, verbose=True):
+    """
+    Mean recall@k of an index on labelled queries.
+
+    Only the relevant names present in the index under the query's label count,
+    and queries with none of them are skipped, so a partial graph is not
+    penalised for nodes it lacks. Skipped queries and missing names are
+    returned (and printed when `verbose`) so a stale query set is noticed.
+
+    Args:
+        index (LocalVectorIndex): Index to evaluate.
+        query_vectors (array-like): One embedding per query.
+        queries (list of dict): Labelled queries (see `load_eval_queries`).
+        top_k (int): Results retrieved per query.
+        verbose (bool): Print a warning listing skipped queries and missing names.
+
+    Returns:
+        dict: "recall", the number of "queries" evaluated, the "skipped" questions
+        and the "missing" relevant names per question.
+    """
+    indexed = set(zip(index.labels, index.names))
+    recalls = []
+    skipped = []
+    missing = {}
+    for query, vector in zip(queries, query_vectors):
+        label = query.get("label")
+        relevant = {name for name in query["relevant"]
+                    if (label, name) in indexed or (label is None and name in index.names)}
+        absent = [name for name in query["relevant"] if name not in relevant]
+        if absent:
+            missing[query["question"]] = absent
+        if not relevant:
+            skipped.append(query["question"])
+            continue
+        hits = index.search(vector, top_k=top_k, label=label)
+        recalls.append(len(relevant & {hit["name"] for hit in hits}) / min(len(relevant), top_k))
+    if verbose and missing:
+        print(f"⚠️ {sum(map(len, missing.values()))} relevant names are not in the index; "
+              f"{len(skipped)} of {len(queries)} queries skipped")
+        for question, names in missing.items():
+            print(f"   {'skipped' if question in skipped else 'partial'}: {question!r} lacks {names}")
+    return {"recall": float(np.mean(recalls)) if recalls else 0.0, "queries": len(recalls),
+            "skipped": skipped, "missing": missing}
+
+def compare_precisions(index, query_vectors, queries=None, top_k=5, precisions=QUANTIZED_PRECISIONS, rerank=4,
+                       label=None):
+    """
+    Compare quantised searches of a float32 index against its exact results.
+
+    Args:
+        index (LocalVectorIndex): Full-precision index.
+        query_vectors (array-like): Query embeddings.
+        queries (list of dict, optional): Labelled queries matching `query_vectors`, for recall@k
+            (each query is then searched within its own label).
+        top_k (int): Results per query.
+        precisions (iterable of str): Quantised precisions to compare.
+        rerank (int): Candidates re-ranked exactly per requested result.
+        label (str, optional): Restrict unlabelled searches to one node label.
+
+    Returns:
+        dict: Precision -> {"bytes", "overlap" (share of the exact float32 top-k found),
+        "ms_per_query", and "recall" when `queries` is given}.
+    """
+    query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+    labels = [query.get("label") for query in queries] if queries is not None else [label] * len(query_vectors)
+
+    def top_names(candidate):
+        started = time.perf_counter()
+        results = [candidate.search(vector, top_k=top_k, label=query_label)
+                   for vector, query_label in zip(query_vectors, labels)]
+        elapsed = (time.perf_counter() - started) * 1000 / max(len(query_vectors), 1)
+        return [[hit["name"] for hit in hits] for hits in results], elapsed
+
+    exact, _ = top_names(index)
+    report = {}
+    for precision in ("float32",) + tuple(precisions):
+        candidate = index if precision == "float32" else index.quantized_copy(precision, rerank=rerank)
+        found, elapsed = top_names(candidate)
+        overlaps = [len(set(hits) & set(reference)) / len(set(reference)) for hits, reference in zip(found, exact)
+                    if reference]
+        report[precision] = {"bytes": candidate.nbytes, "overlap": float(np.mean(overlaps)) if overlaps else 1.0,
+                             "ms_per_query": elapsed}
+        if queries is not None:
+            # Every precision holds the same nodes, so missing names are reported once
+            report[precision]["recall"] = evaluate_recall(candidate, query_vectors, queries, top_k,
+                                                          verbose=precision == "float32")["recall"]
+    return report
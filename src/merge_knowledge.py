@@ -8,10 +8,25 @@ Author: Xiang Xie (xiang.xie@ncl.ac.uk)
 Date: 28/02/2025
 """
 
+import hashlib
+import heapq
 import json
-from fuzzywuzzy import process
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from fuzzywuzzy import fuzz, process, utils
 from pathlib import Path
 
+try:
+    from .kg_model import ENTITY_GROUPS, RELATION_GROUPS, KnowledgeGraph, as_graph
+except ImportError:
+    from kg_model import ENTITY_GROUPS, RELATION_GROUPS, KnowledgeGraph, as_graph
+
+# Parenthesised text such as "(NOx)" or "(HGVs, trucks)"
+PARENTHESISED_PATTERN = re.compile(r"\(([^()]*)\)")
+# Abbreviation-like aliases: short, no spaces, with an upper-case letter or digit (NOx, PM2.5, LEZ)
+ABBREVIATION_PATTERN = re.compile(r"[A-Za-z0-9.+\-]{1,10}")
+
 def load_json(filepath):
     """Explicitly load JSON data from the given file path."""
     with open(filepath, 'r', encoding='utf-8') as file:
@@ -30,77 +45,248 @@ def fuzzy_match(entity, entity_list, threshold=85):
         return match if score >= threshold else None
     return None
 
+def normalise_name(name):
+    """
+    Normalise an entity name for matching.
+
+    Args:
+        name (str): Raw entity name, e.g. "Nitrogen oxides (NOx)".
+
+    Returns:
+        tuple: (processed name, list of processed abbreviation aliases),
+        e.g. ("nitrogen oxides nox", ["nox"]).
+    """
+    aliases = []
+    for group in PARENTHESISED_PATTERN.findall(name):
+        for part in group.split(","):
+            part = part.strip()
+            if ABBREVIATION_PATTERN.fullmatch(part) and any(c.isupper() or c.isdigit() for c in part):
+                aliases.append(utils.full_process(part))
+    return utils.full_process(name), [alias for alias in aliases if alias]
+
+def name_grams(processed):
+    """Return the blocking keys of a processed name: its tokens and their padded character trigrams."""
+    grams = set()
+    for token in processed.split():
+        grams.add(token)
+        padded = f" {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class EntityIndex:
+    """
+    Blocked fuzzy-matching index over entity names, built once per merge.
+
+    Exact matches on the processed name or on a unique abbreviation alias are
+    answered by dictionary lookup. Otherwise candidates sharing tokens or
+    character trigrams with the query are blocked, the `max_candidates` with
+    the most shared keys are kept, and only those are scored with fuzzywuzzy's
+    WRatio (the scorer `fuzzy_match` uses).
+
+    Args:
+        names (iterable of str): Initial entity names.
+        threshold (int): Minimum WRatio score for a fuzzy match.
+        max_candidates (int): Number of blocked candidates scored per query.
+        max_posting (int): Blocking keys shared by more entities than this are
+            ignored when the query has rarer keys.
+    """
+
+    def __init__(self, names=(), threshold=85, max_candidates=50, max_posting=5000):
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.max_posting = max_posting
+        self.names = []
+        self._exact = {}
+        self._aliases = {}
+        self._postings = defaultdict(list)
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return utils.full_process(name) in self._exact
+
+    def add(self, name):
+        """Insert an accepted entity name into the index."""
+        processed, aliases = normalise_name(name)
+        if processed in self._exact:
+            return
+        entity_id = len(self.names)
+        self.names.append(name)
+        self._exact[processed] = entity_id
+        for alias in aliases:
+            # An alias shared by several entities is ambiguous and never used for exact lookups
+            self._aliases[alias] = entity_id if alias not in self._aliases else None
+        for gram in name_grams(" ".join([processed] + aliases)):
+            self._postings[gram].append(entity_id)
+
+    def candidates(self, processed):
+        """
+        Return the ids of the blocked candidates for a processed query, in insertion order.
+
+        The `max_candidates` ids sharing the most keys are kept (ties go to the
+        earlier entity), and returned in insertion order so WRatio ties resolve
+        to the earlier name, as with a full scan. Neither step depends on set
+        iteration order, so results are the same under any hash seed.
+        """
+        postings = [self._postings[gram] for gram in name_grams(processed) if gram in self._postings]
+        selective = [posting for posting in postings if len(posting) <= self.max_posting]
+        counts = Counter()
+        for posting in selective or postings:
+            counts.update(posting)
+        best = heapq.nsmallest(self.max_candidates, counts.items(), key=lambda item: (-item[1], item[0]))
+        return sorted(entity_id for entity_id, _ in best)
+
+    def match(self, name):
+        """Return the best matching indexed name above the threshold, or None."""
+        if not name:
+            return None
+        processed, _ = normalise_name(name)
+        if not processed:
+            return None
+        if processed in self._exact:
+            return self.names[self._exact[processed]]
+        if self._aliases.get(processed) is not None:
+            return self.names[self._aliases[processed]]
+
+        candidate_names = [self.names[entity_id] for entity_id in self.candidates(processed)]
+        result = process.extractOne(name, candidate_names, scorer=fuzz.WRatio)
+        if result and result[1] >= self.threshold:
+            return result[0]
+        return None
+
+RELATION_CATEGORIES = list(RELATION_GROUPS)
+
+def merge_data(base_data, new_data):
+    """
+    Merge new air quality knowledge into base knowledge in memory.
+
+    Both sides are parsed once into a `KnowledgeGraph`; the base graph collapses
+    duplicate relations and absorbs the new entities and relations.
+
+    Args:
+        base_data (dict or KnowledgeGraph): Base knowledge; a dict is updated in place.
+        new_data (dict or KnowledgeGraph): Knowledge to fold into the base.
+
+    Returns:
+        dict: The merged base data.
+    """
+    graph = KnowledgeGraph.from_json(base_data.to_json() if isinstance(base_data, KnowledgeGraph) else base_data,
+                                     merge_relations=True)
+    new_graph = as_graph(new_data)
+
+    # Merge entities explicitly, one blocked index per category (and subclass)
+    for group, categorised in ENTITY_GROUPS.items():
+        for category in (new_graph.categories(group) if categorised else [None]):
+            if categorised:
+                graph.add_category(group, category)
+            index = EntityIndex(graph.entity_names(group, category))
+            for entity in new_graph.entity_names(group, category):
+                if not index.match(entity):
+                    graph.add_entity(group, entity, category)
+                    index.add(entity)
+
+    # Build the relation lookup indexes once, after all entities are merged
+    flat_index = EntityIndex(
+        graph.entity_names('pollutants') +
+        graph.entity_names('pollution_sources') +
+        graph.entity_names('mitigation_measures') +
+        graph.entity_names('street_canyons')
+    )
+    meteorological_index = EntityIndex(graph.entity_names('meteorological_factors'))
+
+    # Merge relations explicitly; the graph keeps one relation per identity (endpoints, plus range for meteorology)
+    def resolve_entity(name):
+        matched = flat_index.match(name)
+        return matched if matched else name
+
+    def resolve_factor(factor_type):
+        matched = meteorological_index.match(factor_type)
+        if matched:
+            return matched
+        graph.add_entity('meteorological_factors', factor_type)
+        meteorological_index.add(factor_type)
+        return factor_type
+
+    for rel_category in RELATION_CATEGORIES:
+        for canonical in new_graph.iter_relations(rel_category):
+            if rel_category == 'meteorological_dispersion_relations':
+                factor = canonical['meteorological_factor']
+                factor['type'] = resolve_factor(factor['type'])
+                canonical['pollutant'] = resolve_entity(canonical['pollutant'])
+            elif rel_category == 'street_canyon_dispersion_relations':
+                canonical['pollutant'] = resolve_entity(canonical['pollutant'])
+                canonical['street_canyon_description'] = resolve_entity(canonical['street_canyon_description'])
+            else:
+                canonical = [resolve_entity(item) for item in canonical]
+            graph.add_relation(rel_category, canonical, merge=True)
+
+    merged = graph.to_json()
+    if isinstance(base_data, dict):
+        base_data.clear()
+        base_data.update(merged)
+        return base_data
+    return merged
+
 def merge_knowledge(base_filepath, new_filepath, output_filepath):
     """Merge air quality knowledge explicitly from two JSON files."""
     base_data = load_json(base_filepath)
     new_data = load_json(new_filepath)
 
-    entity_categories = ['pollutants', 'pollution_sources', 'mitigation_measures',
-                         'meteorological_factors', 'street_canyons']
-
-    # Merge entities explicitly
-    for category in entity_categories:
-        base_entities = base_data.get(category, {})
-        new_entities = new_data.get(category, {})
-
-        if isinstance(base_entities, dict):
-            for subclass, entities in new_entities.items():
-                base_subclass_entities = base_entities.get(subclass, [])
-                for entity in entities:
-                    matched_entity = fuzzy_match(entity, base_subclass_entities)
-                    if not matched_entity:
-                        base_subclass_entities.append(entity)
-                base_entities[subclass] = base_subclass_entities
-        elif isinstance(base_entities, list):
-            for entity in new_entities:
-                matched_entity = fuzzy_match(entity, base_entities)
-                if not matched_entity:
-                    base_entities.append(entity)
-
-        base_data[category] = base_entities
-
-    # Merge relations explicitly
-    relation_categories = [
-        'pollutant_source_relations',
-        'source_mitigation_relations',
-        'meteorological_dispersion_relations',
-        'street_canyon_dispersion_relations'
-    ]
-
-    for rel_category in relation_categories:
-        base_relations = base_data.get(rel_category, [])
-        new_relations = new_data.get(rel_category, [])
-
-        for relation in new_relations:
-            matched_relation = []
-
-            for item in relation:
-                if rel_category == 'meteorological_dispersion_relations' and isinstance(item, dict):
-                    factor_type = item.get('type')
-                    base_meteorological_factors = base_data.get('meteorological_factors', [])
-                    matched_type = fuzzy_match(factor_type, base_meteorological_factors)
-                    if matched_type:
-                        matched_relation.append({'type': matched_type, 'range': item.get('range', '')})
-                    else:
-                        base_meteorological_factors.append(factor_type)
-                        base_data['meteorological_factors'] = base_meteorological_factors
-                        matched_relation.append(item)
-                else:
-                    flat_base_entities = sum(base_data['pollutants'].values(), []) + \
-                                         sum(base_data['pollution_sources'].values(), []) + \
-                                         sum(base_data['mitigation_measures'].values(), []) + \
-                                         base_data.get('street_canyons', [])
-                    matched_item = fuzzy_match(item, flat_base_entities)
-                    matched_relation.append(matched_item if matched_item else item)
-
-            if matched_relation not in base_relations:
-                base_relations.append(matched_relation)
-
-        base_data[rel_category] = base_relations
-
-    save_json(output_filepath, base_data)
+    save_json(output_filepath, merge_data(base_data, new_data))
     print("✅ JSON files merged successfully into:", output_filepath)
 
+def content_hash(data):
+    """Return a hash of JSON data that does not depend on key order."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def _merge_pair(pair):
+    return merge_data(*pair)
+
+def merge_many(filepaths, output_filepath, base_filepath=None, max_workers=None):
+    """
+    Merge many extraction JSON files with a pairwise tree reduction across a process pool.
+
+    Inputs are ordered by content hash before reducing, so the result does not
+    depend on the order of `filepaths`. When a base KG is given, the reduced
+    extractions are folded into it last so its entity names take precedence.
+    The output JSON is written once.
+
+    Args:
+        filepaths (iterable of str, Path or dict): Extraction JSON files to merge
+            (or extraction data that is already loaded).
+        output_filepath (str or Path): Path of the merged JSON output.
+        base_filepath (str or Path, optional): Validated base KG to merge into.
+        max_workers (int, optional): Worker processes (defaults to the CPU count).
+
+    Returns:
+        dict: The merged knowledge.
+    """
+    filepaths = list(filepaths)
+    datasets = sorted((path if isinstance(path, dict) else load_json(path) for path in filepaths),
+                      key=content_hash)
+    if not datasets and base_filepath is None:
+        raise ValueError("merge_many needs at least one input file.")
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while len(datasets) > 1:
+            pairs = [(datasets[i], datasets[i + 1]) for i in range(0, len(datasets) - 1, 2)]
+            carried = [datasets[-1]] if len(datasets) % 2 else []
+            if len(pairs) == 1:
+                datasets = [_merge_pair(pairs[0])] + carried
+            else:
+                datasets = list(executor.map(_merge_pair, pairs)) + carried
+
+    merged = datasets[0] if datasets else {}
+    if base_filepath is not None:
+        merged = merge_data(load_json(base_filepath), merged)
+
+    save_json(output_filepath, merged)
+    print(f"✅ {len(filepaths)} JSON files merged successfully into:", output_filepath)
+    return merged
+
 # Example usage explicitly
 if __name__ == "__main__":
     base_filepath = Path('Validated_air_quality_knowledge.json')
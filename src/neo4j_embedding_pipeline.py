@@ -7,62 +7,147 @@ Author: Xiang Xie (xiang.xie@ncl.ac.uk)
 Date: 02/03/2025
 """
 
-from neo4j import GraphDatabase
-from sentence_transformers import SentenceTransformer
-import getpass
+import hashlib
 
-# Explicit Neo4j connection setup
-NEO4J_URI = "bolt://localhost:7687"
-NEO4J_USER = "neo4j"
+try:
+    from .embedding_encoder import DEFAULT_BATCH_SIZE, encode_stream
+    from .runtime import get_driver, get_embedding_cache
+except ImportError:
+    from embedding_encoder import DEFAULT_BATCH_SIZE, encode_stream
+    from runtime import get_driver, get_embedding_cache
 
-password_input = getpass.getpass("Enter Neo4j password: ").strip()
-NEO4J_PASSWORD = password_input if password_input else "66666666"
-
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
-
-# Explicit embedding model setup
-model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
+# Explicit embedding model setup (the driver, model and embedding cache are created on first use by `runtime`)
+MODEL_NAME = 'sentence-transformers/all-mpnet-base-v2'
 
 def fetch_nodes(tx):
     query = """
     MATCH (n)
     WHERE n.name IS NOT NULL
-    RETURN n.name AS label,
+    RETURN elementId(n) AS id,
+           n.name AS label,
            labels(n)[0] AS group,
-           coalesce(n.category, "Uncategorized") AS category
+           coalesce(n.category, "Uncategorized") AS category,
+           n.embedding_hash AS embedding_hash,
+           n.embedding_model AS embedding_model
     """
-    return [{"label": rec["label"], "group": rec["group"], "category": rec["category"]}
+    return [{"id": rec["id"], "label": rec["label"], "group": rec["group"], "category": rec["category"],
+             "embedding_hash": rec["embedding_hash"], "embedding_model": rec["embedding_model"]}
             for rec in tx.run(query)]
 
+def embedding_text(node):
+    """Return the text that is embedded for a node explicitly."""
+    return f"{node['label']} ({node['group']}, {node['category']})"
+
+def text_hash(text):
+    """Return a stable content hash of an embedded text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
 def store_embeddings(tx, nodes):
-    for node in nodes:
-        tx.run("""
-            MATCH (n {name: $label})
-            SET n.embedding = $embedding
-        """, label=node["label"], embedding=node["embedding"])
+    """
+    Write one batch of embeddings back, matching nodes by element id (`embedding` as a float32 vector).
+
+    Neo4j only keeps the float list its vector indexes need; quantised copies
+    live in the local index and graph snapshots (see `local_vector_index`).
+    """
+    tx.run("""
+        UNWIND $rows AS row
+        MATCH (n)
+        WHERE elementId(n) = row.id
+        SET n.embedding = row.embedding,
+            n.embedding_hash = row.hash,
+            n.embedding_model = row.model
+    """, rows=[{"id": node["id"], "embedding": node["embedding"].tolist(), "hash": node["hash"], "model": MODEL_NAME}
+               for node in nodes]).consume()
+
+def generate_embeddings(incremental=False, batch_size=500, workers=0, encode_batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Generate embeddings for named nodes and store them in Neo4j.
+
+    Each node also records the hash of its embedded text (`label (group, category)`)
+    and the model id, so later incremental runs can skip unchanged nodes.
+
+    Cached vectors are written first; the remaining texts are encoded in
+    length-sorted batches (see `embedding_encoder.encode_stream`) and each
+    float32 batch is cached and written as soon as it arrives, so only
+    `batch_size` vectors are ever converted to Python lists at once.
+
+    Args:
+        incremental (bool): Only re-encode nodes whose text hash or model changed.
+        batch_size (int): Nodes written back per `UNWIND` round trip.
+        workers (int): Encoder processes (0 encodes in this process).
+        encode_batch_size (int): Texts per length-sorted encoding batch.
+
+    Returns:
+        dict: "nodes" written, "cached", "encoded" and the encoder's "texts_per_second"
+        (all zero when there is nothing to embed).
+    """
+    driver = get_driver()
 
-def generate_embeddings():
     # Fetch explicitly nodes from Neo4j
     with driver.session() as session:
         nodes = session.execute_read(fetch_nodes)
 
     if not nodes:
         print("⚠️ No nodes found explicitly in Neo4j.")
-        return
+        return {"nodes": 0, "cached": 0, "encoded": 0, "texts_per_second": 0.0}
 
-    texts = [f"{node['label']} ({node['group']}, {node['category']})" for node in nodes]
-    embeddings = model.encode(texts, normalize_embeddings=True)
+    for node in nodes:
+        node["text"] = embedding_text(node)
+        node["hash"] = text_hash(node["text"])
+
+    if incremental:
+        nodes = [node for node in nodes
+                 if node["embedding_hash"] != node["hash"] or node["embedding_model"] != MODEL_NAME]
+        if not nodes:
+            print("✅ Embeddings already up to date.")
+            return {"nodes": 0, "cached": 0, "encoded": 0, "texts_per_second": 0.0}
+
+    # Nodes sharing a text share one vector
+    nodes_by_text = {}
+    for node in nodes:
+        nodes_by_text.setdefault(node["text"], []).append(node)
+    texts = list(nodes_by_text)
 
-    for node, emb in zip(nodes, embeddings):
-        node["embedding"] = emb.tolist()
+    embedding_cache = get_embedding_cache(MODEL_NAME, normalize=True)
+    found = embedding_cache.lookup(texts)
+    missing = [text for text, vector in zip(texts, found) if vector is None]
+    embedding_cache.hits += len(texts) - len(missing)
+    embedding_cache.misses += len(missing)
+    encode_stats = {}
 
-    # Explicitly store embeddings back into Neo4j
     with driver.session() as session:
-        session.execute_write(store_embeddings, nodes)
-
-    print("✅ Embeddings explicitly generated and stored.")
-
-    driver.close()
+        pending = []
+
+        def write(text, vector, final=False):
+            if text is not None:
+                pending.extend({"id": node["id"], "hash": node["hash"], "embedding": vector}
+                               for node in nodes_by_text[text])
+            while len(pending) >= batch_size or (final and pending):
+                session.execute_write(store_embeddings, pending[:batch_size])
+                del pending[:batch_size]
+
+        # Reuse cached vectors and only run the transformer on unseen texts
+        for text, vector in zip(texts, found):
+            if vector is not None:
+                write(text, vector)
+
+        for positions, vectors in encode_stream(missing, MODEL_NAME, batch_size=encode_batch_size,
+                                                workers=workers, normalize=True, stats=encode_stats):
+            batch_texts = [missing[position] for position in positions]
+            embedding_cache.put_many(batch_texts, vectors, flush=False)
+            for text, vector in zip(batch_texts, vectors):
+                write(text, vector)
+        write(None, None, final=True)
+    embedding_cache.flush()
+
+    stats = {"nodes": len(nodes), "cached": len(texts) - len(missing), "encoded": len(missing),
+             "texts_per_second": encode_stats.get("texts_per_second", 0.0)}
+    print(f"✅ Embeddings explicitly generated and stored for {len(nodes)} nodes.")
+    if missing:
+        print(f"⏱️ Encoded {len(missing)} texts in {encode_stats['seconds']:.2f}s "
+              f"({stats['texts_per_second']:.1f} texts/sec, {workers or 1} process(es)); "
+              f"{stats['cached']} served from the embedding cache.")
+    return stats
 
 if __name__ == "__main__":
     generate_embeddings()
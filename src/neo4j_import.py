@@ -8,11 +8,329 @@ Author: Xiang Xie (xiang.xie@ncl.ac.uk)
 Date: 01/02/2025
 """
 
-import json
-from neo4j import GraphDatabase
+import time
 from pathlib import Path
 
-def import_air_quality_json_to_neo4j(json_filepath, uri, username, password):
+try:
+    from .kg_model import NODE_SPECS, PAIR_CATEGORIES, RELATION_SPECS, KnowledgeGraph, as_graph, merge_attribute
+except ImportError:
+    from kg_model import NODE_SPECS, PAIR_CATEGORIES, RELATION_SPECS, KnowledgeGraph, as_graph, merge_attribute
+
+def collect_node_rows(data):
+    """
+    Collect de-duplicated node rows per label for `UNWIND` batches.
+
+    Nodes are keyed by their name (description for street canyons) alone, the
+    identity the uniqueness constraints of `create_schema` enforce.
+
+    Args:
+        data (dict or KnowledgeGraph): Validated air quality JSON data.
+
+    Returns:
+        dict: Label -> list of rows shaped as {"key": str, "props": dict}.
+
+    Raises:
+        ValueError: If a name is listed under two categories of one group, which
+            would otherwise collapse silently into one node with the first category.
+    """
+    graph = as_graph(data)
+    rows = {}
+    for label, (category_key, _) in NODE_SPECS.items():
+        ambiguous = graph.ambiguous_entities(category_key)
+        if ambiguous:
+            name, categories = next(iter(ambiguous.items()))
+            raise ValueError(
+                f"'{name}' is listed under several {category_key} categories ({', '.join(categories)}). "
+                f"Bulk and sync imports key {label} nodes by name alone; keep one category or import "
+                f"with mode='merge', which keys nodes by name and category.")
+        rows[label] = [{"key": name, "props": {"category": category} if category is not None else {}}
+                       for name, category in graph.iter_entities(category_key)]
+    return rows
+
+# Relationship properties written from the JSON per relation category. Relations between
+# the same two nodes share one relationship, whose properties join their distinct values with "; "
+RELATION_PROPERTIES = {
+    "pollutant_source_relations": (),
+    "source_mitigation_relations": (),
+    "meteorological_dispersion_relations": ("range", "effect", "direction"),
+    "street_canyon_dispersion_relations": ("effect", "direction"),
+}
+
+def relation_properties(rel_category, relation):
+    """Return the relationship property values of one canonical relation (see `RELATION_PROPERTIES`)."""
+    values = {}
+    for name in RELATION_PROPERTIES[rel_category]:
+        value = relation["meteorological_factor"]["range"] if name == "range" else relation.get(name)
+        values[name] = value or ""
+    return values
+
+def collect_relation_rows(data):
+    """
+    Collect de-duplicated relationship rows per relation category for `UNWIND` batches.
+
+    Args:
+        data (dict or KnowledgeGraph): Validated air quality JSON data.
+
+    Returns:
+        dict: Relation category -> list of rows shaped as {"start": str, "end": str, "props": dict}.
+        Every property of the category is present in "props", as None when it has no value,
+        so `SET r += row.props` also removes values dropped from the JSON.
+    """
+    graph = as_graph(data)
+    rows = {}
+    for rel_category in RELATION_SPECS:
+        unique_rows = {}
+        for relation in graph.iter_relations(rel_category):
+            if rel_category in PAIR_CATEGORIES:
+                # Pair relations are stored in JSON order; the graph direction is the reverse
+                start, end = relation[1], relation[0]
+            elif rel_category == "meteorological_dispersion_relations":
+                start, end = relation["meteorological_factor"]["type"], relation["pollutant"]
+            else:
+                start, end = relation["street_canyon_description"], relation["pollutant"]
+            row = unique_rows.setdefault((start, end), {"start": start, "end": end, "props": {}})
+            for name, value in relation_properties(rel_category, relation).items():
+                row["props"][name] = merge_attribute(row["props"].get(name) or "", value)
+        for row in unique_rows.values():
+            row["props"] = {name: value or None for name, value in row["props"].items()}
+        rows[rel_category] = list(unique_rows.values())
+    return rows
+
+def node_merge_query(label):
+    """Return the parameterised `UNWIND` query merging one batch of nodes for a label."""
+    key = NODE_SPECS[label][1]
+    return f"""
+        UNWIND $rows AS row
+        MERGE (n:{label} {{{key}: row.key}})
+        SET n += row.props
+    """
+
+def relation_merge_query(rel_category, with_properties=False):
+    """
+    Return the parameterised `UNWIND` query merging one batch of relationships.
+
+    With `with_properties`, rows also carry a "props" dict that is set on the relationship.
+    """
+    start_label, rel_type, end_label = RELATION_SPECS[rel_category]
+    start_key = NODE_SPECS[start_label][1]
+    end_key = NODE_SPECS[end_label][1]
+    query = f"""
+        UNWIND $rows AS row
+        MATCH (a:{start_label} {{{start_key}: row.start}})
+        MATCH (b:{end_label} {{{end_key}: row.end}})
+        MERGE (a)-[r:{rel_type}]->(b)
+    """
+    if with_properties:
+        query += """    SET r += row.props
+    """
+    return query
+
+def create_schema(session):
+    """
+    Create the uniqueness constraints (and their backing indexes) used by the batched lookups.
+
+    Each label is unique on its key property alone (see `collect_node_rows`).
+    """
+    for label, (_, key) in NODE_SPECS.items():
+        session.run(f"""
+            CREATE CONSTRAINT {label.lower()}_{key}_unique IF NOT EXISTS
+            FOR (n:{label}) REQUIRE n.{key} IS UNIQUE
+        """).consume()
+
+def _write_batch(tx, query, rows):
+    tx.run(query, rows=rows).consume()
+
+def run_in_batches(session, query, rows, batch_size):
+    """
+    Send rows through an `UNWIND $rows` query, committing one transaction per batch.
+
+    Args:
+        session: Open Neo4j session.
+        query (str): Parameterised query expecting a `$rows` list.
+        rows (list): Rows to write.
+        batch_size (int): Maximum number of rows per round trip and transaction.
+
+    Returns:
+        int: Number of rows sent.
+    """
+    for start in range(0, len(rows), batch_size):
+        session.execute_write(_write_batch, query, rows[start:start + batch_size])
+    return len(rows)
+
+def node_delete_query(label):
+    """Return the parameterised `UNWIND` query detaching and deleting one batch of nodes."""
+    key = NODE_SPECS[label][1]
+    return f"""
+        UNWIND $rows AS row
+        MATCH (n:{label} {{{key}: row.key}})
+        DETACH DELETE n
+    """
+
+def relation_delete_query(rel_category):
+    """Return the parameterised `UNWIND` query deleting one batch of relationships."""
+    start_label, rel_type, end_label = RELATION_SPECS[rel_category]
+    start_key = NODE_SPECS[start_label][1]
+    end_key = NODE_SPECS[end_label][1]
+    return f"""
+        UNWIND $rows AS row
+        MATCH (a:{start_label} {{{start_key}: row.start}})-[r:{rel_type}]->(b:{end_label} {{{end_key}: row.end}})
+        DELETE r
+    """
+
+def fetch_graph_fingerprint(tx):
+    """
+    Read a compact fingerprint of the live graph: node keys and categories per
+    label, and the edges per relation category with their JSON-managed properties.
+
+    Returns:
+        dict: {"nodes": {label: {key: category}},
+               "relations": {rel_category: {(start, end): {property: value}}}}
+    """
+    nodes = {}
+    for label, (_, key) in NODE_SPECS.items():
+        result = tx.run(f"MATCH (n:{label}) RETURN n.{key} AS key, n.category AS category")
+        nodes[label] = {rec["key"]: rec["category"] for rec in result}
+
+    relations = {}
+    for rel_category, (start_label, rel_type, end_label) in RELATION_SPECS.items():
+        start_key = NODE_SPECS[start_label][1]
+        end_key = NODE_SPECS[end_label][1]
+        result = tx.run(f"""
+            MATCH (a:{start_label})-[r:{rel_type}]->(b:{end_label})
+            RETURN a.{start_key} AS start, b.{end_key} AS end, properties(r) AS props
+        """)
+        relations[rel_category] = {
+            (rec["start"], rec["end"]): {name: value for name, value in dict(rec["props"]).items()
+                                         if name in RELATION_PROPERTIES[rel_category]}
+            for rec in result}
+
+    return {"nodes": nodes, "relations": relations}
+
+def compute_delta(fingerprint, data):
+    """
+    Diff the JSON data against a graph fingerprint.
+
+    Args:
+        fingerprint (dict): Output of `fetch_graph_fingerprint`.
+        data (dict or KnowledgeGraph): Validated air quality JSON data.
+
+    Returns:
+        dict: Rows to apply, grouped as "nodes_upsert" and "nodes_remove" per label,
+        and "relations_add", "relations_update" and "relations_remove" per relation
+        category. Nodes whose category changed are upserted in place so their
+        relationships are kept; relationships whose properties changed are updated.
+    """
+    graph = as_graph(data)
+    delta = {"nodes_upsert": {}, "nodes_remove": {}, "relations_add": {}, "relations_update": {},
+             "relations_remove": {}}
+
+    for label, rows in collect_node_rows(graph).items():
+        live_nodes = fingerprint["nodes"].get(label, {})
+        wanted = {row["key"] for row in rows}
+        delta["nodes_upsert"][label] = [
+            row for row in rows
+            if row["key"] not in live_nodes or live_nodes[row["key"]] != row["props"].get("category")
+        ]
+        delta["nodes_remove"][label] = [{"key": key} for key in live_nodes if key not in wanted]
+
+    for rel_category, rows in collect_relation_rows(graph).items():
+        live_edges = fingerprint["relations"].get(rel_category, {})
+        wanted = {(row["start"], row["end"]) for row in rows}
+        delta["relations_add"][rel_category] = [
+            row for row in rows if (row["start"], row["end"]) not in live_edges
+        ]
+        delta["relations_update"][rel_category] = [
+            row for row in rows
+            if (row["start"], row["end"]) in live_edges and live_edges[row["start"], row["end"]] != {
+                name: value for name, value in row["props"].items() if value is not None}
+        ]
+        delta["relations_remove"][rel_category] = [
+            {"start": start, "end": end} for start, end in sorted(set(live_edges) - wanted)
+        ]
+
+    return delta
+
+def sync_graph(driver, data, batch_size=1000):
+    """
+    Apply only the difference between the JSON data and the live graph.
+
+    Relationships and nodes that are no longer in the JSON are removed first,
+    then new or re-categorised nodes and new relationships or relationships
+    whose properties changed are merged, all in batched `UNWIND` round trips.
+
+    Args:
+        driver: Neo4j driver (or any object exposing a compatible `session()`).
+        data (dict or KnowledgeGraph): Validated air quality JSON data.
+        batch_size (int): Maximum number of rows per round trip and transaction.
+
+    Returns:
+        dict: Counts of applied changes plus `seconds`.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer.")
+
+    started = time.perf_counter()
+    with driver.session() as session:
+        create_schema(session)
+        fingerprint = session.execute_read(fetch_graph_fingerprint)
+        delta = compute_delta(fingerprint, data)
+
+        stats = {"relationships_removed": 0, "nodes_removed": 0, "nodes_upserted": 0, "relationships_added": 0,
+                 "relationships_updated": 0}
+        for rel_category, rows in delta["relations_remove"].items():
+            stats["relationships_removed"] += run_in_batches(session, relation_delete_query(rel_category), rows, batch_size)
+        for label, rows in delta["nodes_remove"].items():
+            stats["nodes_removed"] += run_in_batches(session, node_delete_query(label), rows, batch_size)
+        for label, rows in delta["nodes_upsert"].items():
+            stats["nodes_upserted"] += run_in_batches(session, node_merge_query(label), rows, batch_size)
+        for rel_category, rows in delta["relations_add"].items():
+            query = relation_merge_query(rel_category, with_properties=True)
+            stats["relationships_added"] += run_in_batches(session, query, rows, batch_size)
+            stats["relationships_updated"] += run_in_batches(
+                session, query, delta["relations_update"][rel_category], batch_size)
+
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+def bulk_insert(driver, data, batch_size=1000):
+    """
+    Import JSON data in batched `UNWIND` round trips, nodes first and relationships second.
+
+    Args:
+        driver: Neo4j driver (or any object exposing a compatible `session()`).
+        data (dict or KnowledgeGraph): Validated air quality JSON data.
+        batch_size (int): Maximum number of rows per round trip and transaction.
+
+    Returns:
+        dict: Import statistics (`nodes`, `relationships`, `seconds`, `rows_per_second`).
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer.")
+
+    graph = as_graph(data)
+    started = time.perf_counter()
+    node_count = relation_count = 0
+    # Collected before connecting, so ambiguous node keys fail without touching the database
+    node_rows, relation_rows = collect_node_rows(graph), collect_relation_rows(graph)
+
+    with driver.session() as session:
+        create_schema(session)
+        for label, rows in node_rows.items():
+            node_count += run_in_batches(session, node_merge_query(label), rows, batch_size)
+        for rel_category, rows in relation_rows.items():
+            relation_count += run_in_batches(session, relation_merge_query(rel_category, with_properties=True),
+                                             rows, batch_size)
+
+    seconds = time.perf_counter() - started
+    total = node_count + relation_count
+    return {
+        "nodes": node_count,
+        "relationships": relation_count,
+        "seconds": seconds,
+        "rows_per_second": total / seconds if seconds > 0 else float("inf"),
+    }
+
+def import_air_quality_json_to_neo4j(json_filepath, uri, username, password, mode="merge", batch_size=1000):
     """
     Imports air quality JSON data into a local Neo4j database.
 
@@ -21,6 +339,17 @@ def import_air_quality_json_to_neo4j(json_filepath, uri, username, password):
         uri (str): Neo4j database URI (default local is "bolt://localhost:7687").
         username (str): Username for the Neo4j database (default is usually "neo4j").
         password (str): Password for the Neo4j database.
+        mode (str): "merge" runs one `MERGE` per entity and relation in a single
+            transaction, keying nodes by name (or description) and category, so a
+            name listed under two categories becomes two nodes; "bulk" creates
+            uniqueness constraints on the name (or description) alone first and sends
+            `UNWIND` batches per label and relationship type, committing each batch;
+            "sync" diffs the JSON against the live graph and applies only the
+            added, re-categorised and removed nodes and the added, changed and
+            removed relationships, keyed like "bulk". Both reject a name listed
+            under two categories and write the relationship properties of
+            `RELATION_PROPERTIES`.
+        batch_size (int): Rows per batch and transaction in "bulk" and "sync" modes.
 
     Requirements for local Neo4j setup:
     -----------------------------------
@@ -51,12 +380,35 @@ def import_air_quality_json_to_neo4j(json_filepath, uri, username, password):
     )
     ```
     """
-    # Connect to Neo4j explicitly
+    if mode not in ("merge", "bulk", "sync"):
+        raise ValueError(f"Unknown import mode: {mode!r} (expected 'merge', 'bulk' or 'sync').")
+
+    # Connect to Neo4j explicitly (the driver package is only imported when a database is used)
+    from neo4j import GraphDatabase
     driver = GraphDatabase.driver(uri, auth=(username, password))
 
-    # Load JSON data explicitly
-    with open(json_filepath, "r", encoding="utf-8") as file:
-        data = json.load(file)
+    # Load JSON data explicitly, parsing it once into the shared KG model
+    graph = KnowledgeGraph.load(json_filepath)
+
+    if mode == "bulk":
+        try:
+            stats = bulk_insert(driver, graph, batch_size=batch_size)
+        finally:
+            driver.close()
+        print(f"✅ Bulk import finished: {stats['nodes']} nodes and {stats['relationships']} relationships "
+              f"in {stats['seconds']:.2f}s ({stats['rows_per_second']:.0f} rows/sec).")
+        return stats
+
+    if mode == "sync":
+        try:
+            stats = sync_graph(driver, graph, batch_size=batch_size)
+        finally:
+            driver.close()
+        print(f"✅ Sync finished in {stats['seconds']:.2f}s: "
+              f"+{stats['nodes_upserted']} / -{stats['nodes_removed']} nodes, "
+              f"+{stats['relationships_added']} / ~{stats['relationships_updated']} / "
+              f"-{stats['relationships_removed']} relationships.")
+        return stats
 
     def insert_data(tx, data):
         # Create Pollutant nodes explicitly
@@ -126,7 +478,7 @@ def import_air_quality_json_to_neo4j(json_filepath, uri, username, password):
 
     # Execute the data insertion explicitly
     with driver.session() as session:
-        session.execute_write(insert_data, data)
+        session.execute_write(insert_data, graph.to_json())
 
     # Close the Neo4j connection explicitly
     driver.close()
@@ -18,74 +18,180 @@ Author: Xiang Xie (xiang.xie@ncl.ac.uk)
 Date: 23/01/2025
 """
 
-from langchain_community.llms import LlamaCpp
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.vectorstores.neo4j_vector import Neo4jVector
+from langchain.embeddings.base import Embeddings
 from langchain.graphs import Neo4jGraph
 from langchain.chains import RetrievalQA
-import getpass
-import os
+from langchain.schema import BaseRetriever, Document
+from typing import Any
+import time
 
-embeddings = HuggingFaceEmbeddings(model_name='sentence-transformers/all-mpnet-base-v2')
+try:
+    from .answer_cache import AnswerCache
+    from .graph_engine import Neo4jGraphBackend
+    from .graph_retriever import GraphRetriever
+    from .runtime import get_driver, get_embedding_cache, get_hf_embeddings, get_llm, neo4j_settings
+except ImportError:
+    from answer_cache import AnswerCache
+    from graph_engine import Neo4jGraphBackend
+    from graph_retriever import GraphRetriever
+    from runtime import get_driver, get_embedding_cache, get_hf_embeddings, get_llm, neo4j_settings
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain embeddings that look vectors up in the shared on-disk cache before encoding.
+
+    Without `base_embeddings`, the shared HuggingFace model for `model_name` is
+    loaded on the first cache miss; the cache itself is opened on first use.
+    """
+
+    def __init__(self, base_embeddings, model_name, normalize=False):
+        self.model_name = model_name
+        self.normalize = normalize
+        self._base_embeddings = base_embeddings
+
+    @property
+    def cache(self):
+        return get_embedding_cache(self.model_name, normalize=self.normalize)
+
+    @property
+    def base_embeddings(self):
+        if self._base_embeddings is None:
+            self._base_embeddings = get_hf_embeddings(self.model_name)
+        return self._base_embeddings
+
+    def embed_documents(self, texts):
+        return self.cache.encode(texts, self.base_embeddings.embed_documents).tolist()
+
+    def embed_query(self, text):
+        return self.cache.encode(
+            [text], lambda texts: [self.base_embeddings.embed_query(t) for t in texts])[0].tolist()
+
+class GraphContextRetriever(BaseRetriever):
+    """LangChain retriever returning one token-budgeted document of graph facts per question."""
+
+    graph_retriever: Any
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        retrieved = self.graph_retriever.retrieve(query)
+        return [Document(page_content=retrieved["context"],
+                         metadata={"hits": retrieved["hits"], "triples": retrieved["triples"],
+                                   "tokens": retrieved["tokens"]})]
+
+MODEL_NAME = 'sentence-transformers/all-mpnet-base-v2'
+# HuggingFaceEmbeddings does not normalise by default, so these vectors use their own cache namespace.
+# The model itself is only loaded on the first cache miss.
+embeddings = CachedEmbeddings(None, MODEL_NAME, normalize=False)
+
+# LLM context window explicitly split between packed graph context, the prompt and the answer
+N_CTX = 2048
+MAX_TOKENS = 512
+PROMPT_TOKENS = 256
+CONTEXT_TOKENS = N_CTX - MAX_TOKENS - PROMPT_TOKENS
 
 def setup_graph(password=None):
-    NEO4J_URI = "bolt://localhost:7687"
-    NEO4J_USER = "neo4j"
-    
-    if not password:
-        password_input = getpass.getpass("Enter Neo4j password explicitly (leave empty for default): ").strip()
-        password = password_input if password_input else "66666666"
-    
-    graph = Neo4jGraph(url=NEO4J_URI, username=NEO4J_USER, password=password)
+    """Connect LangChain to Neo4j with the shared runtime credentials (see `runtime.neo4j_settings`)."""
+    uri, user, password = neo4j_settings(password=password)
+    # Register the same credentials for the pooled driver the retriever uses
+    get_driver(uri, user, password)
+    graph = Neo4jGraph(url=uri, username=user, password=password)
     return graph
 
-def setup_llm(model_path="models/mistral-7b-instruct-v0.2.Q4_K_M.gguf"):
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"❌ Model file explicitly not found at: {model_path}")
-
-    llm = LlamaCpp(
-        model_path=model_path,
+def setup_llm(model_path="models/mistral-7b-instruct-v0.2.Q4_K_M.gguf", instance=0):
+    """Return the shared LlamaCpp model (loaded once per process and copy number)."""
+    return get_llm(
+        model_path,
+        instance=instance,
         temperature=0.1,
-        max_tokens=512,
-        n_ctx=2048,
+        max_tokens=MAX_TOKENS,
+        n_ctx=N_CTX,
         top_p=1
     )
-    return llm
-
-def setup_rag_pipeline(graph, llm):
-    vector_store = Neo4jVector.from_existing_graph(
-        graph=graph,
-        embedding=embeddings,
-        index_name="source_embeddings",
-        node_label="Source",
-        embedding_node_property="embedding",
-        text_node_properties=["name", "category"]
+
+def setup_rag_pipeline(graph, llm, backend=None, vector_index=None, hops=1, hits_per_label=3):
+    """
+    Build the QA chain over graph-aware retrieval.
+
+    Every node label is searched, the hits are expanded by `hops` relationships
+    in one batched traversal and the ranked facts are packed into the context
+    budget left by the prompt and answer.
+
+    Args:
+        graph (Neo4jGraph): LangChain Neo4j graph from `setup_graph`.
+        llm: LangChain LLM; its tokenizer measures the context budget.
+        backend (GraphEngine or Neo4jGraphBackend, optional): Graph to expand hits over.
+        vector_index (LocalVectorIndex, optional): Local index for the seed search.
+        hops (int): Neighbourhood expansion depth (1 or 2).
+        hits_per_label (int): Seed hits kept per node label.
+    """
+    if backend is None:
+        backend = Neo4jGraphBackend(get_driver())
+
+    retriever = GraphRetriever(
+        backend,
+        embed_queries=lambda texts: [embeddings.embed_query(text) for text in texts],
+        vector_index=vector_index,
+        hits_per_label=hits_per_label,
+        hops=hops,
+        max_tokens=CONTEXT_TOKENS,
+        count_tokens=llm.get_num_tokens,
     )
 
     qa_chain = RetrievalQA.from_chain_type(
         llm=llm,
-        retriever=vector_store.as_retriever(search_kwargs={"k": 5}),
+        retriever=GraphContextRetriever(graph_retriever=retriever),
         return_source_documents=True
     )
     return qa_chain
 
-def query_kg(qa_chain, question, source_shown=0):
-    result = qa_chain({"query": question})
-    answer = result["result"]
-    sources = result["source_documents"]
+def query_kg(qa_chain, question, source_shown=0, answer_cache=None):
+    """
+    Answer a question with the RAG chain, going through an answer cache when given.
+
+    The cache is checked on the normalised question first and then on its
+    embedding (only computed on an exact miss, and shared with the retriever
+    through the embedding cache), so repeated questions skip retrieval and generation.
+
+    Args:
+        qa_chain: Chain from `setup_rag_pipeline`.
+        question (str): Natural language question.
+        source_shown (int): 1 to print the retrieved context.
+        answer_cache (AnswerCache, optional): Cache of earlier answers.
+
+    Returns:
+        dict: {"answer", "sources", "cached"} where "sources" are the retrieved context texts.
+    """
+    start_time = time.perf_counter()
+    embed_question = lambda: embeddings.embed_query(question)
+
+    cached = answer_cache.get(question, embed_question) if answer_cache is not None else None
+    if cached is not None:
+        answer, sources = cached["answer"], cached["sources"]
+    else:
+        result = qa_chain({"query": question})
+        answer = result["result"]
+        sources = [doc.page_content for doc in result["source_documents"]]
+        if answer_cache is not None:
+            answer_cache.put(question, answer, sources, embed_question())
 
     print(f"\n🔍 Question explicitly asked: {question}\n")
     print("📖 Answer from local LLM:\n", answer)
-    
+    if cached is not None:
+        print(f"⚡ Served from answer cache ({cached['match']} match) in {time.perf_counter() - start_time:.3f}s")
+
     if source_shown == 1:
         print("\n📌 Explicitly retrieved sources from Neo4j:")
-        for doc in sources:
-            print(f"- {doc.page_content}")
+        for source in sources:
+            print(f"- {source}")
+
+    return {"answer": answer, "sources": sources, "cached": cached is not None}
 
 if __name__ == "__main__":
     graph = setup_graph()
     llm = setup_llm()  # You can explicitly specify the model_path here
     qa_chain = setup_rag_pipeline(graph, llm)
-    
+    # Answers are dropped whenever the graph or its embeddings change
+    answer_cache = AnswerCache(version_fn=Neo4jGraphBackend(get_driver()).fingerprint)
+
     sample_question = "What are effective measures to mitigate vehicle emissions?"
-    query_kg(qa_chain, sample_question)
+    query_kg(qa_chain, sample_question, answer_cache=answer_cache)
+    query_kg(qa_chain, sample_question, answer_cache=answer_cache)
@@ -1,36 +1,83 @@
 """
 Explicit Neo4j Similarity Search
 
-Performs semantic similarity search using embeddings stored explicitly in Neo4j.
+Performs semantic similarity search using embeddings stored explicitly in Neo4j,
+optionally fused with a BM25 search over entity names (see `hybrid_search`).
 
 Author: Xiang Xie (xiang.xie@ncl.ac.uk)
 Date: 02/03/2025
 """
 
-from neo4j import GraphDatabase
-from sentence_transformers import SentenceTransformer
-import getpass
+try:
+    from .hybrid_search import hybrid_search_many
+    from .local_vector_index import index_label
+    from .runtime import get_driver, get_embedding_cache, get_sentence_transformer
+except ImportError:
+    from hybrid_search import hybrid_search_many
+    from local_vector_index import index_label
+    from runtime import get_driver, get_embedding_cache, get_sentence_transformer
 
-NEO4J_URI = "bolt://localhost:7687"
-NEO4J_USER = "neo4j"
-password_input = getpass.getpass("Enter Neo4j password: ").strip()
-NEO4J_PASSWORD = password_input if password_input else "66666666"
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+# The driver, model and embedding cache are created on first use by `runtime`, not at import
+MODEL_NAME = 'sentence-transformers/all-mpnet-base-v2'
 
-model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
+def encode_queries(query_texts):
+    """Embed query texts through the shared embedding cache."""
+    return get_embedding_cache(MODEL_NAME, normalize=True).encode(
+        query_texts, lambda texts: get_sentence_transformer(MODEL_NAME).encode(texts, normalize_embeddings=True))
 
-def similarity_search(query_text: str, index_name: str, top_k: int = 5):
-    query_embedding = model.encode(query_text, normalize_embeddings=True).tolist()
+def _query_vector_index(session, index_name, top_k, embedding):
+    results = session.run(f"""
+    CALL db.index.vector.queryNodes('{index_name}', {top_k}, $embedding)
+    YIELD node, score
+    RETURN coalesce(node.name, node.description) AS name, node.category AS category, score
+    """, embedding=embedding)
 
-    with driver.session() as session:
-        results = session.run(f"""
-        CALL db.index.vector.queryNodes('{index_name}', {top_k}, $embedding)
-        YIELD node, score
-        RETURN node.name AS name, node.category AS category, score
-        """, embedding=query_embedding)
+    return [{"name": rec["name"], "category": rec["category"], "score": rec["score"]}
+            for rec in results]
 
-        return [{"name": rec["name"], "category": rec["category"], "score": rec["score"]}
-                for rec in results]
+def similarity_search(query_text: str, index_name: str, top_k: int = 5, vector_index=None, lexical_index=None):
+    """
+    Return the top-k nodes most similar to a query text.
+
+    Args:
+        query_text (str): Natural language query.
+        index_name (str): Neo4j vector index name (e.g. "source_embeddings").
+        top_k (int): Number of results.
+        vector_index (LocalVectorIndex or GraphEngine, optional): Answer from a local
+            in-process index instead of querying Neo4j.
+        lexical_index (LexicalIndex, optional): Fuse the vector results with BM25 results
+            over entity names; exact name or abbreviation queries skip the embedder.
+    """
+    return similarity_search_many([query_text], index_name, top_k, vector_index=vector_index,
+                                  lexical_index=lexical_index)[0]
+
+def similarity_search_many(query_texts, index_name: str, top_k: int = 5, vector_index=None, lexical_index=None):
+    """
+    Batched `similarity_search`: queries are embedded together and, with a local
+    index, scored in a single matrix-matrix product.
+
+    Returns:
+        list: One result list per query text.
+    """
+    if lexical_index is not None:
+        return hybrid_search_many(
+            query_texts, lexical_index,
+            lambda texts, candidates: similarity_search_many(texts, index_name, candidates, vector_index),
+            top_k=top_k, index_name=index_name)
+
+    # Both backends reject unknown index names the same way, before anything is embedded
+    index_label(index_name)
+    query_texts = list(query_texts)
+    if not query_texts:
+        return []
+    query_embeddings = encode_queries(query_texts)
+
+    if vector_index is not None:
+        return vector_index.search_many(query_embeddings, top_k=top_k, index_name=index_name)
+
+    with get_driver().session() as session:
+        return [_query_vector_index(session, index_name, top_k, embedding.tolist())
+                for embedding in query_embeddings]
 
 if __name__ == "__main__":
     query = "vehicle emissions"
@@ -41,5 +88,3 @@ if __name__ == "__main__":
     print("🔍 Explicitly retrieved similar nodes:")
     for record in results:
         print(f"- {record['name']} (Category: {record['category']}, Score: {record['score']:.3f})")
-
-    driver.close()
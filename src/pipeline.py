@@ -0,0 +1,541 @@
+"""
+Incremental Knowledge Graph Pipeline
+
+Runs the end-to-end flow (text extraction, JSON validation, merge into the
+baseline KG, Neo4j import and node embeddings) as a graph of stages. Each
+stage is fingerprinted from the content hashes of its input files, the
+outputs of the stages it depends on and its settings; fingerprints and output
+hashes are kept in a JSON manifest, and a stage only re-runs when its
+fingerprint changed or its outputs were removed or edited. Per-document
+stages that are stale at the same time run together across the existing
+process pools, and every stage's timing is reported.
+
+Adding one text file therefore extracts and validates only that document,
+then re-merges, syncs the Neo4j delta and embeds only the new nodes.
+
+Author: Xiang Xie (xiang.xie@ncl.ac.uk)
+Date: 17/10/2026
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from .extraction_cache import DEFAULT_CACHE_PATH, sha256_file
+    from .Json_validator import WARNING_RULES, compile_rules, iter_file_issues
+    from .kg_model import ENTITY_GROUPS, RELATION_GROUPS, KnowledgeGraph
+    from .merge_knowledge import load_json, merge_many, save_json
+except ImportError:
+    from extraction_cache import DEFAULT_CACHE_PATH, sha256_file
+    from Json_validator import WARNING_RULES, compile_rules, iter_file_issues
+    from kg_model import ENTITY_GROUPS, RELATION_GROUPS, KnowledgeGraph
+    from merge_knowledge import load_json, merge_many, save_json
+
+MANIFEST_VERSION = 1
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_TEXT_DIR = PROJECT_ROOT / "data" / "Example txt"
+DEFAULT_OUTPUT_DIR = PROJECT_ROOT / "data" / "output"
+DEFAULT_BASE_KG = PROJECT_ROOT / "data" / "baseline KG" / "Validated_air_quality_knowledge.json"
+DEFAULT_ONTOLOGY = PROJECT_ROOT / "ontology" / "urban_air_quality.yaml"
+DEFAULT_HINTS = PROJECT_ROOT / "src" / "prompt_hints.md"
+DEFAULT_MODEL = PROJECT_ROOT / "models" / "mistral-7b-instruct-v0.2.Q4_K_M.gguf"
+
+# How the merge treats an extraction whose validation report has errors: "warn" merges it
+# anyway, "drop" merges it without the offending entities and relations, "skip" leaves it out
+MERGE_GATES = ("warn", "drop", "skip")
+
+def _digest(value):
+    """Return the SHA-256 hex digest of JSON-serialisable data."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    Args:
+        name (str): Unique stage name (per-document stages are named "<step>:<document>").
+        action (callable, optional): Runs the stage; called without arguments. A returned
+            dict is kept as the stage's "result" and printed in the run summary.
+        inputs (iterable of Path): Files whose contents the stage depends on.
+        outputs (iterable of Path): Files the stage writes.
+        after (iterable of str): Stages that must finish first; their outputs count as inputs.
+        params (dict, optional): JSON-serialisable settings; changing them re-runs the stage.
+        batch (callable, optional): Runs several stale stages of one step at once, called with
+            their `item`s; stale stages sharing a `batch` function in the same wave run in one call.
+        item: Value passed to `batch` for this stage (e.g. the document path).
+    """
+
+    def __init__(self, name, action=None, inputs=(), outputs=(), after=(), params=None, batch=None, item=None):
+        if (action is None) == (batch is None):
+            raise ValueError(f"Stage '{name}' needs exactly one of action or batch.")
+        self.name = name
+        self.action = action
+        self.inputs = [Path(path) for path in inputs]
+        self.outputs = [Path(path) for path in outputs]
+        self.after = list(after)
+        self.params = params or {}
+        self.batch = batch
+        self.item = item
+
+    @property
+    def step(self):
+        return self.name.split(":", 1)[0]
+
+class Manifest:
+    """
+    JSON record of finished stages and of file content hashes.
+
+    File hashes are cached by size and modification time, so unchanged files
+    (including multi-gigabyte model files) are hashed only once.
+
+    Args:
+        path (str or Path): Manifest file (created on first save).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.files = {}
+        self.stages = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") == MANIFEST_VERSION:
+                self.files = data["files"]
+                self.stages = data["stages"]
+
+    def file_hash(self, path):
+        """Return the content hash of a file, or None when it does not exist."""
+        path = Path(path)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        key = str(path.resolve())
+        cached = self.files.get(key)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+        digest = sha256_file(path)
+        self.files[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+        return digest
+
+    def save(self):
+        """Write the manifest atomically."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files, "stages": self.stages}, file, indent=1)
+        os.replace(tmp_path, self.path)
+
+class Pipeline:
+    """
+    Stages run in dependency waves; within a wave, stale batched stages run one
+    call per batch function and the other stale stages run in parallel threads.
+
+    Args:
+        manifest_path (str or Path): Manifest of finished stages.
+        max_workers (int, optional): Threads for independent unbatched stages of one wave.
+    """
+
+    def __init__(self, manifest_path, max_workers=None):
+        self.manifest = Manifest(manifest_path)
+        self.max_workers = max_workers
+        self.stages = {}
+
+    def add(self, stage):
+        if stage.name in self.stages:
+            raise ValueError(f"Duplicate stage name: '{stage.name}'.")
+        self.stages[stage.name] = stage
+        return stage
+
+    def _selected(self, targets):
+        """Return the names of the target stages (by name or step) and everything they depend on."""
+        if targets is None:
+            return set(self.stages)
+        targets = set(targets)
+        selected = set()
+        pending = [name for name, stage in self.stages.items() if name in targets or stage.step in targets]
+        while pending:
+            name = pending.pop()
+            if name not in selected:
+                selected.add(name)
+                pending.extend(self.stages[name].after)
+        return selected
+
+    def waves(self, names=None):
+        """Group stage names into dependency levels (every stage after all of its dependencies)."""
+        names = set(self.stages) if names is None else set(names)
+        for name in names:
+            for dependency in self.stages[name].after:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage '{name}' depends on unknown stage '{dependency}'.")
+        levels, remaining = [], [name for name in self.stages if name in names]
+        placed = set()
+        while remaining:
+            level = [name for name in remaining if all(dep in placed for dep in self.stages[name].after)]
+            if not level:
+                raise ValueError(f"Dependency cycle among stages: {', '.join(remaining)}.")
+            levels.append(level)
+            placed.update(level)
+            remaining = [name for name in remaining if name not in placed]
+        return levels
+
+    def fingerprint(self, stage):
+        """Return the hash of everything a stage's result depends on."""
+        return _digest({
+            "params": stage.params,
+            "inputs": {str(path): self.manifest.file_hash(path) for path in stage.inputs},
+            "after": {name: self.manifest.stages.get(name, {}).get("output_fingerprint")
+                      for name in stage.after},
+        })
+
+    def _outputs(self, stage):
+        return {str(path): self.manifest.file_hash(path) for path in stage.outputs}
+
+    def is_current(self, stage, fingerprint):
+        """Whether a stage last finished with this fingerprint and its outputs are unchanged."""
+        entry = self.manifest.stages.get(stage.name)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return False
+        outputs = self._outputs(stage)
+        return None not in outputs.values() and outputs == entry["outputs"]
+
+    def _record(self, stage, fingerprint, seconds):
+        outputs = self._outputs(stage)
+        missing = [path for path, digest in outputs.items() if digest is None]
+        if missing:
+            raise RuntimeError(f"Stage '{stage.name}' did not write: {', '.join(missing)}.")
+        self.manifest.stages[stage.name] = {
+            "fingerprint": fingerprint,
+            "outputs": outputs,
+            # Stages without files pass their own fingerprint on, so dependants re-run after them
+            "output_fingerprint": _digest(outputs) if outputs else fingerprint,
+            "seconds": round(seconds, 3),
+            "finished": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    def run(self, targets=None, force=()):
+        """
+        Run every stale stage (or only `targets` and what they depend on).
+
+        Args:
+            targets (iterable of str, optional): Stage names or steps (e.g. "merge") to bring up to date.
+            force (iterable of str or True): Stage names or steps to re-run even when current (True: all).
+
+        Returns:
+            dict: "stages" (name -> {"status": "ran", "current", "failed" or "blocked", "seconds",
+            and the "result" of stages whose action returned a dict}),
+            "ran", "current", "failed" and "blocked" name lists, and the total "seconds".
+        """
+        started = time.perf_counter()
+        force = set(force) if force is not True else True
+        status = {}
+
+        for wave in self.waves(self._selected(targets)):
+            stale = []
+            for name in wave:
+                stage = self.stages[name]
+                if any(status[dep]["status"] in ("failed", "blocked") for dep in stage.after):
+                    status[name] = {"status": "blocked", "seconds": 0.0}
+                    continue
+                fingerprint = self.fingerprint(stage)
+                forced = force is True or name in force or stage.step in force
+                if not forced and self.is_current(stage, fingerprint):
+                    status[name] = {"status": "current", "seconds": 0.0}
+                else:
+                    stale.append((stage, fingerprint))
+
+            # One call per batch function, the remaining stages side by side
+            jobs = {}
+            for stage, fingerprint in stale:
+                key = stage.batch if stage.batch is not None else stage.name
+                jobs.setdefault(key, []).append((stage, fingerprint))
+            with ThreadPoolExecutor(max_workers=self.max_workers or max(1, len(jobs))) as executor:
+                futures = {executor.submit(self._run_job, members): members for members in jobs.values()}
+                for future, members in futures.items():
+                    seconds, error, result = future.result()
+                    unrecorded = []
+                    for stage, fingerprint in members:
+                        share = seconds / len(members)
+                        # Each member is judged on its own outputs, not on its batch mates'
+                        member_error = error
+                        if member_error is None:
+                            try:
+                                self._record(stage, fingerprint, share)
+                            except RuntimeError as record_error:
+                                member_error = record_error
+                                unrecorded.append(record_error)
+                        status[stage.name] = {"status": "ran" if member_error is None else "failed", "seconds": share}
+                        if isinstance(result, dict):
+                            status[stage.name]["result"] = result
+                    label = members[0][0].step if len(members) > 1 else members[0][0].name
+                    count = f" ({len(members)} stages)" if len(members) > 1 else ""
+                    if error is None:
+                        print(f"⏱️ {label}{count}: {seconds:.2f}s")
+                        for record_error in unrecorded:
+                            print(f"⚠️ {record_error}")
+                    else:
+                        print(f"⚠️ {label}{count} failed after {seconds:.2f}s: {error}")
+            self.manifest.save()
+
+        if targets is None:
+            for name in list(self.manifest.stages):
+                if name not in self.stages:
+                    del self.manifest.stages[name]
+            self.manifest.save()
+
+        summary = {"stages": status, "seconds": time.perf_counter() - started}
+        for state in ("ran", "current", "failed", "blocked"):
+            summary[state] = [name for name, entry in status.items() if entry["status"] == state]
+        print(f"{'✅' if not summary['failed'] else '🚨'} Pipeline finished in {summary['seconds']:.2f}s: "
+              f"{len(summary['ran'])} ran, {len(summary['current'])} up to date, "
+              f"{len(summary['failed'])} failed, {len(summary['blocked'])} blocked")
+        for name, entry in status.items():
+            if "result" in entry:
+                print(f"   {name}: " + ", ".join(f"{key} {value}" for key, value in entry["result"].items()))
+        return summary
+
+    @staticmethod
+    def _run_job(members):
+        """Run one stage or one batch of stages; returns (seconds, exception or None, action result)."""
+        started = time.perf_counter()
+        try:
+            first = members[0][0]
+            if first.batch is not None:
+                result = first.batch([stage.item for stage, _ in members])
+            else:
+                result = first.action()
+        except Exception as error:
+            return time.perf_counter() - started, error, None
+        return time.perf_counter() - started, None, result
+
+# Stage actions
+def extract_documents(text_paths, ontology_yaml_path, hints_file_path, output_dir, model_path, workers=1,
+                      cache_path=DEFAULT_CACHE_PATH):
+    """Extract the given text files into `<output_dir>/<stem>.json` (one model, or a pool of `workers`)."""
+    try:
+        from .extraction import extract_corpus, extract_corpus_pool
+        from .extraction_cache import ExtractionCache
+    except ImportError:
+        from extraction import extract_corpus, extract_corpus_pool
+        from extraction_cache import ExtractionCache
+
+    text_paths = [Path(path) for path in text_paths]
+    if workers > 1:
+        # The journal is keyed by document content, so an edited document is never skipped as already done
+        stats = extract_corpus_pool(text_paths, ontology_yaml_path, hints_file_path, output_dir, model_path,
+                                    workers=workers, cache_path=cache_path)
+        if stats.get("failed_chunks"):
+            raise RuntimeError(f"{stats['failed_chunks']} chunks failed; the journal keeps the finished ones.")
+    else:
+        extract_corpus(text_paths, ontology_yaml_path, hints_file_path, output_dir, model_path=model_path,
+                       cache=ExtractionCache(cache_path) if cache_path else None)
+
+def validation_report_path(report_dir, json_path):
+    return Path(report_dir) / f"{Path(json_path).stem}.json"
+
+def validate_documents(json_paths, ontology_yaml_path, report_dir, max_workers=None):
+    """
+    Validate extracted JSON files across a process pool, writing one report per file:
+    {"file", "valid", "errors", "warnings", "issues"}.
+    """
+    rules = compile_rules(ontology_yaml_path)
+    json_paths = [str(path) for path in json_paths]
+    Path(report_dir).mkdir(parents=True, exist_ok=True)
+    workers = min(len(json_paths), max_workers or os.cpu_count() or 1)
+    for filepath, issues in iter_file_issues(json_paths, rules, workers, chunksize=1):
+        for issue in issues:
+            issue["severity"] = "warning" if issue["rule"] in WARNING_RULES else "error"
+        errors = sum(issue["severity"] == "error" for issue in issues)
+        save_json(validation_report_path(report_dir, filepath),
+                  {"file": filepath, "valid": not errors, "errors": errors,
+                   "warnings": len(issues) - errors, "issues": issues})
+
+def drop_invalid_items(data, rules):
+    """
+    Remove what makes an extraction fail validation: malformed entries, entities
+    filed under categories the ontology does not permit, and relations whose
+    endpoints are not declared entities.
+
+    Args:
+        data (dict): Extraction JSON data.
+        rules (dict): Rules from `compile_rules`.
+
+    Returns:
+        tuple: (cleaned JSON data, dropped entity count, dropped relation count).
+    """
+    graph = KnowledgeGraph.from_json(data)
+    dropped_entities = sum(section in ENTITY_GROUPS for section, _ in graph.malformed)
+    dropped_relations = len(graph.malformed) - dropped_entities
+    cleaned = graph.to_json()
+    for group, permitted in rules["categories"].items():
+        for category in [category for category in cleaned[group] if category not in permitted]:
+            dropped_entities += len(cleaned[group].pop(category))
+
+    graph = KnowledgeGraph.from_json(cleaned)
+    for rel_category, groups in RELATION_GROUPS.items():
+        kept = [relation for relation, endpoints in zip(cleaned[rel_category], graph.relation_pairs(rel_category))
+                if all(graph.has_entity(group, name) for group, name in zip(groups, endpoints))]
+        dropped_relations += len(cleaned[rel_category]) - len(kept)
+        cleaned[rel_category] = kept
+    return cleaned, dropped_entities, dropped_relations
+
+def merge_validated(json_paths, report_dir, base_filepath, output_filepath, max_workers=None, gate="warn",
+                    ontology_yaml_path=DEFAULT_ONTOLOGY):
+    """
+    Merge the extracted files into the base KG, gating those whose validation report has errors.
+
+    Args:
+        json_paths (list of Path): Extracted JSON files.
+        report_dir (Path): Directory of the validation reports.
+        base_filepath, output_filepath (Path): Base KG and merged output.
+        max_workers (int, optional): Merge process pool size.
+        gate (str): One of `MERGE_GATES`.
+        ontology_yaml_path (Path): Permitted categories for the "drop" gate.
+
+    Returns:
+        dict: Counts of "merged" and "skipped" files, files merged "with_errors",
+        and "dropped_entities" and "dropped_relations".
+    """
+    if gate not in MERGE_GATES:
+        raise ValueError(f"Unknown merge gate: {gate!r} (expected one of {MERGE_GATES}).")
+    rules = compile_rules(ontology_yaml_path) if gate == "drop" else None
+    stats = {"merged": 0, "skipped": 0, "with_errors": 0, "dropped_entities": 0, "dropped_relations": 0}
+    datasets = []
+    for json_path in json_paths:
+        report_path = validation_report_path(report_dir, json_path)
+        report = load_json(report_path)
+        if report["valid"]:
+            datasets.append(json_path)
+        elif gate == "skip":
+            stats["skipped"] += 1
+            print(f"⚠️ Skipping {Path(json_path).name}: {report['errors']} validation errors (see {report_path})")
+            continue
+        elif gate == "drop":
+            data, dropped_entities, dropped_relations = drop_invalid_items(load_json(json_path), rules)
+            stats["dropped_entities"] += dropped_entities
+            stats["dropped_relations"] += dropped_relations
+            datasets.append(data)
+            print(f"⚠️ Merging {Path(json_path).name} without {dropped_entities} entities and "
+                  f"{dropped_relations} relations that failed validation (see {report_path})")
+        else:
+            stats["with_errors"] += 1
+            datasets.append(json_path)
+            print(f"⚠️ Merging {Path(json_path).name} despite {report['errors']} validation errors "
+                  f"(see {report_path})")
+        stats["merged"] += 1
+    merge_many(datasets, output_filepath, base_filepath=base_filepath, max_workers=max_workers)
+    return stats
+
+def import_graph(json_filepath, batch_size=1000):
+    """Sync Neo4j with a merged JSON file, writing only the difference."""
+    try:
+        from .neo4j_import import sync_graph
+        from .runtime import get_driver
+    except ImportError:
+        from neo4j_import import sync_graph
+        from runtime import get_driver
+
+    stats = sync_graph(get_driver(), KnowledgeGraph.load(json_filepath), batch_size=batch_size)
+    print(f"✅ Neo4j synced: {stats['nodes_upserted']} nodes upserted, {stats['relationships_added']} "
+          f"relationships added, {stats['nodes_removed']} nodes and {stats['relationships_removed']} "
+          f"relationships removed")
+
+def embed_graph(workers=0):
+    """Embed the nodes whose text or model changed since the last run; returns the embedding stats."""
+    try:
+        from .neo4j_embedding_pipeline import generate_embeddings
+    except ImportError:
+        from neo4j_embedding_pipeline import generate_embeddings
+
+    return generate_embeddings(incremental=True, workers=workers)
+
+def build_pipeline(text_dir=DEFAULT_TEXT_DIR, output_dir=DEFAULT_OUTPUT_DIR, base_filepath=DEFAULT_BASE_KG,
+                   ontology_yaml_path=DEFAULT_ONTOLOGY, hints_file_path=DEFAULT_HINTS, model_path=DEFAULT_MODEL,
+                   extract_workers=1, validate_workers=None, merge_workers=None, embed_workers=0,
+                   neo4j=True, manifest_path=None, merge_gate="warn"):
+    """
+    Build the extraction -> validation -> merge -> Neo4j import -> embedding pipeline.
+
+    Every `.txt` file in `text_dir` gets its own "extract:<stem>" and
+    "validate:<stem>" stages; "merge" folds the extractions (gated by `merge_gate`) into the
+    base KG, then "import" syncs Neo4j and "embed" embeds new or changed nodes.
+
+    Args:
+        text_dir (str or Path): Directory of input text files.
+        output_dir (str or Path): Receives `extracted/`, `validation/`, the merged JSON and the manifest.
+        base_filepath (str or Path): Validated baseline KG the extractions are merged into.
+        ontology_yaml_path, hints_file_path (str or Path): Extraction prompt and validation inputs.
+        model_path (str or Path): gguf extraction model.
+        extract_workers (int): Extraction processes (each loads the model).
+        validate_workers, merge_workers (int, optional): Process pool sizes (default: CPU count).
+        embed_workers (int): Embedding encoder processes (0 encodes in this process).
+        neo4j (bool): Include the Neo4j import and embedding stages.
+        manifest_path (str or Path, optional): Defaults to `<output_dir>/pipeline_manifest.json`.
+        merge_gate (str): How extractions with validation errors are merged (see `MERGE_GATES`).
+
+    Returns:
+        Pipeline: The pipeline, ready to `run`.
+    """
+    output_dir = Path(output_dir)
+    extracted_dir = output_dir / "extracted"
+    report_dir = output_dir / "validation"
+    merged_filepath = output_dir / "merged_air_quality_knowledge.json"
+    pipeline = Pipeline(manifest_path or output_dir / "pipeline_manifest.json")
+
+    def extract_batch(paths):
+        extract_documents(paths, ontology_yaml_path, hints_file_path, extracted_dir, model_path,
+                          workers=extract_workers)
+
+    def validate_batch(paths):
+        validate_documents(paths, ontology_yaml_path, report_dir, max_workers=validate_workers)
+
+    json_paths = []
+    for text_path in sorted(Path(text_dir).glob("*.txt")):
+        json_path = extracted_dir / f"{text_path.stem}.json"
+        json_paths.append(json_path)
+        pipeline.add(Stage(f"extract:{text_path.stem}", batch=extract_batch, item=text_path,
+                           inputs=[text_path, ontology_yaml_path, hints_file_path, model_path],
+                           outputs=[json_path]))
+        pipeline.add(Stage(f"validate:{text_path.stem}", batch=validate_batch, item=json_path,
+                           inputs=[ontology_yaml_path], outputs=[validation_report_path(report_dir, json_path)],
+                           after=[f"extract:{text_path.stem}"]))
+
+    pipeline.add(Stage("merge", lambda: merge_validated(json_paths, report_dir, base_filepath, merged_filepath,
+                                                        max_workers=merge_workers, gate=merge_gate,
+                                                        ontology_yaml_path=ontology_yaml_path),
+                       inputs=[base_filepath, ontology_yaml_path] + json_paths, outputs=[merged_filepath],
+                       params={"gate": merge_gate},
+                       after=[f"validate:{path.stem}" for path in json_paths]))
+    if neo4j:
+        pipeline.add(Stage("import", lambda: import_graph(merged_filepath), after=["merge"]))
+        pipeline.add(Stage("embed", lambda: embed_graph(workers=embed_workers), after=["import"]))
+    return pipeline
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the knowledge graph pipeline, re-running only stale stages.")
+    parser.add_argument("--text-dir", default=DEFAULT_TEXT_DIR, help="Directory of input .txt files.")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Directory for outputs and the manifest.")
+    parser.add_argument("--base", default=DEFAULT_BASE_KG, help="Validated baseline KG JSON.")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="gguf extraction model.")
+    parser.add_argument("--extract-workers", type=int, default=1, help="Extraction processes.")
+    parser.add_argument("--embed-workers", type=int, default=0, help="Embedding encoder processes.")
+    parser.add_argument("--no-neo4j", action="store_true", help="Stop after the merge.")
+    parser.add_argument("--merge-gate", choices=MERGE_GATES, default="warn",
+                        help="Merge extractions with validation errors anyway (warn), without the "
+                             "offending items (drop), or not at all (skip).")
+    parser.add_argument("--targets", nargs="*", help="Only bring these stages or steps up to date.")
+    parser.add_argument("--force", nargs="*", default=(), help="Re-run these stages or steps even if current.")
+    args = parser.parse_args()
+
+    summary = build_pipeline(args.text_dir, args.output_dir, args.base, model_path=args.model,
+                             extract_workers=args.extract_workers, embed_workers=args.embed_workers,
+                             neo4j=not args.no_neo4j, merge_gate=args.merge_gate).run(targets=args.targets,
+                                                                                      force=args.force)
+    sys.exit(1 if summary["failed"] else 0)
@@ -0,0 +1,372 @@
+"""
+Warm Local RAG Server
+
+Long-running asyncio service that keeps the embedder, graph connection and
+LLM loaded and answers questions over a JSON-lines TCP protocol. Concurrent
+questions are gathered into short batches for cache lookup, embedding and
+graph retrieval, and generation runs through a bounded queue served by one
+worker per loaded model, so load is shed by back-pressure instead of
+oversubscribing the CPU. `answer_many` gives offline evaluation runs the same
+batched path without a socket.
+
+Protocol (one JSON object per line, answered in completion order):
+    {"id": 1, "question": "..."}        -> {"id": 1, "answer": "...", "cached": false, "latency": 1.2, ...}
+    {"id": 2, "questions": ["...", ...]} -> {"id": 2, "answers": [...]}
+    {"id": 3, "stats": true}            -> {"id": 3, "stats": {...}}
+
+Author: Xiang Xie (xiang.xie@ncl.ac.uk)
+Date: 17/10/2026
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    from .answer_cache import normalise_question
+except ImportError:
+    from answer_cache import normalise_question
+
+# LangChain's default "stuff" prompt, so answers match the RetrievalQA chain
+PROMPT_TEMPLATE = """Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+{context}
+
+Question: {question}
+Helpful Answer:"""
+
+class RagService:
+    """
+    Batched retrieval and queued generation over warm models.
+
+    Cache lookups, embedding and retrieval for a batch run on one dedicated
+    thread (so the answer cache and embedder are never used concurrently);
+    each generator gets its own thread and takes prompts from a bounded queue.
+
+    Args:
+        retriever (GraphRetriever): Retriever with a warm embedder and graph backend.
+        generators (callable or list of callables): prompt -> answer text; one worker per
+            entry (pass several model instances to generate in parallel).
+        answer_cache (AnswerCache, optional): Cache consulted before retrieval.
+        max_batch (int): Maximum questions per retrieval batch.
+        batch_window (float): Seconds to wait for more questions before running a batch.
+        queue_size (int): Maximum prompts waiting for generation.
+        prompt_template (str): Template with {context} and {question} fields.
+        latency_window (int): Number of recent latencies kept for the percentiles.
+    """
+
+    def __init__(self, retriever, generators, answer_cache=None, max_batch=16, batch_window=0.01,
+                 queue_size=32, prompt_template=PROMPT_TEMPLATE, latency_window=10_000):
+        self.retriever = retriever
+        self.generators = list(generators) if isinstance(generators, (list, tuple)) else [generators]
+        self.answer_cache = answer_cache
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.queue_size = queue_size
+        self.prompt_template = prompt_template
+
+        self.latencies = deque(maxlen=latency_window)
+        self.batch_sizes = deque(maxlen=latency_window)
+        self.reset_stats()
+        self.started = None
+
+        self._questions = None
+        self._prompts = None
+        self._in_flight = {}
+        self._tasks = []
+        self._retrieval_executor = None
+        self._generation_executor = None
+
+    # Lifecycle
+    async def start(self):
+        """Start the batcher and generation workers on the running event loop."""
+        if self._tasks:
+            return
+        # Counters and the clock restart together, so throughput only covers this run
+        self.reset_stats()
+        self._questions = asyncio.Queue()
+        self._prompts = asyncio.Queue(maxsize=self.queue_size)
+        self._in_flight = {}
+        self._retrieval_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-retrieval")
+        self._generation_executor = ThreadPoolExecutor(max_workers=len(self.generators),
+                                                       thread_name_prefix="rag-generation")
+        self._tasks = [asyncio.create_task(self._batcher())]
+        self._tasks += [asyncio.create_task(self._generation_worker(generate)) for generate in self.generators]
+
+    async def stop(self):
+        """Cancel the workers and release their threads."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Nothing to release when the service was never started
+        for executor in (self._retrieval_executor, self._generation_executor):
+            if executor is not None:
+                executor.shutdown(wait=True)
+        self._retrieval_executor = self._generation_executor = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    # Public API
+    async def answer(self, question):
+        """
+        Answer one question. Identical (normalised) questions already in flight
+        share their answer instead of being retrieved and generated again.
+
+        Returns:
+            dict: {"question", "answer", "cached", "context_tokens", "latency"}.
+        """
+        await self.start()
+        start_time = time.perf_counter()
+        key = normalise_question(question)
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            await self._questions.put((question, future))
+        try:
+            result = await asyncio.shield(future)
+        except Exception:
+            self.failed += 1
+            raise
+        latency = time.perf_counter() - start_time
+        self.latencies.append(latency)
+        self.completed += 1
+        self.cached += result["cached"]
+        return dict(result, latency=latency)
+
+    async def answer_many(self, questions):
+        """Answer a batch of questions concurrently (they share retrieval batches), in input order."""
+        return await asyncio.gather(*(self.answer(question) for question in questions))
+
+    def reset_stats(self):
+        """Clear the counters, latency and batch windows, and restart the throughput clock."""
+        self.latencies.clear()
+        self.batch_sizes.clear()
+        self.completed = 0
+        self.cached = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    def stats(self):
+        """Return throughput and latency percentiles over the recent window."""
+        latencies = np.asarray(self.latencies, dtype=np.float64)
+        elapsed = time.perf_counter() - self.started if self.started is not None else 0.0
+        return {
+            "completed": self.completed,
+            "cached": self.cached,
+            "failed": self.failed,
+            "throughput_qps": self.completed / elapsed if elapsed > 0 else 0.0,
+            "latency_p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "latency_p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+            "mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else None,
+            "generation_queue": self._prompts.qsize() if self._prompts is not None else 0,
+        }
+
+    # Retrieval batching
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._questions.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._questions.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batch_sizes.append(len(batch))
+
+            questions = [question for question, _ in batch]
+            try:
+                prepared = await loop.run_in_executor(self._retrieval_executor, self._prepare_batch, questions)
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            for (question, future), (cached, payload, vector) in zip(batch, prepared):
+                if cached:
+                    future.set_result({"question": question, "answer": payload["answer"], "cached": True,
+                                       "context_tokens": 0})
+                else:
+                    # Blocks when the generation queue is full, which holds back further batches
+                    await self._prompts.put((question, payload, vector, future))
+
+    def _prepare_batch(self, questions):
+        """
+        Look a batch up in the answer cache and retrieve context for the misses (retrieval thread).
+
+        Returns:
+            list: (cached, cache entry or retrieved context, question vector) per question.
+        """
+        vectors = None
+
+        def question_vector(position):
+            nonlocal vectors
+            if vectors is None:
+                vectors = np.atleast_2d(np.asarray(self.retriever.embed_queries(questions), dtype=np.float32))
+            return vectors[position]
+
+        prepared = [None] * len(questions)
+        misses = []
+        for position, question in enumerate(questions):
+            entry = None
+            if self.answer_cache is not None:
+                entry = self.answer_cache.get(question, lambda position=position: question_vector(position))
+            if entry is not None:
+                prepared[position] = (True, entry, None)
+            else:
+                misses.append(position)
+
+        if misses:
+            miss_vectors = np.stack([question_vector(position) for position in misses])
+            retrieved = self.retriever.retrieve_many([questions[position] for position in misses], miss_vectors)
+            for position, context, vector in zip(misses, retrieved, miss_vectors):
+                prepared[position] = (False, context, vector)
+        return prepared
+
+    # Generation
+    async def _generation_worker(self, generate):
+        loop = asyncio.get_running_loop()
+        while True:
+            question, retrieved, vector, future = await self._prompts.get()
+            try:
+                prompt = self.prompt_template.format(context=retrieved["context"], question=question)
+                answer = (await loop.run_in_executor(self._generation_executor, generate, prompt)).strip()
+                if self.answer_cache is not None:
+                    await loop.run_in_executor(self._retrieval_executor, self.answer_cache.put,
+                                               question, answer, [retrieved["context"]], vector)
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+                continue
+            if not future.done():
+                future.set_result({"question": question, "answer": answer, "cached": False,
+                                   "context_tokens": retrieved["tokens"]})
+
+async def _handle_request(service, request):
+    if request.get("stats"):
+        return {"stats": service.stats()}
+    if "questions" in request:
+        return {"answers": await service.answer_many(request["questions"])}
+    if "question" in request:
+        return await service.answer(request["question"])
+    raise ValueError("Expected a 'question', 'questions' or 'stats' field.")
+
+async def serve(service, host="127.0.0.1", port=8765):
+    """
+    Serve a `RagService` over JSON lines on a TCP socket until cancelled.
+
+    Requests on one connection are handled concurrently and answered as they
+    complete; clients match responses by the echoed "id".
+    """
+    async def handle_connection(reader, writer):
+        write_lock = asyncio.Lock()
+        pending = set()
+
+        async def respond(line):
+            request = {}
+            try:
+                request = json.loads(line)
+                response = await _handle_request(service, request)
+            except Exception as error:
+                response = {"error": str(error)}
+            response["id"] = request.get("id") if isinstance(request, dict) else None
+            async with write_lock:
+                writer.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+                await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(respond(line))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            writer.close()
+
+    async with service:
+        server = await asyncio.start_server(handle_connection, host, port)
+        print(f"✅ Local RAG server listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+def answer_many(service, questions):
+    """Answer questions offline through a `RagService` (starts and stops its own event loop)."""
+    async def run():
+        async with service:
+            return await service.answer_many(questions)
+    return asyncio.run(run())
+
+def build_service(snapshot_path=None, model_path="models/mistral-7b-instruct-v0.2.Q4_K_M.gguf", llm_instances=1,
+                  hops=1, cache_entries=1024):
+    """
+    Load the embedder, graph backend and LLM(s) once and wrap them in a `RagService`.
+
+    Args:
+        snapshot_path (str, optional): Graph snapshot to serve in process instead of querying Neo4j.
+        model_path (str): GGUF model file.
+        llm_instances (int): Number of model copies generating in parallel.
+        hops (int): Neighbourhood expansion depth.
+        cache_entries (int): Answer cache size (0 disables the cache).
+    """
+    try:
+        from .answer_cache import AnswerCache
+        from .graph_engine import GraphEngine, Neo4jGraphBackend
+        from .graph_retriever import GraphRetriever
+        from . import neo4j_local_rag as rag
+        from .runtime import get_driver
+    except ImportError:
+        from answer_cache import AnswerCache
+        from graph_engine import GraphEngine, Neo4jGraphBackend
+        from graph_retriever import GraphRetriever
+        import neo4j_local_rag as rag
+        from runtime import get_driver
+
+    if snapshot_path:
+        backend = GraphEngine.from_snapshot(snapshot_path)
+    else:
+        backend = Neo4jGraphBackend(get_driver())
+
+    llms = [rag.setup_llm(model_path, instance=instance) for instance in range(llm_instances)]
+    retriever = GraphRetriever(
+        backend,
+        embed_queries=rag.embeddings.embed_documents,
+        hops=hops,
+        max_tokens=rag.CONTEXT_TOKENS,
+        count_tokens=llms[0].get_num_tokens,
+    )
+    answer_cache = AnswerCache(max_entries=cache_entries, version_fn=backend.fingerprint) if cache_entries else None
+    return RagService(retriever, [llm.invoke for llm in llms], answer_cache=answer_cache)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm local RAG server over the air quality KG.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--snapshot", help="Serve a graph snapshot in process instead of Neo4j.")
+    parser.add_argument("--model", default="models/mistral-7b-instruct-v0.2.Q4_K_M.gguf")
+    parser.add_argument("--llm-instances", type=int, default=1)
+    parser.add_argument("--hops", type=int, default=1)
+    args = parser.parse_args()
+
+    service = build_service(args.snapshot, args.model, args.llm_instances, args.hops)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        print(f"\n⏱️ {service.stats()}")
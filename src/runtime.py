@@ -0,0 +1,169 @@
+"""
+Shared Runtime Resources
+
+Lazily creates the heavy resources the pipeline modules share: Neo4j
+drivers, sentence-transformer and LangChain embedders, on-disk embedding
+caches, and LlamaCpp models.
+Nothing is loaded at import; each resource is built on first use, then reused
+by every module in the process (one pooled driver per URI and user, one
+model per name and settings) and closed at interpreter exit.
+
+Neo4j credentials are read from the environment (`NEO4J_URI`, `NEO4J_USER`,
+`NEO4J_PASSWORD`), then from a JSON config file (`$AQKG_CONFIG`, default
+~/.config/urban-air-quality-kg/config.json) with a "neo4j" section, and only
+then prompted for on an interactive terminal.
+
+Author: Xiang Xie (xiang.xie@ncl.ac.uk)
+Date: 17/10/2026
+"""
+
+import atexit
+import getpass
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+
+DEFAULT_NEO4J_URI = "bolt://localhost:7687"
+DEFAULT_NEO4J_USER = "neo4j"
+DEFAULT_NEO4J_PASSWORD = "66666666"
+
+DEFAULT_CONFIG_PATH = Path.home() / ".config" / "urban-air-quality-kg" / "config.json"
+
+_lock = threading.RLock()
+_drivers = {}
+_passwords = {}
+_sentence_transformers = {}
+_hf_embeddings = {}
+_embedding_caches = {}
+_llms = {}
+
+def load_config(path=None):
+    """Return the runtime config file as a dict ({} when it does not exist)."""
+    path = Path(path or os.environ.get("AQKG_CONFIG") or DEFAULT_CONFIG_PATH)
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def neo4j_address(uri=None, user=None):
+    """Resolve the Neo4j URI and user: arguments, then environment, then config file, then defaults."""
+    config = load_config().get("neo4j", {})
+    uri = uri or os.environ.get("NEO4J_URI") or config.get("uri") or DEFAULT_NEO4J_URI
+    user = user or os.environ.get("NEO4J_USER") or config.get("user") or DEFAULT_NEO4J_USER
+    return uri, user
+
+def neo4j_settings(uri=None, user=None, password=None, prompt=None):
+    """
+    Resolve Neo4j connection settings: arguments, then environment, then config file.
+
+    A missing password is prompted for once per URI and user when `prompt` is True
+    (default: only when stdin is a terminal); otherwise the project default is used.
+
+    Returns:
+        tuple: (uri, user, password).
+    """
+    uri, user = neo4j_address(uri, user)
+    password = password or os.environ.get("NEO4J_PASSWORD") or load_config().get("neo4j", {}).get("password")
+    if password:
+        return uri, user, password
+
+    with _lock:
+        if (uri, user) not in _passwords:
+            if prompt is None:
+                prompt = sys.stdin is not None and sys.stdin.isatty()
+            entered = ""
+            if prompt:
+                entered = getpass.getpass(f"Enter Neo4j password for {user}@{uri} (leave empty for default): ").strip()
+            _passwords[uri, user] = entered or DEFAULT_NEO4J_PASSWORD
+        return uri, user, _passwords[uri, user]
+
+def get_driver(uri=None, user=None, password=None):
+    """
+    Return the shared Neo4j driver for a URI and user, creating it on first use.
+
+    The driver keeps its own connection pool, so one instance per database is
+    shared by every module; it is closed by `shutdown`, not by callers. The
+    password is only resolved (or prompted for) when the driver is created.
+    """
+    with _lock:
+        address = neo4j_address(uri, user)
+        if address not in _drivers:
+            from neo4j import GraphDatabase
+            uri, user, password = neo4j_settings(*address, password)
+            _drivers[address] = GraphDatabase.driver(uri, auth=(user, password))
+        return _drivers[address]
+
+def get_sentence_transformer(model_name, device=None):
+    """Return the shared SentenceTransformer for a model name, loading it on first use."""
+    with _lock:
+        if (model_name, device) not in _sentence_transformers:
+            from sentence_transformers import SentenceTransformer
+            _sentence_transformers[model_name, device] = SentenceTransformer(model_name, device=device)
+        return _sentence_transformers[model_name, device]
+
+def get_hf_embeddings(model_name):
+    """Return the shared LangChain HuggingFaceEmbeddings for a model name, loading it on first use."""
+    with _lock:
+        if model_name not in _hf_embeddings:
+            from langchain.embeddings import HuggingFaceEmbeddings
+            _hf_embeddings[model_name] = HuggingFaceEmbeddings(model_name=model_name)
+        return _hf_embeddings[model_name]
+
+def get_embedding_cache(model_name, normalize=True):
+    """
+    Return the shared on-disk EmbeddingCache for a model and normalisation flag, opening it on first use.
+
+    Nothing is created or locked under the cache directory until a module actually embeds something.
+    """
+    with _lock:
+        if (model_name, normalize) not in _embedding_caches:
+            try:
+                from .embedding_cache import EmbeddingCache
+            except ImportError:
+                from embedding_cache import EmbeddingCache
+            _embedding_caches[model_name, normalize] = EmbeddingCache(model_name, normalize=normalize)
+        return _embedding_caches[model_name, normalize]
+
+def get_llm(model_path, instance=0, **llm_kwargs):
+    """
+    Return the shared LangChain LlamaCpp model for a path and settings, loading it on first use.
+
+    Args:
+        model_path (str): GGUF model file.
+        instance (int): Copy number; workers generating in parallel each take their own copy.
+        **llm_kwargs: LlamaCpp settings (n_ctx, max_tokens, temperature, ...).
+
+    Raises:
+        FileNotFoundError: If the model file does not exist.
+    """
+    key = (str(Path(model_path).resolve()), instance, tuple(sorted(llm_kwargs.items())))
+    with _lock:
+        if key not in _llms:
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(f"❌ Model file explicitly not found at: {model_path}")
+            from langchain_community.llms import LlamaCpp
+            _llms[key] = LlamaCpp(model_path=model_path, **llm_kwargs)
+        return _llms[key]
+
+def shutdown():
+    """Close every shared driver, flush the embedding caches and drop the cached models (registered to run at exit)."""
+    with _lock:
+        for cache in _embedding_caches.values():
+            try:
+                cache.flush()
+            except Exception:
+                pass
+        _embedding_caches.clear()
+        for driver in _drivers.values():
+            try:
+                driver.close()
+            except Exception:
+                pass
+        _drivers.clear()
+        _sentence_transformers.clear()
+        _hf_embeddings.clear()
+        _llms.clear()
+
+atexit.register(shutdown)
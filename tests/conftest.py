@@ -0,0 +1,30 @@
+"""
+Shared pytest setup: the modules in src/ import each other as top-level
+modules, so src/ is put on the import path, and the default caches point at
+a scratch directory.
+"""
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / "src"))
+
+# Keep default caches and config out of the real home directory
+_SCRATCH = Path(tempfile.mkdtemp(prefix="aqkg-tests-"))
+os.environ["AQKG_EMBEDDING_CACHE"] = str(_SCRATCH / "embeddings")
+os.environ["AQKG_EXTRACTION_CACHE"] = str(_SCRATCH / "extraction_cache.sqlite")
+os.environ["AQKG_CONFIG"] = str(_SCRATCH / "config.json")
+
+BASELINE_KG = REPO_ROOT / "data" / "baseline KG" / "Validated_air_quality_knowledge.json"
+
+@pytest.fixture(scope="session")
+def baseline():
+    """The validated baseline knowledge graph JSON."""
+    with open(BASELINE_KG, "r", encoding="utf-8") as file:
+        return json.load(file)
@@ -0,0 +1,87 @@
+"""
+Tests of the in-memory answer cache: exact and semantic lookups, expiry by
+age and by least-recent use, and clearing on a new graph version, all on an
+injected clock.
+"""
+
+import pytest
+
+from answer_cache import AnswerCache
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+def test_exact_lookup_ignores_case_spacing_and_punctuation(clock):
+    cache = AnswerCache(clock=clock)
+    cache.put("Which sources emit NOx?", "Road traffic", sources=["context"])
+
+    def embedding():
+        raise AssertionError("An exact hit must not embed the question")
+
+    hit = cache.get("  which sources   emit nox ", embedding)
+    assert hit == {"question": "Which sources emit NOx?", "answer": "Road traffic", "sources": ["context"],
+                   "match": "exact", "similarity": 1.0}
+    assert cache.get("Which sources emit PM10?") is None
+    assert cache.stats() == {"entries": 1, "exact_hits": 1, "semantic_hits": 0, "misses": 1}
+
+def test_semantic_lookup_uses_the_similarity_threshold(clock):
+    cache = AnswerCache(similarity_threshold=0.95, clock=clock)
+    cache.put("Which sources emit NOx?", "Road traffic", embedding=[1.0, 0.0])
+    cache.put("What disperses PM10?", "Wind", embedding=[0.0, 1.0])
+
+    hit = cache.get("What emits nitrogen oxides?", lambda: [0.99, 0.1])
+    assert hit["match"] == "semantic"
+    assert hit["answer"] == "Road traffic"
+    assert hit["similarity"] == pytest.approx(0.995, abs=1e-3)
+    assert cache.get("Unrelated question", [0.7, 0.7]) is None
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = AnswerCache(ttl=60.0, clock=clock)
+    cache.put("Which sources emit NOx?", "Road traffic", embedding=[1.0, 0.0])
+
+    clock.now = 60.0
+    assert cache.get("Which sources emit NOx?") is not None
+    clock.now = 61.0
+    assert cache.get("Which sources emit NOx?") is None
+    assert cache.get("What emits nitrogen oxides?", [1.0, 0.0]) is None
+    assert len(cache) == 0
+
+def test_least_recently_used_entry_is_evicted_with_its_vector(clock):
+    cache = AnswerCache(max_entries=2, clock=clock)
+    cache.put("alpha", "A", embedding=[1.0, 0.0, 0.0])
+    cache.put("beta", "B", embedding=[0.0, 1.0, 0.0])
+    cache.get("alpha")
+    cache.put("gamma", "C", embedding=[0.0, 0.0, 1.0])
+
+    assert cache.get("beta") is None
+    assert cache.get("something like beta", [0.0, 1.0, 0.0]) is None
+    assert cache.get("alpha")["answer"] == "A"
+    assert cache.get("something like gamma", [0.0, 0.0, 1.0])["answer"] == "C"
+
+def test_new_version_clears_the_cache_after_the_check_interval(clock):
+    versions = ["graph-1"]
+    calls = []
+
+    def version_fn():
+        calls.append(clock.now)
+        return versions[0]
+
+    cache = AnswerCache(version_fn=version_fn, check_interval=30.0, clock=clock)
+    cache.put("Which sources emit NOx?", "Road traffic")
+
+    versions[0] = "graph-2"
+    clock.now = 10.0
+    # Checked at most every 30 seconds, so the old answer is still served
+    assert cache.get("Which sources emit NOx?") is not None
+    clock.now = 31.0
+    assert cache.get("Which sources emit NOx?") is None
+    assert cache.version == "graph-2"
+    assert calls == [0.0, 31.0]
@@ -0,0 +1,83 @@
+"""
+Tests of the on-disk embedding cache shared by several cache objects (as by
+several processes) on one directory.
+"""
+
+import gc
+import json
+import os
+import subprocess
+import sys
+import weakref
+from pathlib import Path
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+def vectors(*values):
+    return np.array([[value, 1.0 - value] for value in values], dtype=np.float32)
+
+def test_caches_sharing_a_directory_never_reuse_each_others_slots(tmp_path):
+    first = EmbeddingCache("model", cache_dir=tmp_path)
+    second = EmbeddingCache("model", cache_dir=tmp_path)
+
+    first.put_many(["alpha"], vectors(0.1))
+    second.put_many(["beta"], vectors(0.2))
+
+    for cache in (first, second, EmbeddingCache("model", cache_dir=tmp_path)):
+        alpha, beta = cache.lookup(["alpha", "beta"])
+        np.testing.assert_array_equal(alpha, vectors(0.1)[0])
+        np.testing.assert_array_equal(beta, vectors(0.2)[0])
+
+def test_staged_vectors_are_visible_before_flush(tmp_path):
+    cache = EmbeddingCache("model", cache_dir=tmp_path)
+    cache.put_many(["alpha"], vectors(0.1), flush=False)
+
+    np.testing.assert_array_equal(cache.lookup(["alpha"])[0], vectors(0.1)[0])
+    assert EmbeddingCache("model", cache_dir=tmp_path).lookup(["alpha"]) == [None]
+
+    cache.flush()
+    np.testing.assert_array_equal(EmbeddingCache("model", cache_dir=tmp_path).lookup(["alpha"])[0],
+                                  vectors(0.1)[0])
+
+def test_lookups_refresh_recency_on_flush(tmp_path):
+    cache = EmbeddingCache("model", cache_dir=tmp_path, max_entries=2)
+    cache.put_many(["alpha", "beta"], vectors(0.1, 0.2))
+
+    # Reading alpha makes beta the least recently used entry, in the index too
+    cache.lookup(["alpha"])
+    cache.flush()
+    with open(cache.path / "index.json", "r", encoding="utf-8") as file:
+        assert len(json.load(file)["entries"]) == 2
+
+    other = EmbeddingCache("model", cache_dir=tmp_path, max_entries=2)
+    other.put_many(["gamma"], vectors(0.3))
+    assert [vector is not None for vector in other.lookup(["alpha", "beta", "gamma"])] == [True, False, True]
+
+def test_importing_search_modules_opens_no_cache(tmp_path):
+    env = {key: value for key, value in os.environ.items() if not key.startswith("AQKG_")}
+    env["HOME"] = str(tmp_path)
+    src = Path(__file__).resolve().parent.parent / "src"
+    subprocess.run([sys.executable, "-c", "import neo4j_similarity_search, neo4j_embedding_pipeline"],
+                   cwd=src, env=env, check=True)
+    assert not (tmp_path / ".cache").exists()
+
+def test_encode_flushes_in_batches(tmp_path):
+    cache = EmbeddingCache("model", cache_dir=tmp_path, flush_every=3)
+    encode = lambda texts: vectors(*[0.1] * len(texts))
+    cache.encode(["alpha", "beta"], encode)
+    assert not (cache.path / "index.json").exists()
+
+    cache.encode(["alpha", "gamma"], encode)
+    assert (cache.hits, cache.misses) == (1, 3)
+    other = EmbeddingCache("model", cache_dir=tmp_path)
+    assert all(vector is not None for vector in other.lookup(["alpha", "beta", "gamma"]))
+
+def test_open_caches_can_be_released(tmp_path):
+    cache = EmbeddingCache("model", cache_dir=tmp_path)
+    cache.put_many(["alpha"], vectors(0.1))
+    released = weakref.ref(cache)
+    del cache
+    gc.collect()
+    assert released() is None
@@ -0,0 +1,63 @@
+"""
+Tests of the streamed JSON object scanner that stops generation once the
+extraction object closes, and of the extraction journal.
+"""
+
+import json
+
+from extraction import JsonObjectScanner, compact_journal, read_journal, stream_json_object
+
+def feed_all(pieces):
+    scanner = JsonObjectScanner()
+    for piece in pieces:
+        json_text = scanner.feed(piece)
+        if json_text is not None:
+            return json_text
+    return None
+
+def test_object_closing_across_pieces():
+    data = {"Pollutant": {"Gas": ["NO2"]}, "note": 'a "quoted" } brace'}
+    text = json.dumps(data)
+    pieces = [text[index:index + 3] for index in range(0, len(text), 3)] + [" trailing text"]
+    assert json.loads(feed_all(pieces)) == data
+
+def test_braces_in_text_before_the_json_are_skipped():
+    pieces = ["Sure, here is the {extracted} ", "JSON: {", '"Source": {"Traffic": ["cars"]}', "} and more {"]
+    assert json.loads(feed_all(pieces)) == {"Source": {"Traffic": ["cars"]}}
+
+def test_unclosed_object_returns_none():
+    assert feed_all(['{"Source": {', '"Traffic": []']) is None
+
+def test_stream_stops_when_the_object_closes():
+    class FakeLlm:
+        def __call__(self, prompt, max_tokens, stream, grammar):
+            for piece in ["{", '"a"', ": 1", "}", "never read"]:
+                yield {"choices": [{"text": piece}]}
+
+    assert stream_json_object(FakeLlm(), [1, 2, 3]) == ('{"a": 1}', 4)
+
+def write_journal(path, records):
+    with open(path, "w", encoding="utf-8") as journal:
+        for record in records:
+            journal.write(json.dumps(record) + "\n")
+        journal.write('{"document": "b", "chunk"')  # cut short by an interruption
+
+def test_journal_drops_results_of_finished_documents(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    write_journal(path, [
+        {"document": "a", "chunks": 2},
+        {"document": "a", "chunk": 0, "result": {"Source": {}}},
+        {"document": "b", "chunks": 2},
+        {"document": "a", "chunk": 1, "result": {}},
+        {"document": "b", "chunk": 1, "result": {"Pollutant": {}}},
+        {"document": "a", "done": True, "output": "hash"},
+    ])
+    state = read_journal(path)
+    assert state["a"] == {"chunks": 2, "results": {}, "done": True, "output": "hash"}
+    assert state["b"]["results"] == {1: {"Pollutant": {}}}
+
+    compact_journal(path)
+    compacted = read_journal(path)
+    assert compacted["a"]["done"] and compacted["a"]["output"] == "hash"
+    assert compacted["b"] == state["b"]
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 3
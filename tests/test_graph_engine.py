@@ -0,0 +1,143 @@
+"""
+Tests of the in-process graph traversals (hop counts, k-hop neighbourhoods and
+seed expansion) over the baseline knowledge graph, of the graph-aware
+retriever built on them, and of the Cypher the Neo4j backend sends for k-hop.
+"""
+
+import numpy as np
+import pytest
+
+from graph_engine import GraphEngine, Neo4jGraphBackend
+from graph_retriever import GraphRetriever, approximate_tokens, pack_context
+
+NOX = "Nitrogen oxides (NOx)"
+
+@pytest.fixture(scope="module")
+def engine(baseline):
+    return GraphEngine.from_json(baseline)
+
+def reference_hops(engine, starts, k, rel_types=None):
+    """Plain breadth-first search over neighbour lists, for comparison with the vectorised one."""
+    rel_types = engine.rel_types if rel_types is None else rel_types
+    hops = {start: 0 for start in starts}
+    frontier = set(starts)
+    for hop in range(1, k + 1):
+        reached = {int(neighbour) for node in frontier for rel_type in rel_types for direction in ("out", "in")
+                   for neighbour in engine.neighbour_indexes(node, rel_type, direction)}
+        frontier = reached - set(hops)
+        hops.update((node, hop) for node in frontier)
+    return hops
+
+@pytest.mark.parametrize("rel_types", [None, ["EMITS"], ["MITIGATES", "AFFECTS_DISPERSION"]])
+def test_hop_counts_match_breadth_first_search(engine, rel_types):
+    starts = engine.nodes(NOX, "Pollutant") + engine.nodes("Buses", "Source")
+    hops = engine.hop_counts(starts, k=3, rel_types=rel_types)
+    expected = reference_hops(engine, starts, 3, rel_types)
+    assert {node: hop for node, hop in enumerate(hops.tolist()) if hop >= 0} == expected
+
+def test_k_hop_follows_the_requested_relationships(engine):
+    neighbourhood = engine.k_hop(NOX, k=2, rel_types=["EMITS"], label="Pollutant")
+    sources = {item["name"] for item in neighbourhood if item["hops"] == 1}
+    pollutants = {item["name"] for item in neighbourhood if item["hops"] == 2}
+
+    assert sources == set(engine.sources_emitting(NOX))
+    assert pollutants == {pollutant for source in sources for pollutant in engine.pollutants_emitted_by(source)} - {NOX}
+    assert NOX not in {item["name"] for item in neighbourhood}
+    assert neighbourhood == sorted(neighbourhood, key=lambda item: (item["hops"], item["label"], item["name"]))
+
+def test_expand_returns_relationships_within_k_hops_per_seed(engine):
+    seeds = [("Pollutant", NOX), ("Source", "Buses"), ("Pollutant", "Not in the graph")]
+    one_hop = engine.expand(seeds, k=1)
+
+    assert {triple["seed"] for triple in one_hop} == {0, 1}
+    assert all(triple["depth"] == 1 for triple in one_hop)
+    for triple in one_hop:
+        label, name = seeds[triple["seed"]]
+        assert (triple["start_label"], triple["start"]) == (label, name) or \
+               (triple["end_label"], triple["end"]) == (label, name)
+    emitted_by_buses = {triple["end"] for triple in one_hop if triple["seed"] == 1 and triple["rel_type"] == "EMITS"}
+    assert emitted_by_buses == set(engine.pollutants_emitted_by("Buses"))
+
+    two_hop = engine.expand(seeds[:1], k=2)
+    assert {triple["depth"] for triple in two_hop} == {1, 2}
+    first_hop = {name for triple in one_hop if triple["seed"] == 0 for name in (triple["start"], triple["end"])}
+    for triple in two_hop:
+        if triple["depth"] == 2:
+            assert triple["start"] in first_hop or triple["end"] in first_hop
+
+class FakeVectorIndex:
+    """Returns fixed hits per label, whatever the query vectors."""
+
+    def __init__(self, hits):
+        self.hits = hits
+
+    def search_many(self, query_vectors, top_k=5, label=None, index_name=None):
+        return [self.hits.get(label, [])[:top_k] for _ in query_vectors]
+
+def test_retrieve_many_packs_facts_about_the_hits(engine):
+    index = FakeVectorIndex({
+        "Pollutant": [{"name": NOX, "category": None, "score": 0.9}],
+        "Source": [{"name": "Buses", "category": None, "score": 0.6}],
+    })
+    retriever = GraphRetriever(engine, lambda texts: np.zeros((len(texts), 4)), vector_index=index, max_tokens=256)
+    first, second = retriever.retrieve_many(["Which sources emit NOx?", "What do buses emit?"])
+
+    assert first == second
+    assert [hit["name"] for hit in first["hits"]] == [NOX, "Buses"]
+    assert first["context"].startswith("Relevant entities:\n")
+    assert f"{NOX} is emitted by:" in first["context"]
+    assert 0 < first["tokens"] <= 256
+    assert all(NOX in (triple["start"], triple["end"]) or "Buses" in (triple["start"], triple["end"])
+               for triple in first["triples"])
+    assert retriever.retrieve_many([]) == []
+
+def test_pack_context_respects_the_token_budget():
+    hits = [{"name": NOX, "label": "Pollutant", "category": "Gas", "score": 1.0}]
+    triples = [{"start": source, "start_label": "Source", "rel_type": "EMITS", "end": NOX, "end_label": "Pollutant",
+                "depth": 1, "score": 0.9 - index / 100} for index, source in enumerate(["Buses", "Ships", "Cars"])]
+
+    context, _, _, tokens = pack_context(hits, triples, max_tokens=1000)
+    assert context.splitlines()[-1] == f"- {NOX} is emitted by: Buses; Ships; Cars"
+    assert tokens == sum(approximate_tokens(line) for line in [
+        "Relevant entities:\n", f"- {NOX} (Pollutant, Gas)\n", "Facts:\n",
+        f"- {NOX} is emitted by: Buses\n", "; Ships", "; Cars"])
+
+    budget = tokens - approximate_tokens("; Cars")
+    _, _, packed_triples, used = pack_context(hits, triples, max_tokens=budget)
+    assert [triple["start"] for triple in packed_triples] == ["Buses", "Ships"]
+    assert used <= budget
+
+class RecordingDriver:
+    """Records the k-hop query instead of running it."""
+
+    def __init__(self):
+        self.queries = []
+
+    def session(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute_read(self, work):
+        return work(self)
+
+    def run(self, query, **params):
+        self.queries.append((query, params))
+        return []
+
+def test_neo4j_k_hop_matches_start_nodes_by_label_and_key():
+    driver = RecordingDriver()
+    backend = Neo4jGraphBackend(driver)
+    backend.k_hop(NOX, k=2, label="Pollutant")
+    backend.k_hop("Deep canyon", k=1)
+    assert backend.k_hop(NOX, label="Unknown") == []
+
+    labelled, unlabelled = (query for query, _ in driver.queries)
+    assert "MATCH (n:Pollutant {name: $name})" in labelled
+    assert "UNION" not in labelled
+    assert "MATCH (n:StreetCanyon {description: $name})" in unlabelled
+    assert "coalesce(n." not in labelled + unlabelled
@@ -0,0 +1,52 @@
+"""
+Tests of the BM25 entity index, exact alias lookups and reciprocal rank
+fusion in hybrid_search, over the baseline knowledge graph.
+"""
+
+import pytest
+
+from hybrid_search import LexicalIndex, hybrid_search_many, reciprocal_rank_fusion
+
+@pytest.fixture(scope="module")
+def lexical_index(baseline):
+    return LexicalIndex.from_json(baseline)
+
+def hit(name, category="C"):
+    return {"name": name, "category": category, "score": 0.5}
+
+def test_bm25_ranks_the_closest_name_first(lexical_index):
+    results = lexical_index.search("nitrogen dioxide emissions", top_k=3)
+    assert results[0]["name"] == "Nitrogen dioxide (NO2)"
+    assert [result["score"] for result in results] == sorted((result["score"] for result in results), reverse=True)
+
+def test_bm25_respects_the_label_filter(lexical_index):
+    results = lexical_index.search("Which sources emit PM2.5?", top_k=5, label="Pollutant")
+    assert results[0]["name"] == "PM2.5"
+    assert all(lexical_index.labels[lexical_index.names.index(result["name"])] == "Pollutant" for result in results)
+
+def test_abbreviations_and_aliases_are_exact_hits(lexical_index):
+    assert [result["name"] for result in lexical_index.lookup("NOx")] == ["Nitrogen oxides (NOx)"]
+    assert [result["name"] for result in lexical_index.lookup("hgvs?")] == ["Heavy goods vehicles (HGVs, trucks)"]
+    assert lexical_index.lookup("NOx", label="Source") == []
+
+def test_fusion_prefers_results_ranked_by_both_lists():
+    fused = reciprocal_rank_fusion([[hit("a"), hit("b")], [hit("b"), hit("c")]], top_k=3)
+    assert [result["name"] for result in fused] == ["b", "a", "c"]
+    assert all(0.0 < result["score"] <= 1.0 for result in fused)
+    # First in every list is the top of the scale
+    assert reciprocal_rank_fusion([[hit("a")], [hit("a")]])[0]["score"] == pytest.approx(1.0)
+
+def test_exact_queries_skip_the_vector_search(lexical_index):
+    calls = []
+
+    def vector_search_many(texts, candidates):
+        calls.append(list(texts))
+        return [[hit("Urban traffic", "MobileSource")] for _ in texts]
+
+    exact, fused = hybrid_search_many(["NO2", "pollution from road vehicles"], lexical_index, vector_search_many,
+                                      top_k=3)
+
+    assert calls == [["pollution from road vehicles"]]
+    assert exact[0] == {"name": "Nitrogen dioxide (NO2)", "category": "GaseousPollutants", "score": 1.0}
+    assert all(result["score"] < 1.0 for result in exact[1:])
+    assert all(0.0 < result["score"] <= 1.0 for result in fused)
@@ -0,0 +1,33 @@
+"""
+Tests of corpus validation over directories that mix knowledge graph JSON
+with other JSON files.
+"""
+
+import json
+from pathlib import Path
+
+from Json_validator import validate_corpus
+
+ONTOLOGY = Path(__file__).resolve().parent.parent / "ontology" / "urban_air_quality.yaml"
+
+def test_directory_scan_skips_non_knowledge_graph_json(baseline, tmp_path):
+    (tmp_path / "kg").mkdir()
+    (tmp_path / "eval").mkdir()
+    with open(tmp_path / "kg" / "baseline.json", "w", encoding="utf-8") as file:
+        json.dump(baseline, file)
+    with open(tmp_path / "eval" / "queries.json", "w", encoding="utf-8") as file:
+        json.dump([{"question": "Which sources emit NOx?", "label": "Source", "relevant": []}], file)
+
+    summary = validate_corpus(tmp_path, ONTOLOGY, max_workers=1)
+    assert summary["files"] == 1
+    assert summary["skipped_files"] == 1
+    assert "structure" not in summary["by_rule"]
+
+def test_explicit_non_knowledge_graph_file_is_still_reported(tmp_path):
+    path = tmp_path / "queries.json"
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump([{"question": "Which sources emit NOx?"}], file)
+
+    summary = validate_corpus([path], ONTOLOGY, max_workers=1)
+    assert summary["invalid_files"] == 1
+    assert summary["by_rule"] == {"structure": 1}
@@ -0,0 +1,44 @@
+"""
+Tests of relation de-duplication in merge_data.
+"""
+
+import copy
+
+from merge_knowledge import merge_data
+
+def meteorological_keys(data):
+    return [(relation["meteorological_factor"]["type"], relation["meteorological_factor"]["range"],
+             relation["pollutant"]) for relation in data["meteorological_dispersion_relations"]]
+
+def test_meteorological_relations_keep_their_ranges(baseline):
+    merged = merge_data(copy.deepcopy(baseline), copy.deepcopy(baseline))
+
+    # Only exact duplicates collapse; relations differing only in range stay separate
+    assert sorted(meteorological_keys(merged)) == sorted(set(meteorological_keys(baseline)))
+
+def test_same_range_relations_merge_their_effects():
+    relation = {"meteorological_factor": {"type": "Wind speed", "range": "High"}, "pollutant": "PM10"}
+    base = {"meteorological_dispersion_relations": [{**relation, "effect": "Disperses"}]}
+    new = {"meteorological_dispersion_relations": [
+        {**relation, "effect": "Resuspends dust"},
+        {"meteorological_factor": {"type": "Wind speed", "range": "Low"}, "pollutant": "PM10"},
+    ]}
+
+    relations = merge_data(base, new)["meteorological_dispersion_relations"]
+
+    assert [(r["meteorological_factor"]["range"], r.get("effect")) for r in relations] == [
+        ("High", "Disperses; Resuspends dust"), ("Low", None)]
+
+def test_ranges_differing_in_case_or_whitespace_are_one_relation():
+    base = {"meteorological_dispersion_relations": [
+        {"meteorological_factor": {"type": "Wind speed", "range": "High  (> 5 m/s)"}, "pollutant": "PM10",
+         "effect": "Disperses"}]}
+    new = {"meteorological_dispersion_relations": [
+        {"meteorological_factor": {"type": "Wind speed", "range": " high (> 5 M/S) "}, "pollutant": "PM10",
+         "effect": "Resuspends dust"}]}
+
+    relations = merge_data(base, new)["meteorological_dispersion_relations"]
+
+    # The first spelling of the range is kept
+    assert [(r["meteorological_factor"]["range"], r["effect"]) for r in relations] == [
+        ("High  (> 5 m/s)", "Disperses; Resuspends dust")]
@@ -0,0 +1,208 @@
+"""
+Round-trip tests of the batched Neo4j import against a fake driver that
+records every query instead of talking to a database.
+"""
+
+import copy
+import math
+
+import pytest
+
+from graph_snapshot import GraphSnapshot, load_snapshot_into_neo4j
+from neo4j_import import (NODE_SPECS, RELATION_SPECS, bulk_insert, collect_node_rows, collect_relation_rows,
+                          compute_delta, fetch_graph_fingerprint, node_merge_query, relation_merge_query,
+                          run_in_batches, sync_graph)
+
+class FakeResult:
+    def consume(self):
+        return None
+
+class FakeTransaction:
+    def __init__(self, session):
+        self.session = session
+
+    def run(self, query, **params):
+        self.session.unwinds.append((query, params["rows"]))
+        return FakeResult()
+
+class FakeSession:
+    """Counts auto-commit `run` calls and `execute_write` transactions, recording each UNWIND batch."""
+
+    def __init__(self):
+        self.runs = []
+        self.writes = 0
+        self.unwinds = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def run(self, query, **params):
+        self.runs.append(query)
+        return FakeResult()
+
+    def execute_write(self, work, *args):
+        self.writes += 1
+        return work(FakeTransaction(self), *args)
+
+    def execute_read(self, work, *args):
+        # Sync tests read a preset fingerprint instead of a database
+        return self.fingerprint
+
+class FakeDriver:
+    def __init__(self, fingerprint=None):
+        self.sessions = []
+        self.fingerprint = fingerprint
+
+    def session(self):
+        session = FakeSession()
+        session.fingerprint = self.fingerprint
+        self.sessions.append(session)
+        return session
+
+def test_run_in_batches_sends_one_unwind_per_batch():
+    session = FakeSession()
+    rows = [{"key": str(number), "props": {}} for number in range(2500)]
+
+    sent = run_in_batches(session, node_merge_query("Pollutant"), rows, batch_size=1000)
+
+    assert sent == 2500
+    assert session.writes == 3
+    assert [len(batch) for _, batch in session.unwinds] == [1000, 1000, 500]
+    assert [row for _, batch in session.unwinds for row in batch] == rows
+
+def test_run_in_batches_without_rows_sends_nothing():
+    session = FakeSession()
+    assert run_in_batches(session, node_merge_query("Pollutant"), [], batch_size=10) == 0
+    assert session.writes == 0
+
+def test_bulk_insert_round_trip(baseline):
+    driver = FakeDriver()
+    batch_size = 40
+
+    stats = bulk_insert(driver, baseline, batch_size=batch_size)
+
+    assert len(driver.sessions) == 1
+    session = driver.sessions[0]
+    node_rows = collect_node_rows(baseline)
+    relation_rows = collect_relation_rows(baseline)
+
+    # One constraint per label, then nothing else outside write transactions
+    assert len(session.runs) == len(NODE_SPECS)
+    assert all("CREATE CONSTRAINT" in query for query in session.runs)
+
+    # One UNWIND transaction per batch of each label and relation category, in that order
+    expected = [(node_merge_query(label), rows[start:start + batch_size])
+                for label, rows in node_rows.items() for start in range(0, len(rows), batch_size)]
+    expected += [(relation_merge_query(rel_category, with_properties=True), rows[start:start + batch_size])
+                 for rel_category, rows in relation_rows.items() for start in range(0, len(rows), batch_size)]
+    assert session.unwinds == expected
+    assert session.writes == len(expected) == (
+        sum(math.ceil(len(rows) / batch_size) for rows in node_rows.values())
+        + sum(math.ceil(len(rows) / batch_size) for rows in relation_rows.values()))
+    assert all(query.lstrip().startswith("UNWIND $rows") for query, _ in session.unwinds)
+
+    assert stats["nodes"] == sum(map(len, node_rows.values()))
+    assert stats["relationships"] == sum(map(len, relation_rows.values()))
+    assert set(relation_rows) == set(RELATION_SPECS)
+
+def test_bulk_insert_rejects_empty_batches(baseline):
+    with pytest.raises(ValueError):
+        bulk_insert(FakeDriver(), baseline, batch_size=0)
+
+def test_snapshot_restore_writes_relationship_properties():
+    snapshot = GraphSnapshot.from_records(
+        nodes=[("s", "Source", {"name": "Urban traffic"}), ("p", "Pollutant", {"name": "PM2.5"})],
+        edges=[("s", "EMITS", "p", {"share": 0.4})])
+    driver = FakeDriver()
+
+    load_snapshot_into_neo4j(driver, snapshot)
+
+    query, rows = driver.sessions[0].unwinds[-1]
+    assert "SET r += row.props" in query
+    assert rows == [{"start": "Urban traffic", "end": "PM2.5", "props": {"share": 0.4}}]
+
+def fingerprint_of(data):
+    """The fingerprint a graph imported from `data` would have."""
+    return {
+        "nodes": {label: {row["key"]: row["props"].get("category") for row in rows}
+                  for label, rows in collect_node_rows(data).items()},
+        "relations": {rel_category: {(row["start"], row["end"]): {name: value for name, value in row["props"].items()
+                                                                   if value is not None}
+                                     for row in rows}
+                      for rel_category, rows in collect_relation_rows(data).items()},
+    }
+
+def edited_baseline(baseline):
+    """The baseline with a new pollutant, a removed mitigation, PM2.5 re-categorised and one effect changed."""
+    data = copy.deepcopy(baseline)
+    data["pollutants"]["GaseousPollutants"].append("Test pollutant")
+    removed = data["mitigation_measures"]["PolicyBasedMeasure"].pop(0)
+    data["source_mitigation_relations"] = [pair for pair in data["source_mitigation_relations"] if pair[1] != removed]
+    for category, names in data["pollutants"].items():
+        if "PM2.5" in names and category != "TraceElements":
+            names.remove("PM2.5")
+            data["pollutants"]["TraceElements"].append("PM2.5")
+    data["street_canyon_dispersion_relations"][0]["effect"] = "Traps pollutants"
+    return data, removed
+
+def test_unchanged_graph_has_an_empty_delta(baseline):
+    delta = compute_delta(fingerprint_of(baseline), baseline)
+    assert not any(rows for group in delta.values() for rows in group.values())
+
+def test_delta_finds_added_removed_recategorised_and_changed_items(baseline):
+    data, removed = edited_baseline(baseline)
+    delta = compute_delta(fingerprint_of(baseline), data)
+
+    assert sorted((row["key"], row["props"]["category"]) for row in delta["nodes_upsert"]["Pollutant"]) == [
+        ("PM2.5", "TraceElements"), ("Test pollutant", "GaseousPollutants")]
+    assert delta["nodes_remove"]["MitigationMeasure"] == [{"key": removed}]
+    # MITIGATES runs from the mitigation to the source
+    assert {row["start"] for row in delta["relations_remove"]["source_mitigation_relations"]} == {removed}
+    assert delta["relations_update"]["street_canyon_dispersion_relations"] == [{
+        "start": "High aspect ratio (deep narrow streets)", "end": "PM2.5",
+        "props": {"effect": "Traps pollutants", "direction": None}}]
+    assert not any(delta["relations_add"].values())
+    assert not any(rows for label, rows in delta["nodes_upsert"].items() if label != "Pollutant")
+
+def test_sync_writes_only_the_delta(baseline):
+    data, removed = edited_baseline(baseline)
+    driver = FakeDriver(fingerprint_of(baseline))
+
+    stats = sync_graph(driver, data, batch_size=1000)
+
+    unwinds = driver.sessions[0].unwinds
+    assert stats["nodes_upserted"] == 2 and stats["nodes_removed"] == 1
+    assert stats["relationships_updated"] == 1 and stats["relationships_added"] == 0
+    assert stats["relationships_removed"] == sum(pair[1] == removed for pair in baseline["source_mitigation_relations"])
+    update_query, update_rows = next((query, rows) for query, rows in unwinds if "AFFECTS_DISPERSION" in query)
+    assert "SET r += row.props" in update_query
+    assert update_rows[0]["props"]["effect"] == "Traps pollutants"
+
+class FingerprintTransaction:
+    """Answers the fingerprint queries from fixed relationship records."""
+
+    def __init__(self, edges):
+        self.edges = edges
+
+    def run(self, query, **params):
+        if "[r:AFFECTS_DISPERSION]->(b:Pollutant)" in query and "MeteorologicalFactor" in query:
+            return self.edges
+        return []
+
+def test_fingerprint_keeps_only_json_managed_relationship_properties():
+    edges = [{"start": "Wind speed", "end": "PM10", "props": {"range": "High", "effect": "Disperses", "share": 0.3}}]
+    fingerprint = fetch_graph_fingerprint(FingerprintTransaction(edges))
+    assert fingerprint["relations"]["meteorological_dispersion_relations"] == {
+        ("Wind speed", "PM10"): {"range": "High", "effect": "Disperses"}}
+
+def test_bulk_import_rejects_a_name_under_two_categories(baseline):
+    data = copy.deepcopy(baseline)
+    data["pollutants"]["TraceElements"].append(data["pollutants"]["ParticulateMatter"][0])
+    driver = FakeDriver()
+
+    with pytest.raises(ValueError, match="mode='merge'"):
+        bulk_insert(driver, data)
+    assert not driver.sessions
@@ -0,0 +1,108 @@
+"""
+Tests of the stage orchestrator with dummy stages that write small files:
+stale, current, forced and blocked stages, batched stages, and the manifest
+carried over to a new run.
+"""
+
+from pipeline import Pipeline, Stage
+
+def write_stage(name, path, text="done", calls=None, **kwargs):
+    """A stage that writes `text` to `path`, counting its calls."""
+    def action():
+        if calls is not None:
+            calls.append(name)
+        path.write_text(text, encoding="utf-8")
+    return Stage(name, action=action, outputs=[path], **kwargs)
+
+def build(tmp_path, calls, text="source"):
+    source = tmp_path / "source.txt"
+    if not source.exists():
+        source.write_text(text, encoding="utf-8")
+    pipeline = Pipeline(tmp_path / "manifest.json", max_workers=1)
+    pipeline.add(write_stage("extract", tmp_path / "extract.txt", calls=calls, inputs=[source]))
+    pipeline.add(write_stage("merge", tmp_path / "merge.txt", calls=calls, after=["extract"]))
+    return pipeline
+
+def test_stale_stages_run_then_are_current(tmp_path):
+    calls = []
+    summary = build(tmp_path, calls).run()
+    assert summary["ran"] == ["extract", "merge"]
+    assert calls == ["extract", "merge"]
+
+    summary = build(tmp_path, calls).run()
+    assert summary["current"] == ["extract", "merge"]
+    assert calls == ["extract", "merge"]
+
+def test_changed_input_reruns_the_stage_and_dependants_only_if_its_output_changes(tmp_path):
+    calls = []
+    build(tmp_path, calls).run()
+    (tmp_path / "source.txt").write_text("changed source", encoding="utf-8")
+    # extract writes the same file again, so merge's inputs are unchanged
+    summary = build(tmp_path, calls).run()
+    assert summary["ran"] == ["extract"]
+    assert summary["current"] == ["merge"]
+
+    (tmp_path / "extract.txt").write_text("stale", encoding="utf-8")
+    (tmp_path / "source.txt").write_text("changed again", encoding="utf-8")
+    pipeline = Pipeline(tmp_path / "manifest.json", max_workers=1)
+    pipeline.add(write_stage("extract", tmp_path / "extract.txt", text="new extraction", inputs=[tmp_path / "source.txt"]))
+    pipeline.add(write_stage("merge", tmp_path / "merge.txt", after=["extract"]))
+    assert pipeline.run()["ran"] == ["extract", "merge"]
+
+def test_forced_stage_reruns_when_current(tmp_path):
+    calls = []
+    build(tmp_path, calls).run()
+    summary = build(tmp_path, calls).run(force=["merge"])
+    assert summary["current"] == ["extract"]
+    assert summary["ran"] == ["merge"]
+
+def test_failed_stage_blocks_its_dependants(tmp_path):
+    def fail():
+        raise OSError("disk full")
+
+    pipeline = Pipeline(tmp_path / "manifest.json", max_workers=1)
+    pipeline.add(Stage("extract", action=fail, outputs=[tmp_path / "extract.txt"]))
+    pipeline.add(write_stage("merge", tmp_path / "merge.txt", after=["extract"]))
+    pipeline.add(write_stage("report", tmp_path / "report.txt", after=["merge"]))
+    summary = pipeline.run()
+    assert summary["failed"] == ["extract"]
+    assert summary["blocked"] == ["merge", "report"]
+    assert not (tmp_path / "merge.txt").exists()
+
+def test_manifest_round_trip(tmp_path):
+    calls = []
+    build(tmp_path, calls).run()
+    pipeline = build(tmp_path, calls)
+    assert set(pipeline.manifest.stages) == {"extract", "merge"}
+    for name, stage in pipeline.stages.items():
+        assert pipeline.is_current(stage, pipeline.fingerprint(stage))
+
+    # An edited output makes its stage stale again
+    (tmp_path / "merge.txt").write_text("edited by hand", encoding="utf-8")
+    summary = build(tmp_path, calls).run()
+    assert summary["current"] == ["extract"]
+    assert summary["ran"] == ["merge"]
+
+def test_batch_member_that_writes_nothing_fails_alone(tmp_path):
+    calls = []
+
+    def batch(items):
+        calls.append(sorted(items))
+        for item in items:
+            if item != "a" or len(calls) > 1:
+                (tmp_path / f"{item}.txt").write_text(item, encoding="utf-8")
+
+    def build_batch():
+        pipeline = Pipeline(tmp_path / "manifest.json", max_workers=1)
+        for item in ("a", "b", "c"):
+            pipeline.add(Stage(f"x:{item}", batch=batch, item=item, outputs=[tmp_path / f"{item}.txt"]))
+        return pipeline
+
+    summary = build_batch().run()
+    assert summary["failed"] == ["x:a"]
+    assert sorted(summary["ran"]) == ["x:b", "x:c"]
+
+    summary = build_batch().run()
+    assert summary["ran"] == ["x:a"]
+    assert sorted(summary["current"]) == ["x:b", "x:c"]
+    assert calls == [["a", "b", "c"], ["a"]]
@@ -0,0 +1,95 @@
+"""
+Tests of the batched RAG service with a fake retriever and generator:
+retrieval batching, sharing answers between identical questions in flight,
+and skipping retrieval and generation for cached answers.
+"""
+
+import asyncio
+import threading
+
+import numpy as np
+
+from answer_cache import AnswerCache
+from rag_server import RagService, answer_many
+
+class FakeRetriever:
+    """Embeds each question as a one-hot vector and records every retrieval batch."""
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.batches = []
+
+    def embed_queries(self, questions):
+        vectors = np.zeros((len(questions), 8), dtype=np.float32)
+        for row, question in enumerate(questions):
+            vectors[row, self.vocabulary.setdefault(question.lower().rstrip("?"), len(self.vocabulary)) % 8] = 1.0
+        return vectors
+
+    def retrieve_many(self, questions, query_vectors=None):
+        self.batches.append(list(questions))
+        return [{"context": f"Context for {question}", "tokens": 3} for question in questions]
+
+class FakeGenerator:
+    """Answers with the prompt's context line, after an optional gate opens."""
+
+    def __init__(self, gate=None):
+        self.prompts = []
+        self.gate = gate
+        self.lock = threading.Lock()
+
+    def __call__(self, prompt):
+        if self.gate is not None:
+            self.gate.wait(timeout=5)
+        with self.lock:
+            self.prompts.append(prompt)
+        return " " + prompt.split("\n\n")[1] + " "
+
+def test_stop_without_start_is_a_no_op():
+    service = RagService(FakeRetriever(), FakeGenerator())
+    asyncio.run(service.stop())
+
+def test_concurrent_questions_share_one_retrieval_batch():
+    retriever, generator = FakeRetriever(), FakeGenerator()
+    service = RagService(retriever, generator, batch_window=0.05)
+    questions = ["Which sources emit NOx?", "What disperses PM10?", "Which measures cut PM2.5?"]
+
+    results = answer_many(service, questions)
+
+    assert retriever.batches == [questions]
+    assert len(generator.prompts) == 3
+    assert [result["answer"] for result in results] == [f"Context for {question}" for question in questions]
+    assert not any(result["cached"] for result in results)
+    assert service.stats()["mean_batch_size"] == 3
+
+def test_identical_questions_in_flight_are_answered_once():
+    gate = threading.Event()
+    retriever, generator = FakeRetriever(), FakeGenerator(gate)
+    service = RagService(retriever, generator, batch_window=0.05)
+
+    async def run():
+        async with service:
+            first = asyncio.create_task(service.answer("Which sources emit NOx?"))
+            await asyncio.sleep(0.1)
+            # Asked again while the first is still generating
+            second = asyncio.create_task(service.answer("which sources emit nox"))
+            await asyncio.sleep(0.05)
+            gate.set()
+            return await asyncio.gather(first, second)
+
+    first, second = asyncio.run(run())
+    assert first["answer"] == second["answer"] == "Context for Which sources emit NOx?"
+    assert retriever.batches == [["Which sources emit NOx?"]]
+    assert len(generator.prompts) == 1
+
+def test_cached_answers_skip_retrieval_and_generation():
+    retriever, generator = FakeRetriever(), FakeGenerator()
+    service = RagService(retriever, generator, answer_cache=AnswerCache(), batch_window=0.01)
+
+    answer_many(service, ["Which sources emit NOx?"])
+    results = answer_many(service, ["Which sources emit NOx?", "which sources emit nox!", "What disperses PM10?"])
+
+    assert [result["cached"] for result in results] == [True, True, False]
+    assert results[0]["answer"] == "Context for Which sources emit NOx?"
+    assert retriever.batches == [["Which sources emit NOx?"], ["What disperses PM10?"]]
+    assert len(generator.prompts) == 2
+    assert service.stats()["cached"] == 2
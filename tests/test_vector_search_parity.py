@@ -0,0 +1,112 @@
+"""
+Parity checks between the two vector search paths: Neo4j's
+`db.index.vector.queryNodes` (via `neo4j_similarity_search`) and the
+in-process `LocalVectorIndex`. The offline checks run against a fake session
+that scores nodes the way a cosine vector index does; the live check compares
+both paths on a real database and is skipped unless `NEO4J_URI` is set.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from local_vector_index import INDEX_LABELS, LocalVectorIndex, export_vector_index, write_vector_index
+from neo4j_similarity_search import _query_vector_index, similarity_search_many
+
+class FakeVectorSession:
+    """Answers `queryNodes` calls by cosine scoring stored nodes, evaluating the RETURN clause's name expression."""
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def run(self, query, embedding):
+        index_name = query.split("queryNodes('", 1)[1].split("'", 1)[0]
+        top_k = int(query.split(f"'{index_name}', ", 1)[1].split(",", 1)[0])
+        query_vector = np.asarray(embedding, dtype=np.float32)
+        query_vector /= np.linalg.norm(query_vector)
+        candidates = []
+        for node in self.nodes:
+            if node["label"] != INDEX_LABELS[index_name]:
+                continue
+            vector = np.asarray(node["embedding"], dtype=np.float32)
+            score = float((1.0 + query_vector @ (vector / np.linalg.norm(vector))) / 2.0)
+            properties = node["properties"]
+            if "coalesce(node.name, node.description) AS name" in query:
+                name = properties.get("name") or properties.get("description")
+            else:
+                name = properties.get("name")
+            candidates.append({"name": name, "category": properties.get("category"), "score": score})
+        return sorted(candidates, key=lambda record: -record["score"])[:top_k]
+
+@pytest.fixture
+def nodes():
+    rng = np.random.default_rng(7)
+    nodes = []
+    for label in ("Pollutant", "Source", "StreetCanyon"):
+        for number in range(6):
+            properties = {"category": f"{label} group"}
+            # Street canyons carry a description instead of a name
+            properties["description" if label == "StreetCanyon" else "name"] = f"{label} {number}"
+            nodes.append({"label": label, "properties": properties, "embedding": rng.normal(size=8).tolist()})
+    return nodes
+
+@pytest.fixture
+def local_index(nodes, tmp_path):
+    write_vector_index(
+        tmp_path,
+        ids=[str(row) for row in range(len(nodes))],
+        names=[node["properties"].get("name") or node["properties"].get("description") for node in nodes],
+        categories=[node["properties"]["category"] for node in nodes],
+        labels=[node["label"] for node in nodes],
+        embeddings=[node["embedding"] for node in nodes],
+    )
+    return LocalVectorIndex.load(tmp_path)
+
+def assert_same_results(neo4j_results, local_results):
+    assert [result["name"] for result in neo4j_results] == [result["name"] for result in local_results]
+    for neo4j_result, local_result in zip(neo4j_results, local_results):
+        assert neo4j_result["category"] == local_result["category"]
+        assert neo4j_result["score"] == pytest.approx(local_result["score"], abs=1e-5)
+
+@pytest.mark.parametrize("index_name", ["pollutant_embeddings", "source_embeddings", "street_canyon_embeddings"])
+def test_neo4j_and_local_paths_agree(nodes, local_index, index_name):
+    session = FakeVectorSession(nodes)
+    queries = np.random.default_rng(11).normal(size=(4, 8)).astype(np.float32)
+    local_results = local_index.search_many(queries, top_k=3, index_name=index_name)
+    for query, local_result in zip(queries, local_results):
+        assert_same_results(_query_vector_index(session, index_name, 3, query.tolist()), local_result)
+
+def test_unknown_index_is_rejected_by_both_paths(local_index):
+    with pytest.raises(ValueError, match="pollutant_embeddings"):
+        local_index.search_many(np.ones((1, 8)), index_name="canyon_embeddings")
+    # Rejected before the query is embedded or Neo4j is contacted
+    with pytest.raises(ValueError, match="pollutant_embeddings"):
+        similarity_search_many(["street canyon"], "canyon_embeddings")
+
+@pytest.mark.skipif("NEO4J_URI" not in os.environ, reason="needs a Neo4j database (set NEO4J_URI)")
+def test_live_neo4j_matches_exported_index(tmp_path):
+    from runtime import get_driver
+
+    driver = get_driver()
+    try:
+        driver.verify_connectivity()
+    except Exception as error:
+        pytest.skip(f"Neo4j is unreachable: {error}")
+
+    local_index = LocalVectorIndex.load(export_vector_index(driver, tmp_path))
+    with driver.session() as session:
+        for index_name, label in INDEX_LABELS.items():
+            if label not in local_index.label_ranges:
+                continue
+            start, end = local_index.label_ranges[label]
+            queries = np.asarray(local_index.embeddings[start:min(end, start + 3)])
+            local_results = local_index.search_many(queries, top_k=5, index_name=index_name)
+            for query, local_result in zip(queries, local_results):
+                neo4j_result = _query_vector_index(session, index_name, 5, query.tolist())
+                # Vector indexes are approximate: compare the best hit and the scores of shared names
+                assert neo4j_result[0]["name"] == local_result[0]["name"]
+                local_scores = {result["name"]: result["score"] for result in local_result}
+                for result in neo4j_result:
+                    if result["name"] in local_scores:
+                        assert result["score"] == pytest.approx(local_scores[result["name"]], abs=1e-4)